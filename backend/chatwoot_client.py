@@ -1,12 +1,24 @@
 """
 Chatwoot Application API client: post messages (public reply or private note).
 Used by the webhook handler for RAG bot replies and copilot suggestions.
+
+HTTP clients are module-level and pooled (keep-alive), so a bot reply does not pay a TLS handshake per message.
+Creating a message is not idempotent, so only failures where Chatwoot certainly did not create it are retried
+(jittered exponential backoff): connection could not be established, 429, 503 with Retry-After.
+A Retry-After longer than CHATWOOT_RETRY_MAX_SLEEP is honoured by not retrying at all.
+Read timeouts, dropped connections and other 5xx may come after the message was stored — retrying them
+would post it twice. Concurrent requests per host are capped.
 """
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+import random
+import threading
+import time
 from typing import Any
+from urllib.parse import urlparse
 
 import httpx
 
@@ -15,12 +27,172 @@ logger = logging.getLogger(__name__)
 CHATWOOT_BASE_URL = (os.environ.get("CHATWOOT_BASE_URL") or "").rstrip("/")
 CHATWOOT_ACCOUNT_ID = os.environ.get("CHATWOOT_ACCOUNT_ID", "")
 CHATWOOT_API_ACCESS_TOKEN = (os.environ.get("CHATWOOT_API_ACCESS_TOKEN") or "").strip()
+CHATWOOT_HTTP_TIMEOUT = float(os.environ.get("CHATWOOT_HTTP_TIMEOUT", "30"))
+# Повторы при 429, 503 с Retry-After и ошибках установки соединения: до CHATWOOT_MAX_RETRIES раз, пауза ~ BACKOFF * 2^attempt с джиттером
+CHATWOOT_MAX_RETRIES = int(os.environ.get("CHATWOOT_MAX_RETRIES", "3"))
+CHATWOOT_RETRY_BACKOFF = float(os.environ.get("CHATWOOT_RETRY_BACKOFF", "0.5"))
+CHATWOOT_RETRY_MAX_SLEEP = float(os.environ.get("CHATWOOT_RETRY_MAX_SLEEP", "10"))
+# Одновременных запросов к одному хосту Chatwoot (и размер keep-alive пула)
+CHATWOOT_MAX_CONCURRENCY = int(os.environ.get("CHATWOOT_MAX_CONCURRENCY", "8"))
+
+# Запрос точно не дошёл до обработки: соединение не установлено или не получено из пула
+_RETRY_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_client: httpx.Client | None = None
+_async_client: httpx.AsyncClient | None = None
+_async_loop: asyncio.AbstractEventLoop | None = None
+_lock = threading.Lock()
+_host_limits: dict[str, threading.BoundedSemaphore] = {}
+_async_host_limits: dict[str, asyncio.Semaphore] = {}
+_closing_tasks: set[asyncio.Task[None]] = set()
 
 
 def is_configured() -> bool:
     return bool(CHATWOOT_BASE_URL and CHATWOOT_ACCOUNT_ID and CHATWOOT_API_ACCESS_TOKEN)
 
 
+def _limits() -> httpx.Limits:
+    n = max(1, CHATWOOT_MAX_CONCURRENCY)
+    return httpx.Limits(max_connections=n, max_keepalive_connections=n, keepalive_expiry=60.0)
+
+
+def _get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.Client(timeout=CHATWOOT_HTTP_TIMEOUT, limits=_limits())
+    return _client
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """AsyncClient привязан к event loop — пересоздаём, если вызваны из другого цикла; прежний закрывается."""
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_loop is not loop:
+        old, old_loop = _async_client, _async_loop
+        _async_client = httpx.AsyncClient(timeout=CHATWOOT_HTTP_TIMEOUT, limits=_limits())
+        _async_loop = loop
+        _async_host_limits.clear()
+        if old is not None:
+            _close_replaced_async_client(old, old_loop)
+    return _async_client
+
+
+async def _aclose_quietly(client: httpx.AsyncClient) -> None:
+    try:
+        await client.aclose()
+    except Exception as e:  # noqa: BLE001 — цикл клиента уже закрыт: сокеты освободит сборщик мусора
+        logger.debug("Chatwoot client: could not close replaced async client: %r", e)
+
+
+def _close_replaced_async_client(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop | None) -> None:
+    """
+    Закрыть AsyncClient прежнего event loop. Если тот цикл ещё работает (в другом потоке) — закрываем в нём,
+    иначе задачей в текущем цикле (ссылка хранится до завершения, чтобы задачу не собрал GC).
+    """
+    if loop is not None and loop.is_running() and not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(_aclose_quietly(client), loop)
+        return
+    task = asyncio.get_running_loop().create_task(_aclose_quietly(client))
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+def _host_limit(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _lock:
+        sem = _host_limits.get(host)
+        if sem is None:
+            sem = _host_limits[host] = threading.BoundedSemaphore(max(1, CHATWOOT_MAX_CONCURRENCY))
+    return sem
+
+
+def _async_host_limit(url: str) -> asyncio.Semaphore:
+    host = urlparse(url).netloc
+    sem = _async_host_limits.get(host)
+    if sem is None:
+        sem = _async_host_limits[host] = asyncio.Semaphore(max(1, CHATWOOT_MAX_CONCURRENCY))
+    return sem
+
+
+def close_clients() -> None:
+    """Закрыть синхронный пул; асинхронный только забывается (закрыть его можно лишь из его цикла — aclose_clients)."""
+    global _client, _async_client, _async_loop
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+    _async_client = None
+    _async_loop = None
+
+
+async def aclose_clients() -> None:
+    """Закрыть оба пула соединений (shutdown приложения, из его event loop)."""
+    global _async_client, _async_loop
+    client, loop = _async_client, _async_loop
+    _async_client = None
+    _async_loop = None
+    if client is not None and loop is asyncio.get_running_loop():
+        await client.aclose()
+    close_clients()
+
+
+def _should_retry(response: httpx.Response) -> bool:
+    """429 — запрос отклонён до обработки; 503 с Retry-After — сервер явно просит повторить позже."""
+    if response.status_code == 429:
+        return True
+    return response.status_code == 503 and "retry-after" in response.headers
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None) -> float | None:
+    """
+    Full jitter: random(0, BACKOFF * 2^attempt), не больше CHATWOOT_RETRY_MAX_SLEEP; Retry-After (секунды)
+    от 429/503 — нижняя граница. None — сервер просит ждать дольше CHATWOOT_RETRY_MAX_SLEEP: не повторяем,
+    более ранний повтор нарушил бы Retry-After и получил бы новый 429.
+    """
+    delay = min(random.uniform(0, CHATWOOT_RETRY_BACKOFF * (2 ** attempt)), CHATWOOT_RETRY_MAX_SLEEP)
+    if response is not None:
+        retry_after = response.headers.get("retry-after", "")
+        if retry_after.isdigit():
+            if float(retry_after) > CHATWOOT_RETRY_MAX_SLEEP:
+                return None
+            delay = max(delay, float(retry_after))
+    return delay
+
+
+def _message_request(conversation_id: int, content: str, private: bool) -> tuple[str, dict[str, Any], dict[str, str]]:
+    url = f"{CHATWOOT_BASE_URL}/api/v1/accounts/{CHATWOOT_ACCOUNT_ID}/conversations/{conversation_id}/messages"
+    payload: dict[str, Any] = {
+        "content": content,
+        "message_type": "outgoing",
+        "private": private,
+    }
+    headers = {
+        "api_access_token": CHATWOOT_API_ACCESS_TOKEN,
+        "Content-Type": "application/json",
+    }
+    return url, payload, headers
+
+
+def _handle_response(conversation_id: int, private: bool, r: httpx.Response, elapsed: float) -> dict[str, Any] | None:
+    if r.is_success:
+        logger.info(
+            "Chatwoot client: message posted conversation_id=%s private=%s post_sec=%.3f",
+            conversation_id,
+            private,
+            elapsed,
+        )
+        return r.json()
+    logger.error(
+        "Chatwoot client: post_message failed conversation_id=%s status=%s body=%s",
+        conversation_id,
+        r.status_code,
+        (r.text or "")[:500],
+    )
+    return None
+
+
 def post_message(
     conversation_id: int,
     content: str,
@@ -35,37 +207,97 @@ def post_message(
     if not is_configured():
         logger.warning("Chatwoot client: not configured, cannot post message")
         return None
-    url = f"{CHATWOOT_BASE_URL}/api/v1/accounts/{CHATWOOT_ACCOUNT_ID}/conversations/{conversation_id}/messages"
-    payload: dict[str, Any] = {
-        "content": content,
-        "message_type": "outgoing",
-        "private": private,
-    }
-    with httpx.Client(timeout=30.0) as client:
+    url, payload, headers = _message_request(conversation_id, content, private)
+    client = _get_client()
+    t0 = time.perf_counter()
+    attempt = 0
+    while True:
+        response: httpx.Response | None = None
         try:
-            r = client.post(
-                url,
-                json=payload,
-                headers={
-                    "api_access_token": CHATWOOT_API_ACCESS_TOKEN,
-                    "Content-Type": "application/json",
-                },
-            )
-            r.raise_for_status()
-            logger.info(
-                "Chatwoot client: message posted conversation_id=%s private=%s",
-                conversation_id,
-                private,
-            )
-            return r.json()
-        except httpx.HTTPStatusError as e:
-            logger.error(
-                "Chatwoot client: post_message failed conversation_id=%s status=%s body=%s",
+            with _host_limit(url):
+                response = client.post(url, json=payload, headers=headers)
+            if not _should_retry(response) or attempt >= CHATWOOT_MAX_RETRIES:
+                return _handle_response(conversation_id, private, response, time.perf_counter() - t0)
+        except _RETRY_TRANSPORT_ERRORS as e:
+            if attempt >= CHATWOOT_MAX_RETRIES:
+                logger.error("Chatwoot client: post_message error conversation_id=%s %s", conversation_id, e)
+                return None
+        except httpx.TransportError as e:
+            # Запрос мог дойти: повтор рискует продублировать сообщение
+            logger.error("Chatwoot client: post_message error conversation_id=%s, not retried: %r", conversation_id, e)
+            return None
+        except Exception as e:
+            logger.exception("Chatwoot client: post_message error conversation_id=%s %s", conversation_id, e)
+            return None
+        delay = _retry_delay(attempt, response)
+        if delay is None:
+            logger.warning(
+                "Chatwoot client: post_message not retried conversation_id=%s: Retry-After %ss exceeds %.0fs",
                 conversation_id,
-                e.response.status_code,
-                (e.response.text or "")[:500],
+                response.headers["retry-after"],
+                CHATWOOT_RETRY_MAX_SLEEP,
             )
+            return _handle_response(conversation_id, private, response, time.perf_counter() - t0)
+        attempt += 1
+        logger.warning(
+            "Chatwoot client: retry %s/%s conversation_id=%s status=%s in %.2fs",
+            attempt,
+            CHATWOOT_MAX_RETRIES,
+            conversation_id,
+            response.status_code if response is not None else "error",
+            delay,
+        )
+        time.sleep(delay)
+
+
+async def apost_message(
+    conversation_id: int,
+    content: str,
+    *,
+    private: bool = False,
+) -> dict[str, Any] | None:
+    """Async variant of post_message (same retries and per-host limit) for use from the event loop."""
+    if not is_configured():
+        logger.warning("Chatwoot client: not configured, cannot post message")
+        return None
+    url, payload, headers = _message_request(conversation_id, content, private)
+    client = _get_async_client()
+    t0 = time.perf_counter()
+    attempt = 0
+    while True:
+        response: httpx.Response | None = None
+        try:
+            async with _async_host_limit(url):
+                response = await client.post(url, json=payload, headers=headers)
+            if not _should_retry(response) or attempt >= CHATWOOT_MAX_RETRIES:
+                return _handle_response(conversation_id, private, response, time.perf_counter() - t0)
+        except _RETRY_TRANSPORT_ERRORS as e:
+            if attempt >= CHATWOOT_MAX_RETRIES:
+                logger.error("Chatwoot client: apost_message error conversation_id=%s %s", conversation_id, e)
+                return None
+        except httpx.TransportError as e:
+            # Запрос мог дойти: повтор рискует продублировать сообщение
+            logger.error("Chatwoot client: apost_message error conversation_id=%s, not retried: %r", conversation_id, e)
             return None
-        except (httpx.HTTPError, Exception) as e:
-            logger.exception("Chatwoot client: post_message error conversation_id=%s %s", conversation_id, e)
+        except Exception as e:
+            logger.exception("Chatwoot client: apost_message error conversation_id=%s %s", conversation_id, e)
             return None
+        delay = _retry_delay(attempt, response)
+        if delay is None:
+            logger.warning(
+                "Chatwoot client: apost_message not retried conversation_id=%s: Retry-After %ss exceeds %.0fs",
+                conversation_id,
+                response.headers["retry-after"],
+                CHATWOOT_RETRY_MAX_SLEEP,
+            )
+            return _handle_response(conversation_id, private, response, time.perf_counter() - t0)
+        attempt += 1
+        logger.warning(
+            "Chatwoot client: retry %s/%s conversation_id=%s status=%s in %.2fs",
+            attempt,
+            CHATWOOT_MAX_RETRIES,
+            conversation_id,
+            response.status_code if response is not None else "error",
+            delay,
+        )
+        await asyncio.sleep(delay)
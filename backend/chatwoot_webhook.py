@@ -7,11 +7,15 @@ so any project can plug in its own AI backend (e.g. RAG+LLM, another API).
 """
 from __future__ import annotations
 
+import json
 import logging
 import os
+import queue
+from concurrent.futures import wait as _wait_futures
 import re
-import sys
+import threading
 import time as _time
+from pathlib import Path
 from typing import Any, Callable, Iterator
 
 # Chatwoot иногда присылает content с HTML (<p>текст</p>) — убираем теги перед RAG
@@ -29,13 +33,55 @@ _SKIP_PHRASES = frozenset(
     )
 )
 
-from fastapi import APIRouter, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
 
 from backend.chatwoot_client import is_configured, post_message
+from backend.idempotency import SeenSet
+from backend.job_queue import JobQueue
+from backend.pools import BulkheadFull, get_pool
+
+try:
+    import orjson
+
+    _json_loads: Callable[[bytes], Any] = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 logger = logging.getLogger(__name__)
 
+
+class _RateLimitedLog:
+    """
+    Не больше max_per_interval записей за interval секунд на ключ (тип события);
+    сколько подавлено — в поле suppressed следующей записи.
+    """
+
+    def __init__(self, log: logging.Logger, max_per_interval: int = 20, interval: float = 10.0) -> None:
+        self._log = log
+        self._max = max_per_interval
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._windows: dict[str, list[float | int]] = {}
+
+    def info(self, key: str, **fields: Any) -> None:
+        now = _time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault(key, [now, 0, 0])
+            if now - window[0] >= self._interval:
+                window[0], window[1] = now, 0
+            if window[1] >= self._max:
+                window[2] += 1
+                return
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+        if suppressed:
+            fields["suppressed"] = suppressed
+        self._log.info("%s %s", key, " ".join(f"{k}={v!r}" if isinstance(v, str) else f"{k}={v}" for k, v in fields.items()))
+
+
+_event_log = _RateLimitedLog(logger)
+
 SUPPORT_MODE_ATTR = os.environ.get("CHATWOOT_SUPPORT_MODE_ATTR", "support_mode")
 COPILOT_PREFIX = "[RAG suggestion – use or edit]\n\n"
 # Мгновенное сообщение в чат, пока AI готовит ответ (режим bot)
@@ -50,6 +96,30 @@ _stream_reply_provider: StreamReplyProvider | None = None
 
 # Стримить ответ бота блоками (true) или одним сообщением (false). При true placeholder не постится.
 STREAM_REPLY_ENABLED = os.environ.get("CHATWOOT_STREAM_REPLY", "").lower() in ("1", "true", "yes")
+# Сколько блоков стрима может ждать отправки в Chatwoot, прежде чем чтение LLM притормозит (backpressure)
+STREAM_POST_QUEUE_SIZE = int(os.environ.get("CHATWOOT_STREAM_POST_QUEUE_SIZE", "8"))
+
+# Очередь обработки webhook (SQLite): переживает рестарт контейнера, ограничена по глубине
+QUEUE_PATH = os.environ.get("CHATWOOT_QUEUE_PATH") or str(
+    Path(__file__).resolve().parent.parent / "data" / "chatwoot_queue.sqlite3"
+)
+QUEUE_WORKERS = int(os.environ.get("CHATWOOT_QUEUE_WORKERS", "4"))
+QUEUE_MAX_DEPTH = int(os.environ.get("CHATWOOT_QUEUE_MAX_DEPTH", "1000"))
+# Дольше — предупреждение в логе; задача не повторяется, пока обработчик не завершится (иначе дубли ответов)
+JOB_TIMEOUT_SEC = float(os.environ.get("CHATWOOT_JOB_TIMEOUT", "180"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("CHATWOOT_JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF_SEC = float(os.environ.get("CHATWOOT_JOB_RETRY_BACKOFF", "5"))
+# Placeholder в режиме bot постится, только если ответ не готов за столько секунд (0 — постить всегда)
+PLACEHOLDER_DELAY_SEC = float(os.environ.get("CHATWOOT_PLACEHOLDER_DELAY_SEC", "1.5"))
+# Окно склейки сообщений: несколько быстрых сообщений клиента в одном диалоге — один запрос и один ответ
+DEBOUNCE_SEC = float(os.environ.get("CHATWOOT_DEBOUNCE_SEC", "2"))
+# Дедупликация повторных доставок webhook по (account, conversation, message id)
+DEDUPE_TTL_SEC = float(os.environ.get("CHATWOOT_DEDUPE_TTL", "3600"))
+DEDUPE_MAX_SIZE = int(os.environ.get("CHATWOOT_DEDUPE_MAX_SIZE", "10000"))
+DEDUPE_PERSIST = os.environ.get("CHATWOOT_DEDUPE_PERSIST", "").lower() in ("1", "true", "yes")
+DEDUPE_PATH = os.environ.get("CHATWOOT_DEDUPE_PATH") or str(
+    Path(__file__).resolve().parent.parent / "data" / "chatwoot_seen.sqlite3"
+)
 
 
 def set_reply_provider(provider: ReplyProvider | None) -> None:
@@ -72,6 +142,40 @@ def get_stream_reply_provider() -> StreamReplyProvider | None:
     return _stream_reply_provider
 
 
+_job_queue: JobQueue | None = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Durable webhook queue; created and started at app startup (lifespan) or on first use."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                q = JobQueue(
+                    QUEUE_PATH,
+                    _run_job,
+                    workers=QUEUE_WORKERS,
+                    job_timeout=JOB_TIMEOUT_SEC,
+                    max_attempts=JOB_MAX_ATTEMPTS,
+                    retry_backoff=JOB_RETRY_BACKOFF_SEC,
+                    max_depth=QUEUE_MAX_DEPTH,
+                    name="chatwoot",
+                )
+                q.start()
+                _job_queue = q
+    return _job_queue
+
+
+def stop_job_queue(timeout: float = 5.0) -> None:
+    """Stop the queue workers (app shutdown); pending jobs stay in SQLite for the next start."""
+    global _job_queue
+    with _job_queue_lock:
+        q, _job_queue = _job_queue, None
+    if q is not None:
+        q.stop(timeout)
+
+
 router = APIRouter(prefix="/chatwoot", tags=["chatwoot"])
 
 
@@ -158,6 +262,68 @@ def _strip_html(text: str) -> str:
     return _HTML_TAG_RE.sub(" ", text).strip()
 
 
+class ConversationSender:
+    """
+    Ordered poster for one conversation: a single worker thread posts messages strictly in submit order,
+    so the caller keeps reading the LLM stream while the previous block is in flight.
+    submit() blocks when the queue is full (backpressure); close() flushes the queue and waits.
+    After the first failed post the remaining messages are dropped.
+    """
+
+    _STOP = object()
+
+    def __init__(self, conversation_id: int, *, private: bool = False, maxsize: int = STREAM_POST_QUEUE_SIZE) -> None:
+        self.conversation_id = conversation_id
+        self.private = private
+        self.posted = 0
+        self.failed = False
+        self._queue: queue.Queue[Any] = queue.Queue(maxsize=max(1, maxsize))
+        self._thread = threading.Thread(
+            target=self._run, name=f"chatwoot-sender-{conversation_id}", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, content: str) -> bool:
+        """Queue a message for posting. Returns False once a previous post has failed."""
+        if self.failed:
+            return False
+        self._queue.put(content)
+        return True
+
+    def close(self, timeout: float | None = None) -> None:
+        """Post everything already queued and stop the worker."""
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            if self.failed:
+                continue
+            ok = post_message(self.conversation_id, item, private=self.private)
+            if ok:
+                self.posted += 1
+            else:
+                self.failed = True
+                logger.error(
+                    "Failed to post stream block %s to conversation_id=%s", self.posted + 1, self.conversation_id
+                )
+
+
+def _stream_to_sender(stream_provider: StreamReplyProvider, content: str, sender: ConversationSender, cid: int) -> None:
+    """Read reply blocks from the stream provider and queue non-empty ones for posting."""
+    try:
+        for block in stream_provider(content):
+            if not (block or "").strip():
+                continue
+            if not sender.submit(block.strip()):
+                break
+    except Exception as e:
+        logger.exception("Stream reply provider failed for conversation_id=%s: %s", cid, e)
+
+
 def _process_message(payload: WebhookPayload) -> None:
     """Call reply provider and post reply (public for bot, private for copilot)."""
     cid = _conversation_id(payload)
@@ -200,33 +366,39 @@ def _process_message(payload: WebhookPayload) -> None:
     stream_provider = get_stream_reply_provider() if mode == "bot" else None
     use_stream = mode == "bot" and STREAM_REPLY_ENABLED and stream_provider is not None
 
+    t0 = _time.perf_counter()
+    # Все вызовы провайдера — в пуле «webhook», отдельном от /chat и copilot;
+    # переполнение — ошибка задачи, очередь её повторит
+    pool = get_pool("webhook")
+    pending_reply = None
+    if not use_stream:
+        pending_reply = pool.submit(provider, content)
     if mode == "bot" and not use_stream:
-        post_message(cid, AUTO_REPLY_PLACEHOLDER, private=False)
+        # Ретривал и LLM стартуют сразу; placeholder — только если ответ не успел за PLACEHOLDER_DELAY_SEC.
+        # Ответ постится после возврата из post_message(placeholder), поэтому порядок сохраняется.
+        if PLACEHOLDER_DELAY_SEC > 0:
+            _wait_futures([pending_reply], timeout=PLACEHOLDER_DELAY_SEC)
+        if PLACEHOLDER_DELAY_SEC <= 0 or not pending_reply.done():
+            post_message(cid, AUTO_REPLY_PLACEHOLDER, private=False)
+        else:
+            logger.info("chatwoot: reply ready within %.1fs, placeholder skipped conversation_id=%s", PLACEHOLDER_DELAY_SEC, cid)
 
-    t0 = _time.perf_counter()
     if use_stream:
-        block_count = 0
+        # Генерация — в пуле «webhook» (один слот на весь поток), постинг — в потоке sender по порядку:
+        # генерация LLM и доставка в Chatwoot перекрываются
+        sender = ConversationSender(cid, private=False)
         try:
-            for block in stream_provider(content):
-                if not (block or "").strip():
-                    continue
-                block_count += 1
-                ok = post_message(cid, block.strip(), private=False)
-                if not ok:
-                    logger.error("Failed to post stream block %s to conversation_id=%s", block_count, cid)
-                    break
-        except Exception as e:
-            logger.exception("Stream reply provider failed for conversation_id=%s: %s", cid, e)
+            pool.submit(_stream_to_sender, stream_provider, content, sender, cid).result()
+        finally:
+            sender.close()
         total_sec = _time.perf_counter() - t0
-        print(
-            f"[chatwoot] stream_blocks={block_count} total_sec={total_sec:.2f} mode={mode}",
-            file=sys.stderr,
-            flush=True,
+        _event_log.info(
+            "chatwoot.reply", conversation_id=cid, stream_blocks=sender.posted, total_sec=round(total_sec, 2), mode=mode
         )
         return
 
     try:
-        reply = provider(content)
+        reply = pending_reply.result()
     except Exception as e:
         logger.exception("Reply provider failed for conversation_id=%s: %s", cid, e)
         return
@@ -234,7 +406,9 @@ def _process_message(payload: WebhookPayload) -> None:
         logger.warning("Reply provider returned empty for conversation_id=%s content_len=%s", cid, len(content))
         return
     total_sec = _time.perf_counter() - t0
-    print(f"[chatwoot] reply_len={len(reply)} total_sec={total_sec:.2f} mode={mode}", file=sys.stderr, flush=True)
+    _event_log.info(
+        "chatwoot.reply", conversation_id=cid, reply_len=len(reply), total_sec=round(total_sec, 2), mode=mode
+    )
     if mode == "bot":
         ok = post_message(cid, reply, private=False)
         if not ok:
@@ -245,6 +419,86 @@ def _process_message(payload: WebhookPayload) -> None:
             logger.error("Failed to post copilot suggestion to conversation_id=%s", cid)
 
 
+_seen_messages: SeenSet | None = None
+
+
+def get_seen_messages() -> SeenSet:
+    """Seen-set of processed message ids (persistent with CHATWOOT_DEDUPE_PERSIST=true)."""
+    global _seen_messages
+    if _seen_messages is None:
+        with _job_queue_lock:
+            if _seen_messages is None:
+                _seen_messages = SeenSet(
+                    ttl=DEDUPE_TTL_SEC,
+                    max_size=DEDUPE_MAX_SIZE,
+                    path=DEDUPE_PATH if DEDUPE_PERSIST else None,
+                )
+    return _seen_messages
+
+
+def _slim_attrs(source: dict[str, Any] | None) -> dict[str, Any]:
+    """Only the attributes _support_mode reads, taken the same way (custom_attributes, else additional_attributes)."""
+    attrs = (source or {}).get("custom_attributes") or (source or {}).get("additional_attributes") or {}
+    if not isinstance(attrs, dict):
+        return {}
+    return {k: attrs[k] for k in (SUPPORT_MODE_ATTR, "preferred_channel") if k in attrs}
+
+
+def _slim_job(body: dict[str, Any]) -> dict[str, Any]:
+    """Queue record with only the fields processing needs (no full conversation/contact copies)."""
+    conv = body.get("conversation") or {}
+    cid = None
+    try:
+        cid = int(conv.get("id"))
+    except (TypeError, ValueError):
+        pass
+    return {
+        "id": body.get("id"),
+        "account_id": (body.get("account") or {}).get("id"),
+        "content": body.get("content") or "",
+        "content_type": body.get("content_type") or "text",
+        "conversation": {"id": cid, "custom_attributes": _slim_attrs(conv)},
+        "contact": {"custom_attributes": _slim_attrs(body.get("contact"))},
+    }
+
+
+def _dedupe_key(body: dict[str, Any], cid: int | None) -> str | None:
+    """(account, conversation, message id); None when the event has no message id."""
+    message_id = body.get("id")
+    if message_id is None:
+        return None
+    account_id = (body.get("account") or {}).get("id")
+    return f"{account_id}:{cid}:{message_id}"
+
+
+def _merge_jobs(older: dict[str, Any], newer: dict[str, Any]) -> dict[str, Any]:
+    """
+    Склейка отложенной задачи с новым сообщением того же диалога: текст через пробел
+    (перенос строки сделал бы сообщение «служебным», см. _is_skip_phrase), метаданные — из нового.
+    Email из Pre Chat Form и служебные фразы виджета в склейку не попадают.
+    """
+    parts: list[str] = []
+    for job in (older, newer):
+        text = _strip_html((job.get("content") or "").strip())
+        if not text or _is_email_only(text, job.get("content_type") or "text") or _is_skip_phrase(text):
+            continue
+        parts.append(text)
+    merged = dict(newer)
+    if parts:
+        merged["content"] = " ".join(parts)
+        merged["content_type"] = "text"
+    merged["merged_ids"] = [*(older.get("merged_ids") or [older.get("id")]), newer.get("id")]
+    return merged
+
+
+def _run_job(data: dict[str, Any]) -> None:
+    """Queue handler: rebuild the webhook payload and process it."""
+    merged_ids = data.get("merged_ids")
+    if merged_ids:
+        logger.info("chatwoot: debounced %s messages into one query ids=%s", len(merged_ids), merged_ids)
+    _process_message(WebhookPayload(**data))
+
+
 class CopilotRequest(BaseModel):
     """Request body for /copilot (suggestion only, no post to Chatwoot)."""
     message: str = Field(..., min_length=1)
@@ -255,64 +509,68 @@ class CopilotResponse(BaseModel):
 
 
 @router.post("/copilot", response_model=CopilotResponse)
-def copilot_suggest(req: CopilotRequest) -> CopilotResponse:
+async def copilot_suggest(req: CopilotRequest) -> CopilotResponse:
     """
     Return AI suggestion for the given message (for operators).
     Does not post to Chatwoot; operator can use or edit the text.
+    Runs in the "copilot" pool, isolated from web chat and webhook traffic.
     """
     provider = get_reply_provider()
-    reply = (provider(req.message) if provider else None) or ""
-    return CopilotResponse(suggestion=reply)
+    if not provider:
+        return CopilotResponse(suggestion="")
+    try:
+        reply = await get_pool("copilot").run(provider, req.message)
+    except BulkheadFull:
+        raise HTTPException(status_code=503, detail="copilot pool is full")
+    return CopilotResponse(suggestion=reply or "")
 
 
 @router.post("/webhook")
-async def webhook(request: Request, background_tasks: BackgroundTasks) -> dict[str, str]:
+async def webhook(request: Request) -> dict[str, str]:
     """
     Chatwoot webhook: message_created.
     - Incoming only; bot mode -> post public reply; human mode -> post private suggestion.
+    - Only enqueues the job (durable queue); processing happens in the queue workers.
     """
+    raw = await request.body()
     try:
-        body = await request.json()
-    except Exception as e:
+        body = _json_loads(raw)
+    except ValueError as e:
         logger.warning("chatwoot webhook: invalid JSON body %s", e)
         return {"status": "ok"}
+    if not isinstance(body, dict):
+        return {"status": "ok"}
+    # Большая часть трафика Chatwoot — исходящие сообщения и прочие события: отсекаем по верхним ключам
     event = body.get("event", "")
     message_type = body.get("message_type", "")
-    cid = None
-    conv = body.get("conversation") or {}
-    if conv:
-        try:
-            cid = int(conv.get("id"))
-        except (TypeError, ValueError):
-            pass
-    logger.info(
-        "chatwoot webhook: event=%s message_type=%s conversation_id=%s",
-        event,
-        message_type,
-        cid,
-    )
-    if event != "message_created":
-        logger.debug("chatwoot webhook: skip event %s", event)
+    if event != "message_created" or message_type != "incoming":
+        logger.debug("chatwoot webhook: skip event=%s message_type=%s", event, message_type)
         return {"status": "ok"}
-    if message_type != "incoming":
-        logger.debug("chatwoot webhook: skip message_type %s", message_type)
-        return {"status": "ok"}
-    content = (body.get("content") or "").strip()
-    conv_attrs = conv.get("custom_attributes") or conv.get("additional_attributes") or {}
-    print(
-        f"[chatwoot] content={repr(content)[:120]} cid={cid} support_mode={conv_attrs.get(SUPPORT_MODE_ATTR)}",
-        file=sys.stderr,
-        flush=True,
-    )
-    payload = WebhookPayload(
-        event=event,
-        id=body.get("id"),
-        content=body.get("content", ""),
-        message_type=message_type,
-        content_type=body.get("content_type", "text"),
-        sender=body.get("sender"),
-        contact=body.get("contact"),
-        conversation=conv,
+    job = _slim_job(body)
+    cid = job["conversation"].get("id")
+    _event_log.info(
+        "chatwoot.webhook",
+        conversation_id=cid,
+        message_id=job["id"],
+        content_len=len(job["content"]),
+        support_mode=job["conversation"]["custom_attributes"].get(SUPPORT_MODE_ATTR),
     )
-    background_tasks.add_task(_process_message, payload)
+    key = _dedupe_key(body, cid)
+    if key is not None and not get_seen_messages().add_if_new(key):
+        logger.info("chatwoot webhook: duplicate delivery dropped key=%s", key)
+        return {"status": "ok"}
+    if get_job_queue().enqueue(
+        job, delay=DEBOUNCE_SEC, group_key=f"{job['account_id']}:{cid}", merge=_merge_jobs
+    ) is None:
+        # Очередь переполнена — 503, Chatwoot повторит доставку позже (ключ забываем, чтобы повтор прошёл)
+        if key is not None:
+            get_seen_messages().discard(key)
+        logger.error("chatwoot webhook: job queue full, rejecting conversation_id=%s", cid)
+        raise HTTPException(status_code=503, detail="queue full")
     return {"status": "ok"}
+
+
+@router.get("/queue")
+def queue_metrics() -> dict[str, Any]:
+    """Depth, age of the oldest pending job and counters of the webhook job queue; dedupe counters."""
+    return {**get_job_queue().metrics(), "dedupe": get_seen_messages().metrics()}
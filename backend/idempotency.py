@@ -0,0 +1,95 @@
+"""
+Bounded TTL seen-set for webhook idempotency: Chatwoot redelivers webhooks on slow responses,
+the same message id must not trigger a second RAG + LLM run and a duplicate reply.
+In memory by default; with a path, keys are also stored in SQLite and reloaded after a restart.
+"""
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class SeenSet:
+    """
+    add_if_new(key) returns True the first time a key is seen within ttl seconds, False for duplicates.
+    Holds at most max_size keys (oldest evicted first). All keys share one TTL, so insertion order
+    is also expiry order and expired keys are dropped from the front.
+    """
+
+    def __init__(self, *, ttl: float = 3600.0, max_size: int = 10000, path: str | Path | None = None) -> None:
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.counters = {"checked": 0, "duplicates_dropped": 0, "evicted": 0}
+        self._keys: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        if path is not None:
+            if str(path) != ":memory:":
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            now = time.time()
+            self._conn.execute("DELETE FROM seen WHERE expires_at <= ?", (now,))
+            rows = self._conn.execute(
+                "SELECT key, expires_at FROM seen ORDER BY expires_at DESC LIMIT ?", (self.max_size,)
+            ).fetchall()
+            for key, expires_at in reversed(rows):
+                self._keys[key] = expires_at
+            if rows:
+                logger.info("seen-set: restored %s keys from %s", len(rows), path)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add_if_new(self, key: str) -> bool:
+        now = time.time()
+        with self._lock:
+            self.counters["checked"] += 1
+            self._expire(now)
+            if key in self._keys:
+                self.counters["duplicates_dropped"] += 1
+                return False
+            expires_at = now + self.ttl
+            self._keys[key] = expires_at
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+                self.counters["evicted"] += 1
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO seen (key, expires_at) VALUES (?, ?)", (key, expires_at)
+                )
+            return True
+
+    def discard(self, key: str) -> None:
+        """Forget a key (e.g. the job was not accepted and the redelivery must go through)."""
+        with self._lock:
+            self._keys.pop(key, None)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM seen WHERE key = ?", (key,))
+
+    def metrics(self) -> dict[str, Any]:
+        return {"size": len(self._keys), "ttl_sec": self.ttl, "persistent": self._conn is not None, **self.counters}
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _expire(self, now: float) -> None:
+        expired = 0
+        while self._keys:
+            key, expires_at = next(iter(self._keys.items()))
+            if expires_at > now:
+                break
+            self._keys.popitem(last=False)
+            expired += 1
+        if expired and self._conn is not None:
+            self._conn.execute("DELETE FROM seen WHERE expires_at <= ?", (now,))
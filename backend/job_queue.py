@@ -0,0 +1,296 @@
+"""
+Local durable job queue (SQLite) for webhook work.
+Jobs survive container restarts: a job is deleted only after its handler returns; jobs that were running
+when the process died are picked up again on the next start.
+
+Bounded (max_depth pending jobs), served by a fixed pool of worker threads, with a per-job timeout
+(reported, not enforced: an overdue handler is never run a second time while it is still alive),
+retries with backoff and dead-lettering (status='dead' rows are kept for inspection).
+Jobs with a group_key can be debounced: a newer job of the same group replaces the pending one.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[dict[str, Any]], None]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at REAL,
+    last_error TEXT,
+    group_key TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_available ON jobs (status, available_at);
+"""
+
+JobMerge = Callable[[dict[str, Any], dict[str, Any]], dict[str, Any]]
+
+
+class JobQueue:
+    """
+    SQLite-backed queue with a worker pool.
+    enqueue() returns the job id, or None when the queue already holds max_depth pending jobs.
+    A job that raises is retried after retry_backoff * 2^(attempt-1) seconds; after max_attempts it is
+    dead-lettered. A handler that exceeds job_timeout cannot be killed, so it is only logged and counted:
+    the job stays 'running' and its worker waits for the handler to exit, then finishes the job by its
+    actual outcome. Retrying while the first run is alive would repeat its side effects (e.g. a second
+    bot reply), and abandoned threads would pile up beyond `workers`.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        handler: JobHandler,
+        *,
+        workers: int = 4,
+        job_timeout: float = 180.0,
+        max_attempts: int = 3,
+        retry_backoff: float = 5.0,
+        max_depth: int = 1000,
+        name: str = "jobs",
+    ) -> None:
+        self.path = str(path)
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.job_timeout = job_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.max_depth = max_depth
+        self.name = name
+        self.counters = {
+            "enqueued": 0,
+            "rejected": 0,
+            "processed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "retried": 0,
+            "dead_lettered": 0,
+            "superseded": 0,
+        }
+        self._db_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._running = 0
+        self._stopping = False
+        self._threads: list[threading.Thread] = []
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "group_key" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN group_key TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_group_key ON jobs (group_key, status)")
+        # Задачи, которые выполнялись в момент падения процесса, — снова в очередь
+        recovered = self._conn.execute(
+            "UPDATE jobs SET status = 'pending', available_at = ? WHERE status = 'running'", (time.time(),)
+        ).rowcount
+        if recovered:
+            logger.warning("job queue %s: recovered %s interrupted jobs", self.name, recovered)
+
+    # --- lifecycle ---
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stopping = False
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop workers after their current job; pending jobs stay in the database."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        alive = any(t.is_alive() for t in self._threads)
+        self._threads = []
+        if not alive:
+            with self._db_lock:
+                self._conn.close()
+
+    # --- producer side ---
+
+    def enqueue(
+        self,
+        payload: dict[str, Any],
+        *,
+        delay: float = 0.0,
+        group_key: str | None = None,
+        merge: JobMerge | None = None,
+    ) -> int | None:
+        """
+        Add a job. With group_key, a still-pending job of the same group is cancelled and replaced
+        by a new job with payload merge(old_payload, payload), due after delay (debounce).
+        """
+        now = time.time()
+        created_at = now
+        with self._db_lock:
+            superseded = None
+            if group_key is not None:
+                superseded = self._conn.execute(
+                    "SELECT id, payload, created_at FROM jobs WHERE group_key = ? AND status = 'pending' "
+                    "ORDER BY id DESC LIMIT 1",
+                    (group_key,),
+                ).fetchone()
+            if superseded is None:
+                depth = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'").fetchone()[0]
+                if depth >= self.max_depth:
+                    self.counters["rejected"] += 1
+                    return None
+            else:
+                old_id, old_payload, created_at = superseded
+                if merge is not None:
+                    payload = merge(json.loads(old_payload), payload)
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (old_id,))
+                self.counters["superseded"] += 1
+            job_id = self._conn.execute(
+                "INSERT INTO jobs (payload, created_at, available_at, group_key) VALUES (?, ?, ?, ?)",
+                (json.dumps(payload, ensure_ascii=False), created_at, now + max(0.0, delay), group_key),
+            ).lastrowid
+            self.counters["enqueued"] += 1
+        with self._cond:
+            self._cond.notify()
+        return job_id
+
+    # --- observability ---
+
+    def metrics(self) -> dict[str, Any]:
+        now = time.time()
+        with self._db_lock:
+            rows = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'pending'").fetchone()[0]
+        return {
+            "depth": rows.get("pending", 0),
+            "running": rows.get("running", 0),
+            "dead": rows.get("dead", 0),
+            "oldest_pending_age_sec": round(now - oldest, 3) if oldest is not None else 0.0,
+            "workers": self.workers,
+            **self.counters,
+        }
+
+    def wait_idle(self, timeout: float = 10.0) -> bool:
+        """Wait until nothing is pending-and-due or running (tests, graceful shutdown)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._db_lock:
+                busy = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'running' OR (status = 'pending' AND available_at <= ?)",
+                    (time.time(),),
+                ).fetchone()[0]
+            if not busy and not self._running:
+                return True
+            time.sleep(0.01)
+        return False
+
+    # --- worker side ---
+
+    def _claim(self) -> tuple[int, dict[str, Any], int] | float:
+        """Claim the next due job, or return seconds until the next one becomes due."""
+        now = time.time()
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT id, payload, attempts FROM jobs WHERE status = 'pending' AND available_at <= ? "
+                "ORDER BY available_at, id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                nxt = self._conn.execute(
+                    "SELECT MIN(available_at) FROM jobs WHERE status = 'pending'"
+                ).fetchone()[0]
+                return 1.0 if nxt is None else min(1.0, max(0.0, nxt - now))
+            job_id, payload, attempts = row
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = ?, started_at = ? WHERE id = ?",
+                (attempts + 1, now, job_id),
+            )
+            self._running += 1
+        return job_id, json.loads(payload), attempts + 1
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+            claimed = self._claim()
+            if isinstance(claimed, float):
+                with self._cond:
+                    if not self._stopping:
+                        self._cond.wait(claimed)
+                continue
+            job_id, payload, attempt = claimed
+            try:
+                error = self._run_with_timeout(payload)
+            finally:
+                with self._db_lock:
+                    self._running -= 1
+            self._finish(job_id, attempt, error)
+
+    def _run_with_timeout(self, payload: dict[str, Any]) -> str | None:
+        """Run the handler in its own thread; returns an error description or None on success."""
+        result: dict[str, BaseException] = {}
+
+        def target() -> None:
+            try:
+                self.handler(payload)
+            except BaseException as e:  # noqa: BLE001 — фиксируем и повторяем задачу
+                result["error"] = e
+
+        t = threading.Thread(target=target, name=f"{self.name}-job", daemon=True)
+        started = time.monotonic()
+        t.start()
+        t.join(self.job_timeout)
+        if t.is_alive():
+            self.counters["timeouts"] += 1
+            logger.warning(
+                "job queue %s: handler exceeded %.0fs, waiting for it to finish before deciding on a retry",
+                self.name,
+                self.job_timeout,
+            )
+            t.join()
+            logger.warning("job queue %s: overdue handler finished after %.1fs", self.name, time.monotonic() - started)
+        if "error" in result:
+            e = result["error"]
+            logger.error("job queue %s: handler failed: %r", self.name, e)
+            return repr(e)
+        return None
+
+    def _finish(self, job_id: int, attempt: int, error: str | None) -> None:
+        with self._db_lock:
+            if error is None:
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                self.counters["processed"] += 1
+                return
+            self.counters["failed"] += 1
+            if attempt >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'dead', last_error = ? WHERE id = ?", (error[:2000], job_id)
+                )
+                self.counters["dead_lettered"] += 1
+                logger.error("job queue %s: job %s dead-lettered after %s attempts: %s", self.name, job_id, attempt, error)
+                return
+            delay = self.retry_backoff * (2 ** (attempt - 1))
+            self._conn.execute(
+                "UPDATE jobs SET status = 'pending', available_at = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, error[:2000], job_id),
+            )
+            self.counters["retried"] += 1
+            logger.warning("job queue %s: job %s attempt %s failed, retry in %.1fs: %s", self.name, job_id, attempt, delay, error)
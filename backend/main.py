@@ -5,12 +5,14 @@ GET / — чат-интерфейс.
 """
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import os
 import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Iterator
+from typing import Any, AsyncIterator, Iterator
 
 from dotenv import load_dotenv
 
@@ -23,8 +25,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 
+from backend.pools import BulkheadFull, get_pool, pools_metrics
 from backend.prompts import SYSTEM_PROMPT_TEMPLATE
-from rag.search import search as rag_search
+from rag.search import format_hits, search as rag_search, search_hits as rag_search_hits
 
 # Algolia Agent Studio: URL приложения https://{APPLICATION_ID}.algolia.net/agent-studio/1/agents/{agent_id}/completions
 # Переопределение: ALGOLIA_AGENT_STUDIO_BASE_URL (например https://agent-studio.us.algolia.com для регионального эндпоинта)
@@ -47,7 +50,29 @@ def _get_llm_api_key() -> str:
 LLM_API_BASE_URL = os.environ.get("LLM_API_BASE_URL", "").rstrip("/")
 LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o-mini")
 
-app = FastAPI(title="RAG Chat API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # Старт: очередь webhook запускается сразу — задачи, прерванные падением процесса,
+    # обрабатываются без ожидания нового webhook
+    if _chatwoot_enabled:
+        from backend.chatwoot_webhook import get_job_queue, get_seen_messages
+
+        get_seen_messages()
+        get_job_queue()
+    yield
+    # Остановка: воркеры очереди (текущая задача дорабатывает, остальные остаются в SQLite)
+    # и keep-alive пулы клиента Chatwoot (асинхронный — из этого же event loop)
+    from backend.chatwoot_client import aclose_clients
+
+    if _chatwoot_enabled:
+        from backend.chatwoot_webhook import stop_job_queue
+
+        await asyncio.to_thread(stop_job_queue)
+    await aclose_clients()
+
+
+app = FastAPI(title="RAG Chat API", version="0.1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -60,6 +85,9 @@ app.add_middleware(
 class ChatRequest(BaseModel):
     message: str
     backend: str = "qdrant"  # "qdrant" | "algolia"
+    # Необязательный фильтр поиска (qdrant): раздел документации или его начало ("player") и/или URL страниц
+    section: str | list[str] | None = None
+    source: str | list[str] | None = None
 
 
 class ChatResponse(BaseModel):
@@ -285,6 +313,9 @@ STREAM_MIN_CHARS = int(os.environ.get("CHATWOOT_STREAM_MIN_CHARS", "120"))
 STREAM_MAX_CHARS = int(os.environ.get("CHATWOOT_STREAM_MAX_CHARS", "450"))
 
 
+_BLOCK_SEPARATORS = (("\n\n", 2), (". ", 2), (".\n", 2), (" ", 1))
+
+
 def _split_block(buffer: str, min_chars: int, max_chars: int) -> tuple[str, str]:
     """
     Отрезает от buffer один блок: по границе абзаца (\\n\\n) или предложения (. ),
@@ -295,7 +326,7 @@ def _split_block(buffer: str, min_chars: int, max_chars: int) -> tuple[str, str]
     # Ищем последнюю «хорошую» границу в пределах [min_chars, min(max_chars, len(buffer))]
     end = min(max_chars + 1, len(buffer))
     search = buffer[min_chars:end]
-    for sep, shift in (("\n\n", 2), (". ", 2), (".\n", 2), (" ", 1)):
+    for sep, shift in _BLOCK_SEPARATORS:
         idx = search.rfind(sep)
         if idx >= 0:
             cut = min_chars + idx + shift
@@ -308,6 +339,61 @@ def _split_block(buffer: str, min_chars: int, max_chars: int) -> tuple[str, str]
     return buffer[:max_chars].strip(), buffer[max_chars:].lstrip()
 
 
+_SOURCES_MARKERS = ("Источники:", "Источник:")
+# Сколько символов уже просмотренного хвоста пересматривать: маркер может прийти разрезанным между delta
+_SOURCES_MARKER_OVERLAP = max(len(m) for m in _SOURCES_MARKERS) - 1
+
+
+class StreamBlockSplitter:
+    """
+    Инкрементальная нарезка стрима LLM на блоки для Chatwoot.
+    Хранит только неотправленный хвост и ищет маркер «Источники:» лишь в новых символах,
+    поэтому суммарная работа линейна по длине ответа. После маркера текст копится без нарезки
+    и отдаётся одним блоком (через _clean_reply) в finish().
+    """
+
+    def __init__(self, min_chars: int = STREAM_MIN_CHARS, max_chars: int = STREAM_MAX_CHARS) -> None:
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.sources_started = False
+        self._pending = ""
+        self._scanned = 0
+        self._tail: list[str] = []
+
+    def feed(self, delta: str) -> list[str]:
+        """Добавляет кусок стрима, возвращает готовые блоки (возможно пустой список)."""
+        if not delta:
+            return []
+        if self.sources_started:
+            self._tail.append(delta)
+            return []
+        self._pending += delta
+        start = max(0, self._scanned - _SOURCES_MARKER_OVERLAP)
+        if any(self._pending.find(m, start) >= 0 for m in _SOURCES_MARKERS):
+            self.sources_started = True
+            return []
+        blocks: list[str] = []
+        while len(self._pending) >= self.min_chars:
+            # Пока не набрали max_chars, режем только по границе — иначе слово разрежется посередине
+            if len(self._pending) <= self.max_chars and not any(
+                self._pending.find(sep, self.min_chars) >= 0 for sep, _ in _BLOCK_SEPARATORS
+            ):
+                break
+            block, self._pending = _split_block(self._pending, self.min_chars, self.max_chars)
+            if block:
+                blocks.append(block)
+        self._scanned = len(self._pending)
+        return blocks
+
+    def finish(self, clean: bool = True) -> str:
+        """Остаток стрима одним блоком; с маркером источников — без шаблонных фраз (clean=True)."""
+        text = (self._pending + "".join(self._tail)).strip()
+        self._pending, self._scanned, self._tail = "", 0, []
+        if clean and self.sources_started:
+            return _clean_reply(text)
+        return text
+
+
 def stream_rag_reply(message: str) -> Iterator[str]:
     """
     RAG один раз, LLM — потоком; выдаёт блоки текста для постинга в Chatwoot.
@@ -325,26 +411,18 @@ def stream_rag_reply(message: str) -> Iterator[str]:
         len(message), len(rag_text or ""), rag_sec,
     )
     system_content = SYSTEM_PROMPT_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_text)
-    buffer = ""
-    sources_start = False
-    min_c, max_c = STREAM_MIN_CHARS, STREAM_MAX_CHARS
+    splitter = StreamBlockSplitter(STREAM_MIN_CHARS, STREAM_MAX_CHARS)
     try:
         for delta in _stream_llm_content(system_content, message):
-            buffer += delta
-            if "Источники:" in buffer or "Источник:" in buffer:
-                sources_start = True
-            if sources_start:
-                continue
-            while len(buffer) >= min_c:
-                block, buffer = _split_block(buffer, min_c, max_c)
-                if block:
-                    yield block
-        if buffer.strip():
-            yield _clean_reply(buffer.strip()) if ("Источники:" in buffer or "Источник:" in buffer) else buffer.strip()
+            yield from splitter.feed(delta)
+        rest = splitter.finish()
+        if rest:
+            yield rest
     except Exception as e:
         log.exception("stream_rag_reply failed: %s", e)
-        if buffer.strip():
-            yield buffer.strip()
+        rest = splitter.finish(clean=False)
+        if rest:
+            yield rest
     finally:
         log.info("stream_rag_reply: llm stream done total_sec=%.2f", time.perf_counter() - t0)
 
@@ -375,7 +453,15 @@ def get_rag_reply(message: str) -> str:
 
 
 @app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest) -> ChatResponse:
+async def chat(request: ChatRequest) -> ChatResponse:
+    """Ответ одним сообщением. Выполняется в пуле «chat», отдельном от webhook и copilot."""
+    try:
+        return await get_pool("chat").run(_chat_sync, request)
+    except BulkheadFull:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, повторите запрос позже")
+
+
+def _chat_sync(request: ChatRequest) -> ChatResponse:
     message = (request.message or "").strip()
     if not message:
         raise HTTPException(status_code=400, detail="Укажите message")
@@ -389,7 +475,7 @@ def chat(request: ChatRequest) -> ChatResponse:
             raise HTTPException(status_code=502, detail=f"Algolia: {e}")
         reply = _clean_reply(reply)
         return ChatResponse(reply=reply)
-    rag_text = rag_search(message)
+    rag_text = rag_search(message, section=request.section, source=request.source)
     system_content = SYSTEM_PROMPT_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_text)
     try:
         reply = _call_llm(system_content, message)
@@ -399,9 +485,31 @@ def chat(request: ChatRequest) -> ChatResponse:
     return ChatResponse(reply=reply)
 
 
+def _sse_event(obj: dict[str, Any]) -> str:
+    return f"data: {json.dumps(obj, ensure_ascii=False)}\n\n"
+
+
+def _sources_from_hits(hits: list[Any]) -> list[dict[str, Any]]:
+    """Краткие источники для SSE-события sources: section, source, heading, score."""
+    sources: list[dict[str, Any]] = []
+    for hit in hits:
+        payload = getattr(hit, "payload", None) or {}
+        score = getattr(hit, "score", None)
+        sources.append({
+            "section": payload.get("section", ""),
+            "source": payload.get("source", ""),
+            "heading": payload.get("heading", ""),
+            "score": round(float(score), 3) if score is not None else None,
+        })
+    return sources
+
+
 @app.post("/chat/stream")
 def chat_stream(request: ChatRequest) -> StreamingResponse:
-    """Стриминг ответа (SSE). Для плавного появления текста в чате."""
+    """
+    Стриминг ответа (SSE). Для плавного появления текста в чате.
+    События (qdrant): {"sources": [...]} сразу после поиска, затем {"delta": "..."}, в конце {"timing": {...}}.
+    """
     message = (request.message or "").strip()
     if not message:
         raise HTTPException(status_code=400, detail="Укажите message")
@@ -420,29 +528,52 @@ def chat_stream(request: ChatRequest) -> StreamingResponse:
                 for chunk in _algolia_stream(message):
                     yield chunk
             else:
-                rag_text = rag_search(message)
-                for chunk in _stream_llm(
-                    SYSTEM_PROMPT_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_text),
-                    message,
-                ):
+                # Источники отдаём сразу после поиска — UI показывает их, пока LLM думает
+                t0 = time.perf_counter()
+                hits = rag_search_hits(message, section=request.section, source=request.source)
+                rag_sec = time.perf_counter() - t0
+                yield _sse_event({"sources": _sources_from_hits(hits)})
+                system_content = SYSTEM_PROMPT_TEMPLATE.replace("{{RAG_CONTEXT}}", format_hits(message, hits))
+                t1 = time.perf_counter()
+                first_token_sec = None
+                for chunk in _stream_llm(system_content, message):
+                    if first_token_sec is None:
+                        first_token_sec = time.perf_counter() - t1
                     yield chunk
+                yield _sse_event({
+                    "timing": {
+                        "rag_sec": round(rag_sec, 3),
+                        "llm_first_token_sec": round(first_token_sec, 3) if first_token_sec is not None else None,
+                        "llm_sec": round(time.perf_counter() - t1, 3),
+                        "total_sec": round(time.perf_counter() - t0, 3),
+                    }
+                })
         except HTTPException as e:
             yield f"data: {json.dumps({'error': e.detail or str(e)}, ensure_ascii=False)}\n\n"
         except Exception as e:
             yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
 
+    async def generate_in_pool() -> Any:
+        try:
+            async for chunk in get_pool("chat").iterate(generate()):
+                yield chunk
+        except BulkheadFull:
+            yield _sse_event({"error": "Сервер перегружен, повторите запрос позже"})
+
     return StreamingResponse(
-        generate(),
+        generate_in_pool(),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
+_chatwoot_enabled = False
 try:
     from backend.chatwoot_webhook import router as chatwoot_router, set_reply_provider, set_stream_reply_provider
     set_reply_provider(get_rag_reply)
     set_stream_reply_provider(stream_rag_reply)
     app.include_router(chatwoot_router)
+    _chatwoot_enabled = True
 except ImportError:
     pass
 
@@ -452,6 +583,12 @@ def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics/pools")
+def pool_metrics() -> dict[str, dict[str, Any]]:
+    """Активные/ожидающие задачи и счётчики пулов chat, copilot, webhook."""
+    return pools_metrics()
+
+
 _STATIC_DIR = Path(__file__).resolve().parent / "static"
 
 
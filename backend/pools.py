@@ -0,0 +1,149 @@
+"""
+Named execution pools (bulkheads): each traffic class — web chat, copilot, Chatwoot webhook — gets its own
+threads, its own admission limit and its own metrics, so a burst in one class cannot exhaust the others.
+Sizes from env: POOL_<NAME>_WORKERS and POOL_<NAME>_QUEUE (e.g. POOL_CHAT_WORKERS=16).
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# (workers, queue) по умолчанию; queue — сколько задач может ждать свободного потока сверх workers
+_DEFAULT_SIZES = {
+    "chat": (16, 64),
+    "copilot": (4, 16),
+    "webhook": (4, 32),
+}
+
+_STOP = object()
+
+
+class BulkheadFull(RuntimeError):
+    """The pool has max_workers running and max_queue waiting tasks; the caller should shed load (503)."""
+
+
+class Bulkhead:
+    """ThreadPoolExecutor with bounded admission (workers + queue slots) and counters."""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int) -> None:
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"pool-{name}")
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._admitted = 0
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self._wait_sec_total = 0.0
+
+    def _admit(self) -> None:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.counters["rejected"] += 1
+            raise BulkheadFull(f"pool {self.name!r} is full")
+        with self._lock:
+            self._admitted += 1
+            self.counters["submitted"] += 1
+
+    def _release(self, ok: bool) -> None:
+        with self._lock:
+            self._admitted -= 1
+            self.counters["completed" if ok else "failed"] += 1
+        self._slots.release()
+
+    def submit(self, fn: Callable[..., T], *args: Any) -> Future[T]:
+        """Run fn in the pool; raises BulkheadFull when no admission slot is free."""
+        self._admit()
+        queued_at = time.perf_counter()
+
+        def run() -> T:
+            with self._lock:
+                self._active += 1
+                self._wait_sec_total += time.perf_counter() - queued_at
+            ok = False
+            try:
+                result = fn(*args)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self._active -= 1
+                self._release(ok)
+
+        return self._executor.submit(run)
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Await fn executed in the pool (from the event loop)."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    async def iterate(self, iterator: Iterator[T]) -> AsyncIterator[T]:
+        """
+        Drive a blocking iterator (e.g. an SSE generator) from the pool: one admission slot for the whole
+        iteration, each next() runs on the pool threads.
+        """
+        self._admit()
+        with self._lock:
+            self._active += 1
+        loop = asyncio.get_running_loop()
+        ok = False
+        try:
+            while True:
+                item = await loop.run_in_executor(self._executor, next, iterator, _STOP)
+                if item is _STOP:
+                    break
+                yield item
+            ok = True
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except ValueError:
+                    pass  # генератор ещё выполняется в потоке пула (клиент отключился посреди next())
+            with self._lock:
+                self._active -= 1
+            self._release(ok)
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            started = self.counters["completed"] + self.counters["failed"] + self._active
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": max(0, self._admitted - self._active),
+                "avg_queue_wait_sec": round(self._wait_sec_total / started, 4) if started else 0.0,
+                **self.counters,
+            }
+
+
+_pools: dict[str, Bulkhead] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str) -> Bulkhead:
+    """Pool by traffic class name; created on first use with sizes from env."""
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                workers, queue = _DEFAULT_SIZES.get(name, (4, 16))
+                key = name.upper()
+                pool = _pools[name] = Bulkhead(
+                    name,
+                    int(os.environ.get(f"POOL_{key}_WORKERS", str(workers))),
+                    int(os.environ.get(f"POOL_{key}_QUEUE", str(queue))),
+                )
+    return pool
+
+
+def pools_metrics() -> dict[str, dict[str, Any]]:
+    return {name: pool.metrics() for name, pool in sorted(_pools.items())}
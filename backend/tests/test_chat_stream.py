@@ -0,0 +1,79 @@
+"""
+Tests for /chat/stream: early sources event, LLM deltas and timing trailer.
+"""
+from __future__ import annotations
+
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from backend.main import app
+
+
+def _events(body: str) -> list[dict]:
+    return [json.loads(line[6:]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+def test_chat_stream_emits_sources_before_deltas_and_timing_last() -> None:
+    hits = [
+        SimpleNamespace(
+            score=0.81234,
+            payload={"section": "player", "source": "https://docs.kinescope.ru/player", "heading": "Плеер", "content": "x"},
+        )
+    ]
+
+    def fake_stream_llm(system_content: str, user_message: str):
+        assert "https://docs.kinescope.ru/player" in system_content
+        yield f"data: {json.dumps({'delta': 'Ответ'}, ensure_ascii=False)}\n\n"
+
+    with patch("backend.main.rag_search_hits", return_value=hits), patch(
+        "backend.main._stream_llm", side_effect=fake_stream_llm
+    ):
+        r = TestClient(app).post("/chat/stream", json={"message": "Как встроить плеер?"})
+    assert r.status_code == 200
+    events = _events(r.text)
+    assert events[0] == {
+        "sources": [
+            {"section": "player", "source": "https://docs.kinescope.ru/player", "heading": "Плеер", "score": 0.812}
+        ]
+    }
+    assert events[1] == {"delta": "Ответ"}
+    timing = events[-1]["timing"]
+    assert set(timing) == {"rag_sec", "llm_first_token_sec", "llm_sec", "total_sec"}
+
+
+def test_chat_stream_empty_sources_when_nothing_found() -> None:
+    with patch("backend.main.rag_search_hits", return_value=[]), patch(
+        "backend.main._stream_llm", return_value=iter(())
+    ):
+        r = TestClient(app).post("/chat/stream", json={"message": "?"})
+    events = _events(r.text)
+    assert events[0] == {"sources": []}
+    assert events[-1]["timing"]["llm_first_token_sec"] is None
+
+
+def test_chat_stream_passes_search_filters() -> None:
+    with patch("backend.main.rag_search_hits", return_value=[]) as search, patch(
+        "backend.main._stream_llm", return_value=iter(())
+    ):
+        TestClient(app).post(
+            "/chat/stream", json={"message": "Как встроить плеер?", "section": "player", "source": ["https://x"]}
+        )
+    assert search.call_args.kwargs == {"section": "player", "source": ["https://x"]}
+
+
+def test_build_filter_scopes_by_section_prefixes_and_source() -> None:
+    import sys
+
+    import rag.search  # noqa: F401 — модуль затенён одноимённой функцией в пакете rag
+
+    build_filter = sys.modules["rag.search"].build_filter
+    assert build_filter() is None
+    assert build_filter(" ", []) is None
+    f = build_filter("player/, api", "https://docs.kinescope.ru/player")
+    assert [(c.key, list(c.match.any)) for c in f.must] == [
+        ("sections", ["player", "api"]),
+        ("source", ["https://docs.kinescope.ru/player"]),
+    ]
@@ -0,0 +1,172 @@
+"""
+Tests for the pooled Chatwoot client: retries only when the message was certainly not created
+(connect errors, 429, 503 with Retry-After), no retry on other 5xx, 4xx or read errors, async variant, shutdown.
+"""
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+import pytest
+
+from backend import chatwoot_client
+
+
+@pytest.fixture
+def configured(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(chatwoot_client, "CHATWOOT_BASE_URL", "https://chatwoot.test")
+    monkeypatch.setattr(chatwoot_client, "CHATWOOT_ACCOUNT_ID", "1")
+    monkeypatch.setattr(chatwoot_client, "CHATWOOT_API_ACCESS_TOKEN", "token")
+    monkeypatch.setattr(chatwoot_client, "CHATWOOT_RETRY_BACKOFF", 0.0)
+    monkeypatch.setattr(chatwoot_client, "CHATWOOT_MAX_RETRIES", 2)
+    yield
+    chatwoot_client.close_clients()
+
+
+def _responder(statuses: list[int | Exception], seen: list[httpx.Request]):
+    codes = iter(statuses)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        code = next(codes)
+        if isinstance(code, Exception):
+            raise code
+        headers = {"Retry-After": "0"} if code == 503 else {}
+        return httpx.Response(code, json={"id": len(seen)}, headers=headers)
+
+    return handler
+
+
+def test_post_message_retries_on_503_then_succeeds(configured: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    seen: list[httpx.Request] = []
+    client = httpx.Client(transport=httpx.MockTransport(_responder([503, 429, 200], seen)))
+    monkeypatch.setattr(chatwoot_client, "_client", client)
+    result = chatwoot_client.post_message(5, "Ответ")
+    assert result == {"id": 3}
+    assert len(seen) == 3
+    assert seen[0].url.path == "/api/v1/accounts/1/conversations/5/messages"
+    assert seen[0].headers["api_access_token"] == "token"
+
+
+def test_post_message_gives_up_after_max_retries(configured: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    seen: list[httpx.Request] = []
+    client = httpx.Client(transport=httpx.MockTransport(_responder([429, 429, 429, 200], seen)))
+    monkeypatch.setattr(chatwoot_client, "_client", client)
+    assert chatwoot_client.post_message(5, "Ответ") is None
+    assert len(seen) == 3
+
+
+def test_post_message_retries_connect_error(configured: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    seen: list[httpx.Request] = []
+    client = httpx.Client(transport=httpx.MockTransport(_responder([httpx.ConnectError("refused"), 200], seen)))
+    monkeypatch.setattr(chatwoot_client, "_client", client)
+    assert chatwoot_client.post_message(5, "Ответ") == {"id": 2}
+
+
+@pytest.mark.parametrize(
+    "failure",
+    [500, 502, 504, httpx.ReadTimeout("slow"), httpx.RemoteProtocolError("dropped")],
+    ids=["500", "502", "504", "read-timeout", "protocol-error"],
+)
+def test_post_message_does_not_retry_when_message_may_exist(
+    configured: None, monkeypatch: pytest.MonkeyPatch, failure: int | Exception
+) -> None:
+    # Chatwoot мог уже создать сообщение — повтор дал бы дубль в диалоге
+    seen: list[httpx.Request] = []
+    client = httpx.Client(transport=httpx.MockTransport(_responder([failure, 200], seen)))
+    monkeypatch.setattr(chatwoot_client, "_client", client)
+    assert chatwoot_client.post_message(5, "Ответ") is None
+    assert len(seen) == 1
+
+
+def test_post_message_does_not_retry_client_error(configured: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    seen: list[httpx.Request] = []
+    client = httpx.Client(transport=httpx.MockTransport(_responder([404, 200], seen)))
+    monkeypatch.setattr(chatwoot_client, "_client", client)
+    assert chatwoot_client.post_message(5, "Ответ") is None
+    assert len(seen) == 1
+
+
+def test_post_message_reuses_pooled_client(configured: None) -> None:
+    assert chatwoot_client._get_client() is chatwoot_client._get_client()
+
+
+def test_apost_message_retries(configured: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    seen: list[httpx.Request] = []
+
+    async def run() -> dict | None:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(_responder([httpx.ConnectTimeout("t"), 200], seen)))
+        monkeypatch.setattr(chatwoot_client, "_async_client", client)
+        monkeypatch.setattr(chatwoot_client, "_async_loop", asyncio.get_running_loop())
+        try:
+            return await chatwoot_client.apost_message(5, "Заметка", private=True)
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == {"id": 2}
+    assert len(seen) == 2
+    assert b'"private":true' in seen[0].content.replace(b" ", b"")
+
+
+def test_aclose_clients_closes_async_pool(configured: None) -> None:
+    async def run() -> httpx.AsyncClient:
+        client = chatwoot_client._get_async_client()
+        await chatwoot_client.aclose_clients()
+        return client
+
+    client = asyncio.run(run())
+    assert client.is_closed and chatwoot_client._async_client is None
+
+
+def test_async_client_of_previous_loop_is_closed_when_replaced(configured: None) -> None:
+    async def first() -> httpx.AsyncClient:
+        return chatwoot_client._get_async_client()
+
+    async def second() -> httpx.AsyncClient:
+        client = chatwoot_client._get_async_client()
+        await asyncio.sleep(0.01)  # закрытие прежнего клиента — отдельной задачей
+        return client
+
+    old = asyncio.run(first())
+    new = asyncio.run(second())
+    assert new is not old and old.is_closed and not new.is_closed
+    asyncio.run(new.aclose())
+
+
+def test_post_message_does_not_retry_503_without_retry_after(configured: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    seen: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(503)
+
+    monkeypatch.setattr(chatwoot_client, "_client", httpx.Client(transport=httpx.MockTransport(handler)))
+    assert chatwoot_client.post_message(5, "Ответ") is None
+    assert len(seen) == 1
+
+
+def test_retry_after_longer_than_max_sleep_is_not_retried(configured: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    seen: list[httpx.Request] = []
+    sleeps: list[float] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(429, headers={"Retry-After": "60"})
+
+    monkeypatch.setattr(chatwoot_client, "CHATWOOT_RETRY_MAX_SLEEP", 10.0)
+    monkeypatch.setattr(chatwoot_client.time, "sleep", sleeps.append)
+    monkeypatch.setattr(chatwoot_client, "_client", httpx.Client(transport=httpx.MockTransport(handler)))
+    assert chatwoot_client.post_message(5, "Ответ") is None
+    assert len(seen) == 1 and sleeps == []
+
+
+def test_retry_after_within_max_sleep_is_waited_in_full(configured: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    responses = iter([httpx.Response(429, headers={"Retry-After": "3"}), httpx.Response(200, json={"id": 1})])
+    sleeps: list[float] = []
+    monkeypatch.setattr(chatwoot_client, "CHATWOOT_RETRY_MAX_SLEEP", 10.0)
+    monkeypatch.setattr(chatwoot_client.time, "sleep", sleeps.append)
+    monkeypatch.setattr(
+        chatwoot_client, "_client", httpx.Client(transport=httpx.MockTransport(lambda request: next(responses)))
+    )
+    assert chatwoot_client.post_message(5, "Ответ") == {"id": 1}
+    assert sleeps == [3.0]
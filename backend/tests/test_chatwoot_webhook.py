@@ -4,23 +4,33 @@ Tests for Chatwoot webhook: support_mode parsing, webhook acceptance, and reply
 from __future__ import annotations
 
 import os
+import threading
+import time
 from unittest.mock import patch
 
 import pytest
 from fastapi.testclient import TestClient
 
+from backend import chatwoot_webhook
 from backend.chatwoot_webhook import (
     AUTO_REPLY_PLACEHOLDER,
+    ConversationSender,
     WebhookPayload,
     _conversation_id,
     _is_email_only,
     _is_skip_phrase,
+    _merge_jobs,
     _normalize_support_mode,
+    _RateLimitedLog,
+    _slim_job,
     _strip_html,
     _support_mode,
     router,
     set_reply_provider,
+    set_stream_reply_provider,
 )
+from backend.idempotency import SeenSet
+from backend.job_queue import JobQueue
 
 
 # --- _normalize_support_mode ---
@@ -114,7 +124,20 @@ def client() -> TestClient:
     return TestClient(app)
 
 
-def test_webhook_accepts_message_created_incoming(client: TestClient) -> None:
+@pytest.fixture(autouse=True)
+def job_queue(tmp_path, monkeypatch: pytest.MonkeyPatch) -> JobQueue:
+    """Свежая очередь webhook на временной SQLite для каждого теста."""
+    q = JobQueue(tmp_path / "jobs.sqlite3", chatwoot_webhook._run_job, workers=1, retry_backoff=0.0)
+    q.start()
+    monkeypatch.setattr(chatwoot_webhook, "_job_queue", q)
+    monkeypatch.setattr(chatwoot_webhook, "_seen_messages", SeenSet())
+    monkeypatch.setattr(chatwoot_webhook, "DEBOUNCE_SEC", 0.0)
+    monkeypatch.setattr(chatwoot_webhook, "PLACEHOLDER_DELAY_SEC", 0.0)
+    yield q
+    q.stop()
+
+
+def test_webhook_accepts_message_created_incoming(client: TestClient, job_queue: JobQueue) -> None:
     set_reply_provider(lambda msg: "Reply" if msg else None)
     with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
         "backend.chatwoot_webhook.post_message", return_value={"id": 1}
@@ -128,6 +151,7 @@ def test_webhook_accepts_message_created_incoming(client: TestClient) -> None:
                 "conversation": {"id": 42, "custom_attributes": {"support_mode": "bot"}},
             },
         )
+        assert job_queue.wait_idle(5)
     assert r.status_code == 200
     assert r.json() == {"status": "ok"}
 
@@ -155,7 +179,7 @@ def test_webhook_skips_outgoing(client: TestClient) -> None:
     assert r.json() == {"status": "ok"}
 
 
-def test_webhook_process_posts_bot_reply(client: TestClient) -> None:
+def test_webhook_process_posts_bot_reply(client: TestClient, job_queue: JobQueue) -> None:
     set_reply_provider(lambda msg: f"Echo: {msg}")
     with patch("backend.chatwoot_webhook.is_configured", return_value=True) as mock_cfg, patch(
         "backend.chatwoot_webhook.post_message", return_value={"id": 1}
@@ -169,6 +193,7 @@ def test_webhook_process_posts_bot_reply(client: TestClient) -> None:
                 "conversation": {"id": 99, "custom_attributes": {"support_mode": "bot"}},
             },
         )
+        assert job_queue.wait_idle(5)
     assert r.status_code == 200
     assert mock_post.call_count == 2
     first_call = mock_post.call_args_list[0]
@@ -181,6 +206,78 @@ def test_webhook_process_posts_bot_reply(client: TestClient) -> None:
     assert second_call[1]["private"] is False
 
 
+def test_app_startup_processes_job_recovered_after_crash(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from backend import main
+
+    path = tmp_path / "queue.sqlite3"
+    crashed = JobQueue(path, chatwoot_webhook._run_job)
+    crashed.enqueue(
+        {
+            "event": "message_created",
+            "message_type": "incoming",
+            "content": "Question before crash",
+            "conversation": {"id": 7, "custom_attributes": {"support_mode": "bot"}},
+        }
+    )
+    crashed._conn.execute("UPDATE jobs SET status = 'running'")  # процесс упал посреди обработки
+    crashed.stop()
+    monkeypatch.setattr(chatwoot_webhook, "QUEUE_PATH", str(path))
+    monkeypatch.setattr(chatwoot_webhook, "_job_queue", None)
+    set_reply_provider(lambda msg: f"Echo: {msg}")
+    with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
+        "backend.chatwoot_webhook.post_message", return_value={"id": 1}
+    ) as mock_post:
+        with TestClient(main.app):  # ни одного нового webhook
+            q = chatwoot_webhook._job_queue
+            assert q is not None and q.wait_idle(5)
+            assert q.metrics()["processed"] == 1
+        assert chatwoot_webhook._job_queue is None  # воркеры остановлены при shutdown
+    assert "Echo: Question before crash" in mock_post.call_args_list[-1][0][1]
+
+
+def test_webhook_stream_posts_blocks_in_order(client: TestClient, job_queue: JobQueue) -> None:
+    set_reply_provider(lambda msg: "unused")
+    set_stream_reply_provider(lambda msg: iter(["Блок 1", "", "Блок 2", "Блок 3"]))
+    posted: list[str] = []
+
+    def slow_post(cid: int, content: str, *, private: bool = False) -> dict:
+        time.sleep(0.01)
+        posted.append(content)
+        return {"id": len(posted)}
+
+    try:
+        with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
+            "backend.chatwoot_webhook.STREAM_REPLY_ENABLED", True
+        ), patch("backend.chatwoot_webhook.post_message", side_effect=slow_post):
+            r = client.post(
+                "/chatwoot/webhook",
+                json={
+                    "event": "message_created",
+                    "message_type": "incoming",
+                    "content": "Вопрос",
+                    "conversation": {"id": 7, "custom_attributes": {"support_mode": "bot"}},
+                },
+            )
+            assert job_queue.wait_idle(5)
+    finally:
+        set_stream_reply_provider(None)
+    assert r.status_code == 200
+    assert posted == ["Блок 1", "Блок 2", "Блок 3"]
+
+
+def test_conversation_sender_stops_after_failed_post() -> None:
+    results = iter([{"id": 1}, None, {"id": 3}])
+    with patch("backend.chatwoot_webhook.post_message", side_effect=lambda *a, **kw: next(results)) as mock_post:
+        sender = ConversationSender(1, maxsize=1)
+        sender.submit("a")
+        sender.submit("b")
+        sender.close()
+        assert sender.failed
+        assert sender.submit("c") is False
+    assert sender.posted == 1
+    assert mock_post.call_count == 2
+
+
 # --- _is_email_only ---
 
 
@@ -229,7 +326,43 @@ def test_strip_html(text: str, expected: str) -> None:
     assert _strip_html(text).strip() == expected.strip()
 
 
-def test_webhook_skips_email_only_does_not_post(client: TestClient) -> None:
+@pytest.mark.parametrize("mode,stream", [("human", False), ("bot", False), ("bot", True)])
+def test_provider_calls_run_in_webhook_pool(
+    client: TestClient, job_queue: JobQueue, mode: str, stream: bool
+) -> None:
+    threads: list[str] = []
+
+    def provider(msg: str) -> str:
+        threads.append(threading.current_thread().name)
+        return "Ответ"
+
+    def stream_provider(msg: str):
+        threads.append(threading.current_thread().name)
+        yield "Блок"
+
+    set_reply_provider(provider)
+    set_stream_reply_provider(stream_provider)
+    try:
+        with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
+            "backend.chatwoot_webhook.STREAM_REPLY_ENABLED", stream
+        ), patch("backend.chatwoot_webhook.post_message", return_value={"id": 1}) as mock_post:
+            client.post(
+                "/chatwoot/webhook",
+                json={
+                    "event": "message_created",
+                    "message_type": "incoming",
+                    "content": "Вопрос",
+                    "conversation": {"id": 7, "custom_attributes": {"support_mode": mode}},
+                },
+            )
+            assert job_queue.wait_idle(5)
+    finally:
+        set_stream_reply_provider(None)
+    assert len(threads) == 1 and threads[0].startswith("pool-webhook")
+    assert mock_post.call_args_list[-1][1]["private"] is (mode == "human")
+
+
+def test_webhook_skips_email_only_does_not_post(client: TestClient, job_queue: JobQueue) -> None:
     """Сообщение только с email (Pre Chat Form) не уходит в RAG и не постится «не нашёл»."""
     set_reply_provider(lambda msg: "не нашёл" if "@" in msg else "OK")
     with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
@@ -245,11 +378,12 @@ def test_webhook_skips_email_only_does_not_post(client: TestClient) -> None:
                 "conversation": {"id": 5, "custom_attributes": {"support_mode": "bot"}},
             },
         )
+        assert job_queue.wait_idle(5)
     assert r.status_code == 200
     mock_post.assert_not_called()
 
 
-def test_webhook_skips_system_phrase_does_not_post(client: TestClient) -> None:
+def test_webhook_skips_system_phrase_does_not_post(client: TestClient, job_queue: JobQueue) -> None:
     """Служебная фраза виджета (Get notified by email) не уходит в RAG."""
     set_reply_provider(lambda msg: "не нашёл")
     with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
@@ -264,5 +398,181 @@ def test_webhook_skips_system_phrase_does_not_post(client: TestClient) -> None:
                 "conversation": {"id": 5, "custom_attributes": {"support_mode": "bot"}},
             },
         )
+        assert job_queue.wait_idle(5)
     assert r.status_code == 200
     mock_post.assert_not_called()
+
+
+def test_webhook_rejects_when_queue_full(client: TestClient, job_queue: JobQueue) -> None:
+    job_queue.max_depth = 0
+    r = client.post(
+        "/chatwoot/webhook",
+        json={
+            "event": "message_created",
+            "message_type": "incoming",
+            "content": "Вопрос",
+            "conversation": {"id": 3},
+        },
+    )
+    assert r.status_code == 503
+    assert job_queue.metrics()["rejected"] == 1
+
+
+def test_webhook_drops_redelivered_message(client: TestClient, job_queue: JobQueue) -> None:
+    set_reply_provider(lambda msg: f"Echo: {msg}")
+    body = {
+        "event": "message_created",
+        "message_type": "incoming",
+        "id": 555,
+        "account": {"id": 1},
+        "content": "Как загрузить видео?",
+        "conversation": {"id": 12, "custom_attributes": {"support_mode": "human"}},
+    }
+    with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
+        "backend.chatwoot_webhook.post_message", return_value={"id": 1}
+    ) as mock_post:
+        assert client.post("/chatwoot/webhook", json=body).status_code == 200
+        assert client.post("/chatwoot/webhook", json=body).status_code == 200
+        assert job_queue.wait_idle(5)
+    assert mock_post.call_count == 1
+    metrics = client.get("/chatwoot/queue").json()
+    assert metrics["dedupe"]["duplicates_dropped"] == 1
+    assert metrics["enqueued"] == 1
+
+
+def test_webhook_rejected_message_is_not_remembered(client: TestClient, job_queue: JobQueue) -> None:
+    body = {
+        "event": "message_created",
+        "message_type": "incoming",
+        "id": 777,
+        "content": "Вопрос",
+        "conversation": {"id": 3},
+    }
+    job_queue.max_depth = 0
+    assert client.post("/chatwoot/webhook", json=body).status_code == 503
+    job_queue.max_depth = 10
+    with patch("backend.chatwoot_webhook.is_configured", return_value=False):
+        assert client.post("/chatwoot/webhook", json=body).status_code == 200
+        assert job_queue.wait_idle(5)
+    assert job_queue.metrics()["enqueued"] == 1
+
+
+def test_webhook_debounces_rapid_messages_into_one_reply(
+    client: TestClient, job_queue: JobQueue, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(chatwoot_webhook, "DEBOUNCE_SEC", 0.3)
+    queries: list[str] = []
+    set_reply_provider(lambda msg: queries.append(msg) or "Ответ")
+    with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
+        "backend.chatwoot_webhook.post_message", return_value={"id": 1}
+    ) as mock_post:
+        for i, text in enumerate(("привет", "как добавить субтитры", "<p>к видео в плейлисте</p>")):
+            r = client.post(
+                "/chatwoot/webhook",
+                json={
+                    "event": "message_created",
+                    "message_type": "incoming",
+                    "id": 100 + i,
+                    "content": text,
+                    "conversation": {"id": 8, "custom_attributes": {"support_mode": "human"}},
+                },
+            )
+            assert r.status_code == 200
+        time.sleep(0.4)
+        assert job_queue.wait_idle(5)
+    assert queries == ["привет как добавить субтитры к видео в плейлисте"]
+    assert mock_post.call_count == 1
+    assert job_queue.metrics()["superseded"] == 2
+
+
+def test_merge_jobs_skips_email_and_keeps_latest_metadata() -> None:
+    older = {"id": 1, "content": "hh@jd.com", "content_type": "text", "conversation": {"id": 1}}
+    newer = {"id": 2, "content": "Как загрузить видео?", "conversation": {"id": 1, "custom_attributes": {"support_mode": "bot"}}}
+    merged = _merge_jobs(older, newer)
+    assert merged["content"] == "Как загрузить видео?"
+    assert merged["conversation"]["custom_attributes"] == {"support_mode": "bot"}
+    assert merged["merged_ids"] == [1, 2]
+
+
+def _post_bot_question(client: TestClient, cid: int) -> None:
+    r = client.post(
+        "/chatwoot/webhook",
+        json={
+            "event": "message_created",
+            "message_type": "incoming",
+            "content": "Вопрос",
+            "conversation": {"id": cid, "custom_attributes": {"support_mode": "bot"}},
+        },
+    )
+    assert r.status_code == 200
+
+
+def test_placeholder_skipped_when_reply_is_fast(
+    client: TestClient, job_queue: JobQueue, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(chatwoot_webhook, "PLACEHOLDER_DELAY_SEC", 0.5)
+    set_reply_provider(lambda msg: "Быстрый ответ")
+    with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
+        "backend.chatwoot_webhook.post_message", return_value={"id": 1}
+    ) as mock_post:
+        _post_bot_question(client, 21)
+        assert job_queue.wait_idle(5)
+    assert [c[0][1] for c in mock_post.call_args_list] == ["Быстрый ответ"]
+
+
+def test_placeholder_posted_before_slow_reply(
+    client: TestClient, job_queue: JobQueue, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(chatwoot_webhook, "PLACEHOLDER_DELAY_SEC", 0.05)
+    set_reply_provider(lambda msg: time.sleep(0.2) or "Медленный ответ")
+    with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
+        "backend.chatwoot_webhook.post_message", return_value={"id": 1}
+    ) as mock_post:
+        _post_bot_question(client, 22)
+        assert job_queue.wait_idle(5)
+    assert [c[0][1] for c in mock_post.call_args_list] == [AUTO_REPLY_PLACEHOLDER, "Медленный ответ"]
+
+
+def test_slim_job_keeps_only_needed_fields() -> None:
+    body = {
+        "event": "message_created",
+        "message_type": "incoming",
+        "id": 9,
+        "account": {"id": 2, "name": "Kinescope"},
+        "content": "Вопрос",
+        "sender": {"id": 1, "email": "a@b.c"},
+        "contact": {"custom_attributes": {"support_mode": "bot", "plan": "pro"}},
+        "conversation": {
+            "id": "31",
+            "messages": [{"id": 1}] * 50,
+            "custom_attributes": {"support_mode": "AI агент", "other": 1},
+        },
+    }
+    job = _slim_job(body)
+    assert job == {
+        "id": 9,
+        "account_id": 2,
+        "content": "Вопрос",
+        "content_type": "text",
+        "conversation": {"id": 31, "custom_attributes": {"support_mode": "AI агент"}},
+        "contact": {"custom_attributes": {"support_mode": "bot"}},
+    }
+    payload = WebhookPayload(**job)
+    assert _support_mode(payload) == "bot"
+    assert _conversation_id(payload) == 31
+
+
+def test_webhook_invalid_json_is_acknowledged(client: TestClient, job_queue: JobQueue) -> None:
+    r = client.post("/chatwoot/webhook", content=b"{not json", headers={"Content-Type": "application/json"})
+    assert r.status_code == 200
+    assert job_queue.metrics()["enqueued"] == 0
+
+
+def test_rate_limited_log_suppresses_and_reports(caplog: pytest.LogCaptureFixture) -> None:
+    import logging
+
+    log = _RateLimitedLog(logging.getLogger("test.ratelimit"), max_per_interval=2, interval=60)
+    with caplog.at_level(logging.INFO, logger="test.ratelimit"):
+        for i in range(5):
+            log.info("chatwoot.webhook", n=i)
+    assert [r.getMessage() for r in caplog.records] == ["chatwoot.webhook n=0", "chatwoot.webhook n=1"]
@@ -0,0 +1,44 @@
+"""
+Tests for scripts/collection_export.py: binary export round trip, checksum verification, legacy JSONL.
+"""
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+import collection_export  # noqa: E402
+
+
+def test_binary_export_round_trip_and_verify(tmp_path) -> None:
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(10, 8)).astype(np.float32)
+    writer = collection_export.ExportWriter(tmp_path / "exp", dim=8)
+    for i, vec in enumerate(vectors):
+        writer.add(f"id-{i}", vec, {"content": f"чанк {i}"})
+    manifest = writer.finish(model="m", vector_name="v")
+    assert manifest["count"] == 10 and manifest["dim"] == 8
+    assert collection_export.read_manifest(tmp_path / "exp") == manifest
+    assert collection_export.verify_export(tmp_path / "exp", manifest) == []
+
+    batches = list(collection_export.iter_export_batches(tmp_path / "exp", 4, manifest))
+    assert [len(ids) for ids, _, _ in batches] == [4, 4, 2]
+    assert [pid for ids, _, _ in batches for pid in ids] == [f"id-{i}" for i in range(10)]
+    assert np.array_equal(np.concatenate([v for _, v, _ in batches]), vectors)
+    assert batches[2][2][1] == {"content": "чанк 9"}
+
+    with open(tmp_path / "exp" / collection_export.VECTORS_FILE, "r+b") as f:
+        f.write(b"\0\0\0\0")
+    assert collection_export.verify_export(tmp_path / "exp", manifest) == ["vectors.f32: sha256 не совпадает"]
+
+
+def test_legacy_jsonl_is_streamed_in_batches(tmp_path) -> None:
+    path = tmp_path / "export.jsonl"
+    lines = [{"id": str(i), "vector": [float(i)] * 3, "payload": {"n": i}} for i in range(5)]
+    path.write_text("\n".join(json.dumps(x) for x in lines) + "\n", encoding="utf-8")
+    batches = list(collection_export.iter_export_batches(path, 2, vector_name="v"))
+    assert [ids for ids, _, _ in batches] == [["0", "1"], ["2", "3"], ["4"]]
+    assert batches[1][1].dtype == np.float32 and batches[1][1][1].tolist() == [3.0, 3.0, 3.0]
@@ -0,0 +1,194 @@
+"""
+Tests for scripts/crawl_docs.py against a local HTTP server: link discovery, retries, rate limit,
+conditional recrawl through the manifest (ETag / sitemap lastmod), resume from a checkpoint,
+equivalence of HTML extractors.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("markdownify")
+pytest.importorskip("httpx")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+import crawl_docs  # noqa: E402
+from crawl_manifest import CrawlManifest, acknowledge_changes, read_changes, write_changes  # noqa: E402
+
+PAGES = {
+    "/": '<main><h1>Home</h1><a href="/a">A</a><a href="/b/">B</a><a href="https://other.example/x">ext</a></main>',
+    "/a": '<main><h1>Page A</h1><a href="/b">B</a><a href="/missing">gone</a></main>',
+    "/b": '<main><h1>Page B</h1><a href="/flaky">flaky</a></main>',
+    "/flaky": "<main><h1>Flaky</h1></main>",
+}
+
+
+@pytest.fixture
+def site():
+    hits: dict[str, int] = {}
+    pages = dict(PAGES)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            path = self.path.rstrip("/") or "/"
+            with lock:
+                hits[path] = hits.get(path, 0) + 1
+                count = hits[path]
+            if path == "/flaky" and count == 1:
+                self.send_response(503)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            body = pages.get(path)
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = body.encode() if path == "/sitemap.xml" else f"<html><body>{body}</body></html>".encode()
+            etag = '"' + hashlib.md5(data).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", hits, pages
+    server.shutdown()
+    server.server_close()
+
+
+def test_crawl_follows_internal_links_and_retries(site, tmp_path) -> None:
+    root, hits, _ = site
+    result = crawl_docs.crawl(root=root, concurrency=4, rate=0, retries=2, backoff=0.01, output_dir=tmp_path)
+    assert sorted(result.changed) == ["a/index.md", "b/index.md", "flaky/index.md", "index/index.md"]
+    page_a = (tmp_path / "a" / "index.md").read_text(encoding="utf-8")
+    assert page_a.startswith(f"# Source: {root}/a\n") and "# Page A" in page_a
+    # 503 повторён, 404 не повторяется, каждая страница запрошена один раз (кроме повтора)
+    assert hits["/flaky"] == 2
+    assert hits["/missing"] == 1
+    assert hits["/a"] == hits["/b"] == 1
+
+
+def test_host_rate_limiter_spaces_requests() -> None:
+    limiter = crawl_docs.HostRateLimiter(rate=20)
+
+    async def run() -> float:
+        t0 = time.monotonic()
+        await asyncio.gather(*(limiter.wait("h") for _ in range(5)), limiter.wait("other"))
+        return time.monotonic() - t0
+
+    # 5 запросов к одному хосту при 20 rps — не быстрее 4 интервалов по 50 мс
+    assert asyncio.run(run()) >= 0.19
+
+
+def _crawl(root: str, manifest: CrawlManifest, out: Path, **kwargs) -> crawl_docs.CrawlResult:
+    return crawl_docs.crawl(root=root, rate=0, retries=2, backoff=0.01, manifest=manifest, output_dir=out, **kwargs)
+
+
+def test_recrawl_is_conditional_and_rewrites_only_changed_pages(site, tmp_path) -> None:
+    root, hits, pages = site
+    out = tmp_path / "docs_crawl"
+    manifest = CrawlManifest(out / ".manifest.sqlite3")
+
+    first = _crawl(root, manifest, out, use_sitemap=False)
+    assert len(first.changed) == 4 and first.fetched == 4
+
+    # Ничего не изменилось: на все страницы 304, файлы не переписываются, ссылки — из манифеста
+    second = _crawl(root, manifest, out, use_sitemap=False)
+    assert second.changed == [] and second.not_modified == 4 and second.fetched == 0
+
+    pages["/a"] = '<main><h1>Page A v2</h1><a href="/b">B</a></main>'
+    third = _crawl(root, manifest, out, use_sitemap=False)
+    assert third.changed == ["a/index.md"]
+    assert "Page A v2" in (out / "a" / "index.md").read_text(encoding="utf-8")
+
+    # sitemap с lastmod раньше последней загрузки — страницы не запрашиваются вовсе
+    pages["/sitemap.xml"] = (
+        '<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        + "".join(f"<url><loc>{root}{p}</loc><lastmod>2020-01-01</lastmod></url>" for p in ("/", "/a", "/b", "/flaky"))
+        + "</urlset>"
+    )
+    before = dict(hits)
+    fourth = _crawl(root, manifest, out)
+    assert fourth.skipped == 4 and fourth.changed == []
+    assert {p: n - before.get(p, 0) for p, n in hits.items() if n != before.get(p, 0)} == {"/sitemap.xml": 1}
+
+    write_changes(out, third.changed, [])
+    assert list(read_changes(out)["changed"]) == ["a/index.md"]
+    manifest.close()
+
+
+def test_changes_accumulate_until_the_indexer_acknowledges_them(site, tmp_path) -> None:
+    root, _, pages = site
+    out = tmp_path / "docs_crawl"
+    manifest = CrawlManifest(out / ".manifest.sqlite3")
+    first = _crawl(root, manifest, out, use_sitemap=False)
+    write_changes(out, first.changed, [])
+    # Второй краул без индексации между ними: ничего нового, но изменения первого не теряются
+    second = _crawl(root, manifest, out, use_sitemap=False)
+    assert second.changed == []
+    write_changes(out, second.changed, [])
+    snapshot = read_changes(out)
+    assert sorted(snapshot["changed"]) == ["a/index.md", "b/index.md", "flaky/index.md", "index/index.md"]
+
+    # Краул во время индексации: его запись новее снимка и переживает подтверждение
+    pages["/b"] = "<main><h1>Page B v2</h1></main>"
+    write_changes(out, _crawl(root, manifest, out, use_sitemap=False).changed, ["old/index.md"])
+    acknowledge_changes(out, snapshot)
+    left = read_changes(out)
+    assert list(left["changed"]) == ["b/index.md"] and list(left["removed"]) == ["old/index.md"]
+    acknowledge_changes(out, left)
+    assert read_changes(out) is not None and not read_changes(out)["changed"] and not read_changes(out)["removed"]
+    manifest.close()
+
+
+def test_resume_continues_from_checkpoint(site, tmp_path) -> None:
+    root, hits, _ = site
+    out = tmp_path / "docs_crawl"
+    manifest = CrawlManifest(out / ".manifest.sqlite3")
+    # Прерванный краул: корень обработан и записан, его ссылки в очереди
+    crawl_docs.save_page(root + "/", "index", "# Home", out)
+    manifest.checkpoint([root + "/a", root + "/b"], [(root + "/", "index/index.md")])
+
+    result = _crawl(root, manifest, out, use_sitemap=False, resume=True, checkpoint_every=1)
+    assert "/" not in hits
+    assert result.resumed == 1
+    assert sorted(result.changed) == ["a/index.md", "b/index.md", "flaky/index.md", "index/index.md"]
+    # Краул завершён — контрольная точка очищена, следующий --resume начнёт с начала
+    assert manifest.load_checkpoint() == ([], set(), [])
+    manifest.close()
+
+
+def test_lxml_extractor_matches_html_parser() -> None:
+    pytest.importorskip("lxml")
+    html = (
+        "<html><head><script>var x;</script></head><body><header><a href='/h'>h</a></header>"
+        "<main><h1>Title</h1><p>Text <b>bold</b> &amp; <a href='/x/'>link</a></p>"
+        "<ul><li>one</li><li>two <code>c</code></li></ul><pre><code>x = 1\ny</code></pre>"
+        "<table><tr><th>a</th></tr><tr><td>1</td></tr></table></main></body></html>"
+    )
+    root = "https://docs.example"
+    reference = crawl_docs.parse_page(html, root + "/p", root, "html.parser")
+    assert crawl_docs.parse_page(html, root + "/p", root, "lxml") == reference
+    assert reference[0] == {root + "/h", root + "/x"}
+    assert reference[1].startswith("# Title\n")
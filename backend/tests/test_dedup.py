@@ -0,0 +1,72 @@
+"""
+Tests for scripts/dedup.py: exact and near duplicates, distinct chunks, alt_sources merge across pages.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+from dedup import ChunkDeduplicator, NearDuplicateIndex, signature, similarity  # noqa: E402
+
+NOTE = (
+    "Обратите внимание: после загрузки видео Kinescope автоматически создаёт несколько качеств, "
+    "обработка занимает от нескольких минут до часа в зависимости от длительности ролика. "
+    "Пока видео обрабатывается, плеер показывает заставку, а ссылка на видео уже работает. "
+    "Статус обработки виден в карточке видео и приходит в вебхуке media.update."
+)
+# то же примечание с одной правкой в конце
+NOTE_EDITED = NOTE.replace("media.update", "media.updated")
+OTHER = (
+    "Чтобы ограничить просмотр по доменам, откройте настройки проекта, раздел «Безопасность», "
+    "и добавьте домены сайтов, на которых разрешено встраивать плеер. Остальные сайты получат ошибку."
+)
+
+
+def test_exact_duplicate_returns_first_key() -> None:
+    index = NearDuplicateIndex()
+    assert index.add("a", NOTE) is None
+    assert index.add("b", NOTE) == "a"
+    assert len(index) == 1
+
+
+def test_near_duplicate_is_detected() -> None:
+    assert similarity(signature(NOTE), signature(NOTE_EDITED)) >= 0.85
+    index = NearDuplicateIndex()
+    assert index.add("a", NOTE) is None
+    assert index.add("b", NOTE_EDITED) == "a"
+
+
+def test_distinct_chunks_are_kept() -> None:
+    assert similarity(signature(NOTE), signature(OTHER)) < 0.5
+    index = NearDuplicateIndex()
+    assert index.add("a", NOTE) is None
+    assert index.add("b", OTHER) is None
+    assert len(index) == 2
+
+
+def test_threshold_one_keeps_near_duplicates() -> None:
+    index = NearDuplicateIndex(threshold=1.0)
+    assert index.add("a", NOTE) is None
+    assert index.add("b", NOTE_EDITED) is None
+    assert index.add("c", NOTE) == "a"
+
+
+def test_alt_sources_merge_across_pages() -> None:
+    dedup = ChunkDeduplicator()
+    assert dedup.add("p1", "docs/upload.md", NOTE)
+    assert dedup.add("p2", "docs/security.md", OTHER)
+    assert not dedup.add("p3", "docs/api/media.md", NOTE_EDITED)
+    assert not dedup.add("p4", "docs/player.md", NOTE)
+    assert not dedup.add("p5", "docs/player.md", NOTE)
+    assert dedup.alt_sources == {"p1": {"docs/api/media.md", "docs/player.md"}}
+    assert (dedup.cross_page, dedup.same_page) == (3, 0)
+    assert len(dedup) == 2
+
+
+def test_duplicates_within_a_page_are_counted_not_merged() -> None:
+    dedup = ChunkDeduplicator()
+    assert dedup.add("p1", "docs/upload.md", NOTE)
+    assert not dedup.add("p2", "docs/upload.md", NOTE_EDITED)
+    assert dedup.alt_sources == {}
+    assert (dedup.cross_page, dedup.same_page) == (0, 1)
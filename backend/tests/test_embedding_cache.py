@@ -0,0 +1,72 @@
+"""
+Tests for scripts/embedding_cache.py: round trip, reopen, torn tail after a crash mid-append.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+from embedding_cache import EmbeddingCache  # noqa: E402
+
+
+def test_round_trip_and_reopen(tmp_path) -> None:
+    cache = EmbeddingCache("org/model", 4, tmp_path)
+    assert cache.put_many(["a", "b", "a"], [[1, 2, 3, 4], [5, 6, 7, 8], [9, 9, 9, 9]]) == 2
+    assert cache.put_many(["b", "c"], [[0, 0, 0, 0], [1, 1, 1, 1]]) == 1
+    got = cache.get_many(["a", "b", "c", "missing"])
+    assert set(got) == {"a", "b", "c"}
+    assert got["a"].tolist() == [1, 2, 3, 4] and got["b"].tolist() == [5, 6, 7, 8]
+    assert (cache.hits, cache.misses) == (3, 1)
+    cache.close()
+
+    reopened = EmbeddingCache("org/model", 4, tmp_path)
+    assert len(reopened) == 3 and "c" in reopened
+    assert reopened.get_many(["c"])["c"].tolist() == [1, 1, 1, 1]
+    reopened.close()
+
+
+def test_torn_tail_is_truncated_on_open(tmp_path) -> None:
+    cache = EmbeddingCache("m", 4, tmp_path)
+    cache.put_many(["a"], [[7, 7, 7, 7]])
+    vectors_path = cache.dir / "vectors.f32"
+    cache.close()
+    # Падение посреди записи: половина вектора в файле, строки индекса нет
+    with open(vectors_path, "ab") as f:
+        f.write(np.array([7, 7], dtype=np.float32).tobytes())
+
+    cache = EmbeddingCache("m", 4, tmp_path)
+    assert vectors_path.stat().st_size == 4 * 4
+    cache.put_many(["b"], [[0, 1, 2, 3]])
+    got = cache.get_many(["a", "b"])
+    assert got["a"].tolist() == [7, 7, 7, 7] and got["b"].tolist() == [0, 1, 2, 3]
+    cache.close()
+
+
+def test_index_rows_past_end_of_file_are_dropped(tmp_path) -> None:
+    cache = EmbeddingCache("m", 2, tmp_path)
+    cache.put_many(["a", "b"], [[1, 1], [2, 2]])
+    vectors_path = cache.dir / "vectors.f32"
+    cache.close()
+    with open(vectors_path, "r+b") as f:
+        f.truncate(2 * 4 + 3)  # второй вектор оборван
+
+    cache = EmbeddingCache("m", 2, tmp_path)
+    assert "a" in cache and "b" not in cache
+    cache.put_many(["b"], [[3, 3]])
+    assert cache.get_many(["b"])["b"].tolist() == [3, 3]
+    cache.close()
+
+
+def test_replace_overwrites_cached_vector(tmp_path) -> None:
+    cache = EmbeddingCache("m", 2, tmp_path)
+    cache.put_many(["a"], [[1, 1]])
+    assert cache.put_many(["a"], [[2, 2]]) == 0
+    assert cache.put_many(["a"], [[3, 3]], replace=True) == 1
+    assert cache.get_many(["a"])["a"].tolist() == [3, 3]
+    cache.close()
+    reopened = EmbeddingCache("m", 2, tmp_path)
+    assert reopened.get_many(["a"])["a"].tolist() == [3, 3]
+    reopened.close()
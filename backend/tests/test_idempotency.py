@@ -0,0 +1,50 @@
+"""
+Tests for SeenSet: duplicates, TTL expiry, size bound and persistence across restarts.
+"""
+from __future__ import annotations
+
+import time
+
+from backend.idempotency import SeenSet
+
+
+def test_duplicate_is_detected() -> None:
+    seen = SeenSet()
+    assert seen.add_if_new("1:2:3") is True
+    assert seen.add_if_new("1:2:3") is False
+    assert seen.add_if_new("1:2:4") is True
+    assert seen.metrics()["duplicates_dropped"] == 1
+
+
+def test_keys_expire_after_ttl() -> None:
+    seen = SeenSet(ttl=0.05)
+    assert seen.add_if_new("k")
+    time.sleep(0.06)
+    assert seen.add_if_new("k")
+
+
+def test_size_is_bounded() -> None:
+    seen = SeenSet(max_size=2)
+    for k in ("a", "b", "c"):
+        seen.add_if_new(k)
+    assert len(seen) == 2
+    assert seen.metrics()["evicted"] == 1
+    assert seen.add_if_new("a") is True
+
+
+def test_discard_forgets_key() -> None:
+    seen = SeenSet()
+    seen.add_if_new("k")
+    seen.discard("k")
+    assert seen.add_if_new("k") is True
+
+
+def test_persistent_keys_survive_restart(tmp_path) -> None:
+    path = tmp_path / "seen.sqlite3"
+    seen = SeenSet(path=path)
+    seen.add_if_new("1:2:3")
+    seen.close()
+    restored = SeenSet(path=path)
+    assert restored.add_if_new("1:2:3") is False
+    assert restored.metrics()["persistent"] is True
+    restored.close()
@@ -0,0 +1,79 @@
+"""
+Tests for index_to_qdrant.chunk_by_tokens: token budget per chunk, overlap between neighbours,
+over-long sentences and paragraphs. Token count is a plain word count.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+pytest.importorskip("fastembed")
+pytest.importorskip("qdrant_client")
+from index_to_qdrant import chunk_by_tokens  # noqa: E402
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def _section(lines: int, words_per_line: int = 9) -> str:
+    return "## Раздел\n\n" + "\n".join(
+        f"строка{i} " + " ".join(f"слово{i}_{j}" for j in range(words_per_line - 1)) for i in range(lines)
+    )
+
+
+def test_short_block_is_one_chunk_and_tiny_blocks_are_dropped() -> None:
+    text = "## Большой\n\n" + "один два три четыре пять шесть семь восемь девять десять" + "\n\n## Мелкий\n\nкоротко"
+    chunks = chunk_by_tokens(text, count_words, max_tokens=64, overlap_tokens=8)
+    assert [h for h, _ in chunks] == ["Большой"]
+    assert chunks[0][1].startswith("## Большой\n")
+
+
+def test_every_chunk_fits_the_token_budget() -> None:
+    chunks = chunk_by_tokens(_section(40), count_words, max_tokens=52, overlap_tokens=12)
+    assert len(chunks) > 1
+    assert all(h == "Раздел" for h, _ in chunks)
+    assert all(count_words(c) <= 52 - 2 for _, c in chunks)
+    # все строки блока попали хотя бы в один чанк
+    covered = {line for _, c in chunks for line in c.split("\n")}
+    assert all(f"строка{i} " + " ".join(f"слово{i}_{j}" for j in range(8)) in covered for i in range(40))
+
+
+def test_next_chunk_starts_with_tail_lines_of_previous() -> None:
+    chunks = chunk_by_tokens(_section(40), count_words, max_tokens=52, overlap_tokens=12)
+    for (_, prev), (_, nxt) in zip(chunks, chunks[1:]):
+        prev_lines, next_lines = prev.split("\n"), nxt.split("\n")
+        shared = [line for line in next_lines if line in prev_lines]
+        assert shared, "no overlap between neighbouring chunks"
+        assert shared == prev_lines[-len(shared) :] == next_lines[: len(shared)]
+        assert sum(count_words(line) for line in shared) <= 12
+
+
+def test_zero_overlap_does_not_repeat_lines() -> None:
+    chunks = chunk_by_tokens(_section(40), count_words, max_tokens=52, overlap_tokens=0)
+    lines = [line for _, c in chunks for line in c.split("\n")]
+    assert len(lines) == len(set(lines))
+
+
+def test_overlong_sentence_is_split_by_words() -> None:
+    words = [f"w{i}" for i in range(300)]
+    text = "## Длинное\n\n" + " ".join(words)
+    chunks = chunk_by_tokens(text, count_words, max_tokens=66, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert all(count_words(c) <= 64 for _, c in chunks)
+    got = [w for _, c in chunks for w in c.split() if w not in ("##", "Длинное")]
+    assert got == words
+
+
+def test_overlong_paragraph_is_split_by_sentences() -> None:
+    sentences = [f"Предложение номер {i} " + " ".join(f"о{i}_{j}" for j in range(10)) + "." for i in range(20)]
+    text = "## Абзац\n\n" + " ".join(sentences)
+    chunks = chunk_by_tokens(text, count_words, max_tokens=42, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert all(count_words(c) <= 40 for _, c in chunks)
+    pieces = [p for _, c in chunks for p in c.split("\n") if not p.startswith("##")]
+    # абзац режется по границам предложений, а не посреди них
+    assert pieces == sentences
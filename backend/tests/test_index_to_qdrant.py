@@ -0,0 +1,236 @@
+"""
+Tests for scripts/index_to_qdrant.py end to end: in-memory Qdrant, a stub embedder instead of fastembed,
+docs_crawl and the embedding cache in tmp_path.
+"""
+from __future__ import annotations
+
+import functools
+import sys
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+pytest.importorskip("fastembed")
+pytest.importorskip("qdrant_client")
+from qdrant_client import QdrantClient  # noqa: E402
+
+import index_to_qdrant  # noqa: E402
+import qdrant_versions  # noqa: E402
+from embedding_cache import EmbeddingCache  # noqa: E402
+
+pytestmark = pytest.mark.filterwarnings("ignore:Payload indexes have no effect")
+
+NOTE = (
+    "## Обработка видео\n\n"
+    "После загрузки Kinescope создаёт несколько качеств, обработка занимает от нескольких минут до часа. "
+    "Пока видео обрабатывается, плеер показывает заставку, а ссылка на видео уже работает."
+)
+
+
+class StubEmbedder:
+    """Вместо fastembed: детерминированный вектор по тексту, тексты всех вызовов — в embedded."""
+
+    def __init__(self) -> None:
+        self.embedded: list[str] = []
+
+    def embed(self, texts: Iterable[str], **_: Any) -> Iterator[list[float]]:
+        for text in texts:
+            self.embedded.append(text)
+            vec = [0.0] * index_to_qdrant.VECTOR_SIZE
+            vec[len(text) % index_to_qdrant.VECTOR_SIZE] = 1.0
+            vec[-1] = 0.5
+            yield vec
+
+
+class Indexer:
+    def __init__(self, docs: Path, client: QdrantClient, embedder: StubEmbedder) -> None:
+        self.docs = docs
+        self.client = client
+        self.embedder = embedder
+
+    def write(self, rel: str, text: str) -> None:
+        path = self.docs / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+    def run(self, *args: str, monkeypatch: pytest.MonkeyPatch) -> None:
+        self.embedder.embedded.clear()
+        monkeypatch.setattr(sys, "argv", ["index_to_qdrant.py", "--skip-smoke", "--upsert-workers", "1", *args])
+        index_to_qdrant.main()
+
+    def points(self) -> dict[str, dict[str, Any]]:
+        """content → payload всех точек рабочей версии."""
+        collection = qdrant_versions.live_collection(self.client, index_to_qdrant.COLLECTION_NAME)
+        records, _ = self.client.scroll(collection_name=collection, limit=1000, with_payload=True)
+        return {r.payload["content"]: r.payload for r in records}
+
+
+@pytest.fixture
+def indexer(tmp_path, monkeypatch: pytest.MonkeyPatch) -> Indexer:
+    docs = tmp_path / "docs_crawl"
+    docs.mkdir()
+    client = QdrantClient(":memory:")
+    embedder = StubEmbedder()
+    monkeypatch.setattr(index_to_qdrant, "DOCS_DIR", docs)
+    monkeypatch.setattr(index_to_qdrant, "QdrantClient", lambda url: client)
+    monkeypatch.setattr(index_to_qdrant, "load_embedder", lambda *a, **kw: embedder)
+    monkeypatch.setattr(index_to_qdrant, "EmbeddingCache", functools.partial(EmbeddingCache, root=tmp_path / "cache"))
+    return Indexer(docs, client, embedder)
+
+
+def test_in_place_run_clears_alt_sources_when_duplicate_page_is_removed(
+    indexer: Indexer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    indexer.write("player/index.md", NOTE)
+    indexer.write("upload/index.md", NOTE)
+    indexer.run(monkeypatch=monkeypatch)
+    assert indexer.points()[NOTE]["alt_sources"] == ["https://docs.kinescope.ru/upload"]
+
+    (indexer.docs / "upload" / "index.md").unlink()
+    indexer.run("--in-place", monkeypatch=monkeypatch)
+    assert indexer.embedder.embedded == []  # точка та же, меняется только payload
+    assert indexer.points()[NOTE]["alt_sources"] == []
+
+
+def test_in_place_no_dedup_clears_alt_sources(indexer: Indexer, monkeypatch: pytest.MonkeyPatch) -> None:
+    indexer.write("player/index.md", NOTE)
+    indexer.write("upload/index.md", NOTE)
+    indexer.run(monkeypatch=monkeypatch)
+    indexer.run("--in-place", "--no-dedup", monkeypatch=monkeypatch)
+    sources = indexer.client.scroll(
+        collection_name=qdrant_versions.live_collection(indexer.client, index_to_qdrant.COLLECTION_NAME),
+        limit=100,
+        with_payload=True,
+    )[0]
+    assert sorted(r.payload["source"] for r in sources) == [
+        "https://docs.kinescope.ru/player",
+        "https://docs.kinescope.ru/upload",
+    ]
+    assert all(r.payload["alt_sources"] == [] for r in sources)
+
+
+PLAYER = "## Плеер\n\n" + "Встраивание плеера на сайт через iframe и настройка параметров.\n" * 3
+API_V1 = "## API\n\n" + "Загрузка видео через API: метод создаёт видео и возвращает ссылку.\n" * 3
+API_V2 = "## API\n\n" + "Загрузка видео через API v2: метод принимает файл по ссылке.\n" * 3
+
+
+def _vectors(indexer: Indexer) -> dict[str, list[float]]:
+    collection = qdrant_versions.live_collection(indexer.client, index_to_qdrant.COLLECTION_NAME)
+    records, _ = indexer.client.scroll(collection_name=collection, limit=1000, with_vectors=True)
+    return {str(r.id): r.vector[index_to_qdrant.VECTOR_NAME] for r in records}
+
+
+def test_upserter_error_reaches_main_thread() -> None:
+    class FailingClient:
+        def upsert(self, **_: Any) -> None:
+            raise ConnectionError("qdrant is down")
+
+    upserter = index_to_qdrant.Upserter(FailingClient(), "papers_v2", workers=2, queue_size=1)
+    with pytest.raises(RuntimeError, match="upsert failed") as exc:
+        for _ in range(10):
+            upserter.put([])
+        upserter.close()
+    assert isinstance(exc.value.__cause__, ConnectionError)
+    upserter.abort()
+
+
+def test_failed_upsert_drops_new_version_and_keeps_alias(indexer: Indexer, monkeypatch: pytest.MonkeyPatch) -> None:
+    indexer.write("player/index.md", PLAYER)
+    indexer.run(monkeypatch=monkeypatch)
+    indexer.write("api/index.md", API_V1)
+
+    def broken_upsert(**_: Any) -> None:
+        raise ConnectionError("qdrant is down")
+
+    monkeypatch.setattr(indexer.client, "upsert", broken_upsert)
+    with pytest.raises(RuntimeError, match="upsert failed"):
+        indexer.run("--no-cache", monkeypatch=monkeypatch)
+    assert qdrant_versions.resolve_alias(indexer.client, index_to_qdrant.COLLECTION_NAME) == "papers_v1"
+    assert sorted(c.name for c in indexer.client.get_collections().collections) == ["papers_v1"]
+
+
+def test_unchanged_chunks_are_copied_not_embedded(indexer: Indexer, monkeypatch: pytest.MonkeyPatch) -> None:
+    indexer.write("player/index.md", PLAYER)
+    indexer.write("api/index.md", API_V1)
+    indexer.run("--no-cache", monkeypatch=monkeypatch)
+    before = _vectors(indexer)
+
+    indexer.write("api/index.md", API_V2)
+    indexer.run("--no-cache", monkeypatch=monkeypatch)
+    assert indexer.embedder.embedded == [API_V2.strip()]
+    assert qdrant_versions.resolve_alias(indexer.client, index_to_qdrant.COLLECTION_NAME) == "papers_v2"
+    after = _vectors(indexer)
+    kept = before.keys() & after.keys()
+    assert len(kept) == 1
+    (pid,) = kept
+    assert after[pid] == pytest.approx(before[pid], abs=1e-6)  # вектор скопирован из v1
+    # старый фрагмент API в новую версию не попал
+    assert set(indexer.points()) == {PLAYER.strip(), API_V2.strip()}
+
+
+def test_in_place_run_deletes_stale_points(indexer: Indexer, monkeypatch: pytest.MonkeyPatch) -> None:
+    indexer.write("player/index.md", PLAYER)
+    indexer.write("api/index.md", API_V1)
+    indexer.run(monkeypatch=monkeypatch)
+    ids_before = set(_vectors(indexer))
+
+    indexer.write("api/index.md", API_V2)
+    (indexer.docs / "player" / "index.md").unlink()
+    indexer.run("--in-place", "--no-cache", monkeypatch=monkeypatch)
+    assert indexer.embedder.embedded == [API_V2.strip()]
+    assert set(indexer.points()) == {API_V2.strip()}
+    assert not ids_before & set(_vectors(indexer))
+    assert sorted(c.name for c in indexer.client.get_collections().collections) == ["papers_v1"]
+
+
+def test_cache_is_used_for_new_collection_and_full_ignores_it(
+    indexer: Indexer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    indexer.write("player/index.md", PLAYER)
+    indexer.write("api/index.md", API_V1)
+    indexer.run(monkeypatch=monkeypatch)
+    assert len(indexer.embedder.embedded) == 2
+
+    # пустой Qdrant: векторы берутся из кэша эмбеддингов
+    indexer.client = QdrantClient(":memory:")
+    monkeypatch.setattr(index_to_qdrant, "QdrantClient", lambda url: indexer.client)
+    indexer.run(monkeypatch=monkeypatch)
+    assert indexer.embedder.embedded == []
+
+    indexer.run("--full", monkeypatch=monkeypatch)
+    assert sorted(indexer.embedder.embedded) == sorted([PLAYER.strip(), API_V1.strip()])
+    assert set(indexer.points()) == {PLAYER.strip(), API_V1.strip()}
+
+
+def test_token_counter_reads_tokenizer_from_local_model_dir(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    tokenizers = pytest.importorskip("tokenizers")
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel({"[UNK]": 0, "видео": 1}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tokenizer.enable_truncation(2)
+    tokenizer.save(str(tmp_path / "tokenizer.json"))
+    calls: list[dict[str, Any]] = []
+
+    class LocalModel:
+        def __init__(self, **kwargs: Any) -> None:
+            calls.append(kwargs)
+            self.model = type("Onnx", (), {"_model_dir": tmp_path})()
+
+    monkeypatch.setattr(index_to_qdrant, "TextEmbedding", LocalModel)
+    count_tokens = index_to_qdrant.load_token_counter()
+    assert count_tokens("видео " * 10) == 10  # без усечения
+    assert calls[0]["local_files_only"] is True
+
+
+def test_tokens_chunking_falls_back_to_chars_without_tokenizer(
+    indexer: Indexer, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    def offline(**_: Any) -> None:
+        raise ValueError("Could not load model from any source.")
+
+    monkeypatch.setattr(index_to_qdrant, "TextEmbedding", offline)
+    indexer.write("player/index.md", PLAYER)
+    indexer.run("--chunking", "tokens", monkeypatch=monkeypatch)
+    assert "falling back to --chunking chars" in capsys.readouterr().err
+    assert set(indexer.points()) == {PLAYER.strip()}
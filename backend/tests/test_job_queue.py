@@ -0,0 +1,141 @@
+"""
+Tests for the durable SQLite job queue: processing, retries, dead-lettering, restart recovery.
+"""
+from __future__ import annotations
+
+import sqlite3
+import time
+
+from backend.job_queue import JobQueue
+
+
+def test_jobs_are_processed_and_removed(tmp_path) -> None:
+    seen: list[dict] = []
+    q = JobQueue(tmp_path / "q.sqlite3", seen.append, workers=2)
+    q.start()
+    try:
+        for i in range(5):
+            assert q.enqueue({"n": i}) is not None
+        assert q.wait_idle(5)
+        m = q.metrics()
+    finally:
+        q.stop()
+    assert sorted(j["n"] for j in seen) == list(range(5))
+    assert m["depth"] == 0 and m["processed"] == 5
+
+
+def test_failing_job_is_retried_then_dead_lettered(tmp_path) -> None:
+    calls: list[dict] = []
+
+    def handler(job: dict) -> None:
+        calls.append(job)
+        raise RuntimeError("boom")
+
+    q = JobQueue(tmp_path / "q.sqlite3", handler, workers=1, max_attempts=3, retry_backoff=0.0)
+    q.start()
+    try:
+        q.enqueue({"x": 1})
+        assert q.wait_idle(5)
+        m = q.metrics()
+    finally:
+        q.stop()
+    assert len(calls) == 3
+    assert m["dead"] == 1 and m["dead_lettered"] == 1 and m["retried"] == 2
+
+
+def test_overdue_handler_is_not_retried_while_running(tmp_path) -> None:
+    side_effects: list[int] = []
+
+    def slow_handler(job) -> None:
+        time.sleep(0.3)
+        side_effects.append(job["n"])  # например, ответ бота в Chatwoot — дублировать нельзя
+
+    q = JobQueue(tmp_path / "q.sqlite3", slow_handler, workers=1, job_timeout=0.05, max_attempts=3, retry_backoff=0)
+    q.start()
+    try:
+        q.enqueue({"n": 1})
+        time.sleep(0.15)
+        assert q.metrics()["running"] == 1  # просрочен, но ещё выполняется — не возвращён в очередь
+        assert q.wait_idle(5)
+        m = q.metrics()
+    finally:
+        q.stop()
+    assert side_effects == [1]
+    assert m["timeouts"] == 1 and m["processed"] == 1 and m["retried"] == 0
+
+
+def test_overdue_handler_that_fails_is_retried_after_it_exits(tmp_path) -> None:
+    calls: list[float] = []
+
+    def handler(job) -> None:
+        calls.append(time.monotonic())
+        time.sleep(0.1)
+        raise RuntimeError("boom")
+
+    q = JobQueue(tmp_path / "q.sqlite3", handler, workers=2, job_timeout=0.02, max_attempts=2, retry_backoff=0)
+    q.start()
+    try:
+        q.enqueue({})
+        assert q.wait_idle(5)
+        m = q.metrics()
+    finally:
+        q.stop()
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.1  # повтор — только после выхода первого запуска
+    assert m["timeouts"] == 2 and m["dead"] == 1
+
+
+def test_bounded_depth_rejects(tmp_path) -> None:
+    q = JobQueue(tmp_path / "q.sqlite3", lambda job: None, max_depth=2)
+    assert q.enqueue({}) is not None
+    assert q.enqueue({}) is not None
+    assert q.enqueue({}) is None
+    m = q.metrics()
+    assert m["depth"] == 2 and m["rejected"] == 1
+    assert m["oldest_pending_age_sec"] >= 0
+    q.stop()
+
+
+def test_interrupted_jobs_recovered_after_restart(tmp_path) -> None:
+    path = tmp_path / "q.sqlite3"
+    q = JobQueue(path, lambda job: None)
+    q.enqueue({"k": "v"})
+    q.stop()
+    # Имитируем падение процесса посреди обработки
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE jobs SET status = 'running'")
+    conn.commit()
+    conn.close()
+
+    seen: list[dict] = []
+    q2 = JobQueue(path, seen.append, workers=1)
+    q2.start()
+    try:
+        assert q2.wait_idle(5)
+    finally:
+        q2.stop()
+    assert seen == [{"k": "v"}]
+
+
+def test_delayed_job_waits_until_available(tmp_path) -> None:
+    seen: list[float] = []
+    q = JobQueue(tmp_path / "q.sqlite3", lambda job: seen.append(time.monotonic()), workers=1)
+    q.start()
+    try:
+        t0 = time.monotonic()
+        q.enqueue({}, delay=0.2)
+        time.sleep(0.3)
+        assert q.wait_idle(5)
+    finally:
+        q.stop()
+    assert seen and seen[0] - t0 >= 0.2
+
+
+def test_grouped_job_supersedes_pending_one(tmp_path) -> None:
+    q = JobQueue(tmp_path / "q.sqlite3", lambda job: None)
+    merge = lambda old, new: {"text": old["text"] + " " + new["text"]}  # noqa: E731
+    q.enqueue({"text": "a"}, delay=10, group_key="c1", merge=merge)
+    q.enqueue({"text": "b"}, delay=10, group_key="c1", merge=merge)
+    q.enqueue({"text": "x"}, delay=10, group_key="c2", merge=merge)
+    rows = q._conn.execute("SELECT payload, group_key FROM jobs ORDER BY id").fetchall()
+    q.stop()
+    assert rows == [('{"text": "a b"}', "c1"), ('{"text": "x"}', "c2")]
@@ -0,0 +1,50 @@
+"""
+Tests for bulkhead pools: admission limit, metrics, isolation between named pools, iterate().
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from backend.pools import Bulkhead, BulkheadFull, get_pool
+
+
+def test_rejects_when_workers_and_queue_are_busy() -> None:
+    pool = Bulkhead("t", max_workers=1, max_queue=1)
+    release = threading.Event()
+    f1 = pool.submit(release.wait, 5)
+    f2 = pool.submit(release.wait, 5)
+    with pytest.raises(BulkheadFull):
+        pool.submit(release.wait, 5)
+    m = pool.metrics()
+    assert m["rejected"] == 1 and m["active"] == 1 and m["queued"] == 1
+    release.set()
+    f1.result(5)
+    f2.result(5)
+    assert pool.metrics()["completed"] == 2
+    # После освобождения слоты снова доступны
+    assert pool.submit(lambda: 42).result(5) == 42
+
+
+def test_named_pools_are_isolated() -> None:
+    assert get_pool("chat") is get_pool("chat")
+    assert get_pool("chat") is not get_pool("webhook")
+
+
+def test_iterate_runs_generator_in_pool() -> None:
+    pool = Bulkhead("it", max_workers=1, max_queue=0)
+    threads: list[str] = []
+
+    def gen():
+        for i in range(3):
+            threads.append(threading.current_thread().name)
+            yield i
+
+    async def collect() -> list[int]:
+        return [x async for x in pool.iterate(gen())]
+
+    assert asyncio.run(collect()) == [0, 1, 2]
+    assert all(name.startswith("pool-it") for name in threads)
+    assert pool.metrics()["completed"] == 1
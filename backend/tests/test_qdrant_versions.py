@@ -0,0 +1,121 @@
+"""
+Tests for scripts/qdrant_versions.py against an in-memory Qdrant: version discovery, alias switch
+(including the legacy-collection migration), GC of old versions, live collection never dropped.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+pytest.importorskip("qdrant_client")
+from qdrant_client import QdrantClient  # noqa: E402
+from qdrant_client.models import PointStruct  # noqa: E402
+
+import qdrant_versions  # noqa: E402
+
+ALIAS = "papers"
+
+
+# payload-индексы в локальном Qdrant ни на что не влияют — предупреждение о них не интересно
+pytestmark = pytest.mark.filterwarnings("ignore:Payload indexes have no effect")
+
+
+@pytest.fixture
+def client() -> QdrantClient:
+    return QdrantClient(":memory:")
+
+
+def _names(client: QdrantClient) -> list[str]:
+    return sorted(c.name for c in client.get_collections().collections)
+
+
+def _build(client: QdrantClient) -> str:
+    """Собрать следующую версию и переключить на неё алиас, как index_to_qdrant.py."""
+    name = qdrant_versions.create_next_version(client, ALIAS)
+    qdrant_versions.switch_alias(client, ALIAS, name)
+    return name
+
+
+def test_versions_are_numbered_and_ignore_foreign_collections(client: QdrantClient) -> None:
+    client.create_collection("papers_v2_backup", vectors_config={})
+    client.create_collection("other_v7", vectors_config={})
+    assert qdrant_versions.create_next_version(client, ALIAS) == "papers_v1"
+    assert qdrant_versions.create_next_version(client, ALIAS) == "papers_v2"
+    assert qdrant_versions._versions(client, ALIAS) == [(1, "papers_v1"), (2, "papers_v2")]
+    assert qdrant_versions.live_collection(client, ALIAS) is None
+
+
+def test_first_run_creates_alias(client: QdrantClient) -> None:
+    assert qdrant_versions.resolve_alias(client, ALIAS) is None
+    name = _build(client)
+    assert name == "papers_v1"
+    assert qdrant_versions.resolve_alias(client, ALIAS) == "papers_v1"
+    assert qdrant_versions.live_collection(client, ALIAS) == "papers_v1"
+
+
+def test_second_run_switches_alias(client: QdrantClient) -> None:
+    _build(client)
+    v2 = qdrant_versions.create_next_version(client, ALIAS)
+    assert qdrant_versions.live_collection(client, ALIAS) == "papers_v1"  # пока собирается — поиск на v1
+    assert qdrant_versions.switch_alias(client, ALIAS, v2) == "papers_v1"
+    assert qdrant_versions.resolve_alias(client, ALIAS) == "papers_v2"
+    assert [a.alias_name for a in client.get_aliases().aliases] == [ALIAS]
+    assert _names(client) == ["papers_v1", "papers_v2"]  # старая версия остаётся до GC
+
+
+def test_switch_from_legacy_collection(client: QdrantClient) -> None:
+    qdrant_versions.create_collection(client, ALIAS)
+    assert qdrant_versions.live_collection(client, ALIAS) == ALIAS
+    v1 = qdrant_versions.create_next_version(client, ALIAS)
+    assert qdrant_versions.switch_alias(client, ALIAS, v1) is None
+    assert _names(client) == ["papers_v1"]
+    assert qdrant_versions.live_collection(client, ALIAS) == "papers_v1"
+
+
+@pytest.mark.parametrize(
+    "keep,remaining",
+    [
+        (0, ["papers_v4"]),
+        (1, ["papers_v3", "papers_v4"]),
+        (5, ["papers_v1", "papers_v2", "papers_v3", "papers_v4"]),
+    ],
+)
+def test_gc_keeps_current_and_n_previous(client: QdrantClient, keep: int, remaining: list[str]) -> None:
+    for _ in range(4):
+        _build(client)
+    removed = qdrant_versions.gc_versions(client, ALIAS, keep=keep)
+    assert _names(client) == remaining
+    assert removed == [f"papers_v{n}" for n in range(1, 5) if f"papers_v{n}" not in remaining]
+    assert qdrant_versions.resolve_alias(client, ALIAS) == "papers_v4"
+
+
+def test_gc_never_drops_live_or_newer_versions(client: QdrantClient) -> None:
+    _build(client)
+    _build(client)
+    # откат: алиас вернули на v1, а v3 ещё собирается параллельным запуском
+    qdrant_versions.switch_alias(client, ALIAS, "papers_v1")
+    qdrant_versions.create_next_version(client, ALIAS)
+    assert qdrant_versions.gc_versions(client, ALIAS, keep=0) == []
+    assert _names(client) == ["papers_v1", "papers_v2", "papers_v3"]
+
+
+def test_gc_without_alias_removes_nothing(client: QdrantClient) -> None:
+    qdrant_versions.create_next_version(client, ALIAS)
+    qdrant_versions.create_next_version(client, ALIAS)
+    assert qdrant_versions.gc_versions(client, ALIAS, keep=0) == []
+    assert _names(client) == ["papers_v1", "papers_v2"]
+
+
+def test_drop_version_refuses_live_collection(client: QdrantClient) -> None:
+    v1 = _build(client)
+    client.upsert(v1, [PointStruct(id=1, vector={qdrant_versions.VECTOR_NAME: [1.0] * qdrant_versions.VECTOR_SIZE})])
+    with pytest.raises(ValueError):
+        qdrant_versions.drop_version(client, v1)
+    assert client.count(v1).count == 1
+    v2 = qdrant_versions.create_next_version(client, ALIAS)
+    qdrant_versions.drop_version(client, v2)
+    qdrant_versions.drop_version(client, v2)  # уже удалена — не ошибка
+    assert _names(client) == ["papers_v1"]
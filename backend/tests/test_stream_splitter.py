@@ -0,0 +1,53 @@
+"""
+Tests for StreamBlockSplitter: incremental Chatwoot block delivery.
+"""
+from __future__ import annotations
+
+from backend.main import StreamBlockSplitter
+
+
+def _feed_all(splitter: StreamBlockSplitter, deltas: list[str]) -> list[str]:
+    blocks: list[str] = []
+    for d in deltas:
+        blocks.extend(splitter.feed(d))
+    rest = splitter.finish()
+    if rest:
+        blocks.append(rest)
+    return blocks
+
+
+def test_blocks_respect_min_max_and_keep_text() -> None:
+    text = " ".join(f"Предложение номер {i} про загрузку видео." for i in range(40))
+    blocks = _feed_all(StreamBlockSplitter(min_chars=120, max_chars=450), list(text))
+    assert len(blocks) > 1
+    for block in blocks[:-1]:
+        # _split_block обрезает пробелы по краям блока
+        assert 118 <= len(block) <= 450
+    assert " ".join(blocks).split() == text.split()
+
+
+def test_prefers_paragraph_boundary() -> None:
+    text = "а" * 80 + "\n\n" + "б" * 100 + "\n\n" + "в" * 30
+    blocks = _feed_all(StreamBlockSplitter(min_chars=50, max_chars=200), [text])
+    assert blocks[0] == "а" * 80 + "\n\n" + "б" * 100
+
+
+def test_sources_marker_split_across_deltas_stops_blocks() -> None:
+    splitter = StreamBlockSplitter(min_chars=10, max_chars=40)
+    assert splitter.feed("Короткий ответ. Исто") == ["Короткий ответ."]
+    assert splitter.feed("чники: https://docs.kinescope.ru/a") == []
+    assert splitter.sources_started
+    assert splitter.feed(" и ещё много текста после маркера источников") == []
+    assert splitter.finish().startswith("Источники: https://docs.kinescope.ru/a и ещё")
+
+
+def test_finish_drops_filler_before_sources() -> None:
+    splitter = StreamBlockSplitter(min_chars=1000, max_chars=2000)
+    splitter.feed("Ответ.\n\nТаким образом, всё просто.\n\nИсточники: https://docs.kinescope.ru/x")
+    assert splitter.finish() == "Ответ.\n\nИсточники: https://docs.kinescope.ru/x"
+
+
+def test_finish_without_clean_keeps_raw_tail() -> None:
+    splitter = StreamBlockSplitter(min_chars=1000, max_chars=2000)
+    splitter.feed("Ответ.\n\nТаким образом, всё.\n\nИсточник: x")
+    assert "Таким образом" in splitter.finish(clean=False)
@@ -6,19 +6,140 @@ MCP-сервер поиска в Qdrant. Использует общий мод
 from __future__ import annotations
 
 import asyncio
+import functools
+import os
+import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 import mcp.types as types
 from mcp.server.lowlevel import Server
 from mcp.server.stdio import stdio_server
 
-from rag.search import search as rag_search
+from rag.search import LIMIT_FIRST, search as rag_search, search_many as rag_search_many, warmup as rag_warmup
 
+# Отдельный пул под поиск: несколько find подряд от агента Cursor не упираются в дефолтный executor
+SEARCH_WORKERS = int(os.environ.get("MCP_SEARCH_WORKERS", "4"))
+# Максимум запросов в одном вызове qdrant-find-many
+MAX_BATCH_QUERIES = int(os.environ.get("MCP_MAX_BATCH_QUERIES", "10"))
+# Прогрев модели и Qdrant при старте (до первого вызова инструмента)
+WARMUP = os.environ.get("MCP_WARMUP", "true").lower() in ("1", "true", "yes")
 
-async def _search_async(query: str, limit: int = 5) -> str:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, rag_search, query)
+_executor = ThreadPoolExecutor(max_workers=max(1, SEARCH_WORKERS), thread_name_prefix="mcp-search")
+
+
+def _warmup() -> None:
+    # stdout занят протоколом MCP — пишем только в stderr
+    rag_warmup()
+    print("qdrant-papers: warmup done", file=sys.stderr, flush=True)
+
+
+def _report_warmup(future: asyncio.Future[None]) -> None:
+    """Done-callback прогрева: ошибка попадает в stderr сразу, а не как «exception was never retrieved» при GC."""
+    if future.cancelled():
+        return
+    exc = future.exception()
+    if exc is not None:
+        tb = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        print(f"qdrant-papers: warmup failed: {exc}\n{tb}", file=sys.stderr, flush=True)
+
+
+async def _search_async(
+    query: str,
+    limit: int | None = None,
+    limit_first: int | None = None,
+    alpha: float | None = None,
+    section: list[str] | None = None,
+    source: list[str] | None = None,
+) -> str:
+    loop = asyncio.get_running_loop()
+    call = functools.partial(
+        rag_search, query, limit_first=limit_first, limit_final=limit, alpha=alpha, section=section, source=source
+    )
+    return await loop.run_in_executor(_executor, call)
+
+
+async def _search_many_async(
+    queries: list[str],
+    limit: int | None = None,
+    limit_first: int | None = None,
+    alpha: float | None = None,
+    section: list[str] | None = None,
+    source: list[str] | None = None,
+) -> str:
+    loop = asyncio.get_running_loop()
+    call = functools.partial(
+        rag_search_many, queries, limit_first=limit_first, limit_final=limit, alpha=alpha, section=section, source=source
+    )
+    return await loop.run_in_executor(_executor, call)
+
+
+def _int_arg(arguments: dict[str, Any], name: str, lo: int, hi: int) -> int | None:
+    value = arguments.get(name)
+    if value is None:
+        return None
+    return max(lo, min(hi, int(value)))
+
+
+def _float_arg(arguments: dict[str, Any], name: str, lo: float, hi: float) -> float | None:
+    value = arguments.get(name)
+    if value is None:
+        return None
+    return max(lo, min(hi, float(value)))
+
+
+_SEARCH_PARAMS_SCHEMA: dict[str, Any] = {
+    "limit": {
+        "type": "integer",
+        "description": "Сколько фрагментов вернуть после ре-ранжирования (по умолчанию LIMIT_FINAL=5)",
+        "minimum": 1,
+        "maximum": 50,
+    },
+    "limit_first": {
+        "type": "integer",
+        "description": "Сколько кандидатов взять из Qdrant до ре-ранжирования (по умолчанию LIMIT_FIRST=20)",
+        "minimum": 1,
+        "maximum": 200,
+    },
+    "alpha": {
+        "type": "number",
+        "description": "Вес векторного score при ре-ранжировании (0..1, остальное — совпадение слов)",
+        "minimum": 0,
+        "maximum": 1,
+    },
+    "section": {
+        "type": ["string", "array"],
+        "items": {"type": "string"},
+        "description": (
+            "Искать только в разделе документации (путь или его начало, например \"player\" или \"api/upload\"); "
+            "несколько разделов — списком"
+        ),
+    },
+    "source": {
+        "type": ["string", "array"],
+        "items": {"type": "string"},
+        "description": "Искать только на указанных страницах (точный URL source из результатов)",
+    },
+}
+
+
+def _scope_arg(arguments: dict[str, Any], name: str) -> list[str] | None:
+    value = arguments.get(name)
+    if value is None:
+        return None
+    values = [value] if isinstance(value, str) else list(value)
+    return [str(v) for v in values if str(v).strip()] or None
+
+
+def _search_params(arguments: dict[str, Any]) -> tuple[int | None, int | None, float | None]:
+    """limit, limit_first, alpha из аргументов инструмента (с ограничением диапазонов)."""
+    limit = _int_arg(arguments, "limit", 1, 50)
+    limit_first = _int_arg(arguments, "limit_first", 1, 200)
+    alpha = _float_arg(arguments, "alpha", 0.0, 1.0)
+    if limit is not None and (limit_first or LIMIT_FIRST) < limit:
+        limit_first = limit
+    return limit, limit_first, alpha
 
 
 def main() -> int:
@@ -43,26 +164,78 @@ def main() -> int:
                             "type": "string",
                             "description": "Текст запроса для семантического поиска",
                         },
+                        **_SEARCH_PARAMS_SCHEMA,
                     },
                 },
-            )
+            ),
+            types.Tool(
+                name="qdrant-find-many",
+                description=(
+                    "Поиск по базе знаний сразу по нескольким запросам (подвопросам) за один вызов — быстрее, чем несколько qdrant-find подряд. "
+                    "Результаты сгруппированы по запросам; фрагмент, уже найденный по предыдущему запросу, не повторяется (дана ссылка на него). "
+                    "После вызова сформулируй ответ на основе всех фрагментов и укажи ссылки на источники (source)."
+                ),
+                inputSchema={
+                    "type": "object",
+                    "required": ["queries"],
+                    "properties": {
+                        "queries": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "minItems": 1,
+                            "maxItems": MAX_BATCH_QUERIES,
+                            "description": "Список запросов для семантического поиска",
+                        },
+                        **_SEARCH_PARAMS_SCHEMA,
+                    },
+                },
+            ),
         ]
 
     @app.call_tool()
     async def call_tool(name: str, arguments: dict[str, Any]) -> list[types.ContentBlock]:
-        if name != "qdrant-find":
+        if name not in ("qdrant-find", "qdrant-find-many"):
             return [types.TextContent(type="text", text=f"Unknown tool: {name}")]
-        query = (arguments or {}).get("query") or ""
-        if not query.strip():
-            return [types.TextContent(type="text", text="Укажите query для поиска.")]
+        arguments = arguments or {}
+        try:
+            limit, limit_first, alpha = _search_params(arguments)
+            section, source = _scope_arg(arguments, "section"), _scope_arg(arguments, "source")
+        except (TypeError, ValueError) as e:
+            return [types.TextContent(type="text", text=f"Некорректные параметры: {e}")]
+        if name == "qdrant-find-many":
+            queries = arguments.get("queries") or []
+            if not isinstance(queries, list):
+                queries = [queries]
+            queries = [str(q) for q in queries if str(q or "").strip()]
+            if not queries:
+                return [types.TextContent(type="text", text="Укажите queries — список запросов для поиска.")]
+            if len(queries) > MAX_BATCH_QUERIES:
+                return [types.TextContent(type="text", text=f"Не больше {MAX_BATCH_QUERIES} запросов за вызов.")]
+        else:
+            query = arguments.get("query") or ""
+            if not query.strip():
+                return [types.TextContent(type="text", text="Укажите query для поиска.")]
         try:
-            text = await _search_async(query)
+            if name == "qdrant-find-many":
+                text = await _search_many_async(
+                    queries, limit=limit, limit_first=limit_first, alpha=alpha, section=section, source=source
+                )
+            else:
+                text = await _search_async(
+                    query, limit=limit, limit_first=limit_first, alpha=alpha, section=section, source=source
+                )
             return [types.TextContent(type="text", text=text)]
         except Exception as e:
             tb = traceback.format_exc()
             return [types.TextContent(type="text", text=f"Ошибка поиска: {e}\n\n{tb}")]
 
     async def run_server() -> None:
+        warmup: asyncio.Future[None] | None = None
+        if WARMUP:
+            # Прогрев в пуле поиска стартует до stdio; первый find дождётся загрузки модели, а не начнёт её заново.
+            # Ссылка живёт, пока работает сервер; результат разбирает _report_warmup
+            warmup = asyncio.get_running_loop().run_in_executor(_executor, _warmup)
+            warmup.add_done_callback(_report_warmup)
         async with stdio_server() as (read_stream, write_stream):
             await app.run(
                 read_stream,
@@ -1,4 +1,4 @@
 # RAG: поиск по Qdrant с эмбеддингом и ре-ранжированием.
-from rag.search import search
+from rag.search import build_filter, format_hits, search, search_hits, search_many, warmup
 
-__all__ = ["search"]
+__all__ = ["build_filter", "format_hits", "search", "search_hits", "search_many", "warmup"]
@@ -7,10 +7,13 @@ from __future__ import annotations
 import functools
 import os
 import re
+import threading
 from typing import Any
 
 # Конфиг из env
 QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
+# Алиас на текущую версию коллекции (papers_v{N}); Qdrant разрешает его в каждом запросе,
+# так что переключение версии индексатором подхватывается без перезапуска
 COLLECTION_NAME = os.environ.get("COLLECTION_NAME", "papers")
 VECTOR_NAME = "fast-all-minilm-l6-v2"
 EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
@@ -23,24 +26,36 @@ USE_CROSS_ENCODER = os.environ.get("USE_CROSS_ENCODER", "").lower() in ("1", "tr
 _embedder: Any = None
 _qdrant_client: Any = None
 _cross_encoder: Any = None
+# Загрузка модели из нескольких потоков (прогрев + первые запросы) — только один раз
+_init_lock = threading.Lock()
 
 
 def _get_embedder() -> Any:
     global _embedder
     if _embedder is None:
-        from fastembed import TextEmbedding
-        _embedder = TextEmbedding(model_name=EMBEDDING_MODEL)
+        with _init_lock:
+            if _embedder is None:
+                from fastembed import TextEmbedding
+                _embedder = TextEmbedding(model_name=EMBEDDING_MODEL)
     return _embedder
 
 
 def _get_qdrant_client() -> Any:
     global _qdrant_client
     if _qdrant_client is None:
-        from qdrant_client import QdrantClient
-        _qdrant_client = QdrantClient(url=QDRANT_URL)
+        with _init_lock:
+            if _qdrant_client is None:
+                from qdrant_client import QdrantClient
+                _qdrant_client = QdrantClient(url=QDRANT_URL)
     return _qdrant_client
 
 
+def warmup() -> None:
+    """Загрузить модель эмбеддингов, прогнать один эмбеддинг и открыть соединение с Qdrant."""
+    list(_get_embedder().embed(["warmup"]))
+    _get_qdrant_client().get_collection(COLLECTION_NAME)
+
+
 def _tokenize(text: str) -> set[str]:
     return set(re.findall(r"\w+", text.lower()))
 
@@ -102,16 +117,48 @@ def _embed_query_cached(query: str) -> tuple[float, ...]:
     return tuple(v)
 
 
-def search(
+def _as_list(value: str | list[str] | tuple[str, ...] | None) -> list[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [v.strip() for v in value if v and v.strip()]
+
+
+def build_filter(section: str | list[str] | None = None, source: str | list[str] | None = None) -> Any:
+    """
+    Фильтр Qdrant по разделу и/или источнику (None — без фильтра).
+    section — раздел или его префикс ("player" включает "player/api"): ищется по payload-полю sections,
+    которое индексатор заполняет всеми префиксами пути. source — точный URL страницы.
+    Несколько значений через запятую или списком — любое из них (OR); section и source — оба условия (AND).
+    """
+    sections = [s.strip("/") for s in _as_list(section) if s.strip("/")]
+    sources = _as_list(source)
+    if not sections and not sources:
+        return None
+    from qdrant_client.models import FieldCondition, Filter, MatchAny
+
+    must = []
+    if sections:
+        must.append(FieldCondition(key="sections", match=MatchAny(any=sections)))
+    if sources:
+        must.append(FieldCondition(key="source", match=MatchAny(any=sources)))
+    return Filter(must=must)
+
+
+def search_hits(
     query: str,
     limit_first: int | None = None,
     limit_final: int | None = None,
     alpha: float | None = None,
     use_cross_encoder: bool | None = None,
-) -> str:
+    section: str | list[str] | None = None,
+    source: str | list[str] | None = None,
+) -> list[Any]:
     """
-    Синхронный поиск: эмбеддинг (с кэшем) + Qdrant + ре-ранжирование.
-    Возвращает текст с нумерованными результатами (section, source, content).
+    Эмбеддинг (с кэшем) + Qdrant + ре-ранжирование.
+    section/source сужают поиск (см. build_filter): фильтр выполняется в Qdrant вместе с HNSW-поиском.
+    Возвращает список hit (score, payload) — для вызывающих, которым нужны структурированные источники.
     """
     q = query.strip()
     lf = limit_first if limit_first is not None else LIMIT_FIRST
@@ -125,27 +172,121 @@ def search(
         collection_name=COLLECTION_NAME,
         query=v,
         using=VECTOR_NAME,
+        query_filter=build_filter(section, source),
         limit=lf,
         with_payload=True,
     )
     results = getattr(response, "points", []) or []
+    return _rerank(q, results, lfinal, a, use_ce)
+
+
+def _rerank(query: str, results: list[Any], limit_final: int, alpha: float, use_ce: bool) -> list[Any]:
     if not results:
-        return f"По запросу «{q}» ничего не найдено."
+        return []
     if use_ce:
-        results = _rerank_by_cross_encoder(q, results, limit=lfinal)
-    else:
-        results = _rerank_by_keyword(q, results, alpha=a)[:lfinal]
+        return _rerank_by_cross_encoder(query, results, limit=limit_final)
+    return _rerank_by_keyword(query, results, alpha=alpha)[:limit_final]
+
+
+def _hit_lines(i: int, hit: Any) -> list[str]:
+    score = getattr(hit, "score", None)
+    payload = getattr(hit, "payload", None) or {}
+    section = payload.get("section", "")
+    source = payload.get("source", "")
+    content = payload.get("content", "").strip()
+    lines = [f"{i}. (score: {score:.3f}) {section}", f"   Источник: {source}"]
+    if content:
+        lines.append(f"   Текст: {content}")
+    lines.append("")
+    return lines
+
 
+def format_hits(query: str, hits: list[Any]) -> str:
+    """Текст с нумерованными результатами (section, source, content) для контекста LLM."""
+    q = query.strip()
+    if not hits:
+        return f"По запросу «{q}» ничего не найдено."
     lines = [f"Результаты по запросу «{q}»:\n"]
-    for i, hit in enumerate(results, 1):
-        score = getattr(hit, "score", None)
-        payload = getattr(hit, "payload", None) or {}
-        section = payload.get("section", "")
-        source = payload.get("source", "")
-        content = payload.get("content", "").strip()
-        lines.append(f"{i}. (score: {score:.3f}) {section}")
-        lines.append(f"   Источник: {source}")
-        if content:
-            lines.append(f"   Текст: {content}")
-        lines.append("")
+    for i, hit in enumerate(hits, 1):
+        lines.extend(_hit_lines(i, hit))
     return "\n".join(lines).strip()
+
+
+def search_many(
+    queries: list[str],
+    limit_first: int | None = None,
+    limit_final: int | None = None,
+    alpha: float | None = None,
+    use_cross_encoder: bool | None = None,
+    section: str | list[str] | None = None,
+    source: str | list[str] | None = None,
+) -> str:
+    """
+    Поиск по нескольким запросам за один проход: один батч эмбеддингов, один батч-запрос в Qdrant,
+    ре-ранжирование по каждому запросу. Фрагмент, уже показанный в ответе на предыдущий запрос,
+    повторно не выводится — вместо текста ссылка на него. Результат сгруппирован по запросам.
+    """
+    qs = [q.strip() for q in queries if q and q.strip()]
+    if not qs:
+        return "Не задано ни одного запроса."
+    lf = limit_first if limit_first is not None else LIMIT_FIRST
+    lfinal = limit_final if limit_final is not None else LIMIT_FINAL
+    a = alpha if alpha is not None else RERANK_ALPHA
+    use_ce = use_cross_encoder if use_cross_encoder is not None else USE_CROSS_ENCODER
+
+    from qdrant_client.models import QueryRequest
+
+    query_filter = build_filter(section, source)
+    vectors = [v.tolist() if hasattr(v, "tolist") else list(v) for v in _get_embedder().embed(qs)]
+    responses = _get_qdrant_client().query_batch_points(
+        collection_name=COLLECTION_NAME,
+        requests=[
+            QueryRequest(query=v, using=VECTOR_NAME, filter=query_filter, limit=lf, with_payload=True) for v in vectors
+        ],
+    )
+
+    shown: dict[Any, tuple[int, int]] = {}
+    groups: list[str] = []
+    for qi, (q, response) in enumerate(zip(qs, responses), 1):
+        hits = _rerank(q, getattr(response, "points", []) or [], lfinal, a, use_ce)
+        lines = [f"### Запрос {qi}: «{q}»\n"]
+        if not hits:
+            lines.append("Ничего не найдено.\n")
+        for i, hit in enumerate(hits, 1):
+            hit_id = getattr(hit, "id", None)
+            if hit_id is not None and hit_id in shown:
+                pq, pi = shown[hit_id]
+                section = (getattr(hit, "payload", None) or {}).get("section", "")
+                lines.append(f"{i}. {section} — тот же фрагмент, что в запросе {pq}, №{pi}\n")
+                continue
+            if hit_id is not None:
+                shown[hit_id] = (qi, i)
+            lines.extend(_hit_lines(i, hit))
+        groups.append("\n".join(lines).strip())
+    return "\n\n".join(groups)
+
+
+def search(
+    query: str,
+    limit_first: int | None = None,
+    limit_final: int | None = None,
+    alpha: float | None = None,
+    use_cross_encoder: bool | None = None,
+    section: str | list[str] | None = None,
+    source: str | list[str] | None = None,
+) -> str:
+    """
+    Синхронный поиск: эмбеддинг (с кэшем) + Qdrant + ре-ранжирование.
+    section/source — необязательный фильтр (см. build_filter).
+    Возвращает текст с нумерованными результатами (section, source, content).
+    """
+    hits = search_hits(
+        query,
+        limit_first=limit_first,
+        limit_final=limit_final,
+        alpha=alpha,
+        use_cross_encoder=use_cross_encoder,
+        section=section,
+        source=source,
+    )
+    return format_hits(query, hits)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк эмбеддинга чанков docs_crawl при разных настройках fastembed (как в index_to_qdrant.py):
+для каждой конфигурации — время загрузки модели, время эмбеддинга и chunks/s.
+Векторы каждой конфигурации сверяются с первой: порядок и значения должны совпадать.
+
+  python scripts/bench_embedding.py
+  python scripts/bench_embedding.py --limit 5000 --config parallel=0 --config "parallel=4,batch=64"
+
+Ключи конфигурации: parallel (0 — все ядра), threads, batch.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+from index_to_qdrant import DOCS_DIR, EMBED_BATCH_SIZE, embed_stream, iter_chunks, load_embedder
+
+DEFAULT_CONFIGS = [
+    "batch=64",
+    "batch=256",
+    f"threads={os.cpu_count() or 1}",
+    "parallel=2",
+    "parallel=4",
+    "parallel=0",
+]
+
+
+def parse_config(spec: str) -> dict[str, int]:
+    config: dict[str, int] = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        key, _, value = part.partition("=")
+        key = key.strip()
+        if key not in ("parallel", "threads", "batch"):
+            raise ValueError(f"unknown key {key!r} in {spec!r}")
+        config[key] = int(value)
+    return config
+
+
+def run(texts: list[str], config: dict[str, int]) -> tuple[float, float, np.ndarray]:
+    t0 = time.perf_counter()
+    embedder = load_embedder(config.get("threads"), config.get("parallel"))
+    load_sec = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    vectors = [
+        vector
+        for _, vector in embed_stream(
+            embedder,
+            texts,
+            lambda t: t,
+            batch_size=config.get("batch", EMBED_BATCH_SIZE),
+            parallel=config.get("parallel"),
+        )
+    ]
+    return load_sec, time.perf_counter() - t1, np.asarray(vectors, dtype=np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Скорость эмбеддинга чанков при разных настройках fastembed")
+    parser.add_argument("--limit", type=int, default=2000, help="сколько чанков взять из docs_crawl")
+    parser.add_argument("--config", action="append", help="конфигурация, например parallel=4,batch=64 (можно несколько)")
+    args = parser.parse_args()
+
+    if not DOCS_DIR.exists():
+        print(f"Docs dir missing: {DOCS_DIR}", file=sys.stderr)
+        sys.exit(1)
+    texts = [item[3] for item in itertools.islice(iter_chunks(DOCS_DIR), args.limit)]
+    if not texts:
+        print("No chunks.", file=sys.stderr)
+        sys.exit(1)
+    configs = args.config or DEFAULT_CONFIGS
+    print(f"{len(texts)} chunks, {os.cpu_count()} CPUs\n", flush=True)
+    print(f"{'config':<28} {'load, s':>8} {'embed, s':>9} {'chunks/s':>9}  order", flush=True)
+
+    baseline: np.ndarray | None = None
+    for spec in configs:
+        load_sec, embed_sec, vectors = run(texts, parse_config(spec))
+        if baseline is None:
+            baseline, same = vectors, "baseline"
+        else:
+            same = "same" if np.allclose(vectors, baseline, atol=1e-4) else "DIFFERENT"
+        print(
+            f"{spec:<28} {load_sec:>8.2f} {embed_sec:>9.2f} {len(texts) / max(embed_sec, 1e-9):>9.1f}  {same}",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк разбора страниц краулера (crawl_docs.parse_page) на сохранённых HTML: для каждого
+extractor — время, pages/s и сколько страниц дали те же ссылки и тот же Markdown, что html.parser
+(прежний путь через md(str(main))).
+
+  python scripts/bench_html_extract.py --fetch 100     # один раз сохранить страницы в data/html_fixtures
+  python scripts/bench_html_extract.py --repeat 3
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from urllib.parse import urlparse
+
+import httpx
+
+from crawl_docs import BASE_URL, EXTRACTORS, REQUEST_HEADERS, REQUEST_TIMEOUT, normalize_path, parse_page
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / "data" / "html_fixtures"
+
+
+def fetch_fixtures(root: str, out_dir: Path, limit: int) -> int:
+    """Сохранить первые limit страниц сайта (обход в ширину) как <путь>.html."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    root = root.rstrip("/")
+    queue = deque([root + "/"])
+    seen = {root + "/"}
+    saved = 0
+    with httpx.Client(headers=REQUEST_HEADERS, timeout=REQUEST_TIMEOUT, follow_redirects=True) as client:
+        while queue and saved < limit:
+            url = queue.popleft()
+            try:
+                response = client.get(url)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                print(f"  skip {url}: {e!r}", file=sys.stderr)
+                continue
+            name = normalize_path(urlparse(url).path).replace("/", "__") + ".html"
+            (out_dir / name).write_text(response.text, encoding="utf-8")
+            saved += 1
+            links, _ = parse_page(response.text, url, root)
+            for link in sorted(links - seen):
+                seen.add(link)
+                queue.append(link)
+    return saved
+
+
+def run(pages: list[tuple[str, str]], extractor: str, repeat: int) -> tuple[float, list[tuple[set[str], str]]]:
+    """Лучшее из repeat время разбора всех страниц и результаты последнего прогона."""
+    best = float("inf")
+    results: list[tuple[set[str], str]] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        results = [parse_page(html, url, BASE_URL, extractor) for url, html in pages]
+        best = min(best, time.perf_counter() - t0)
+    return best, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Скорость и эквивалентность разбора HTML в crawl_docs.py")
+    parser.add_argument("--pages", type=Path, default=FIXTURES_DIR, help="каталог с сохранёнными .html")
+    parser.add_argument("--fetch", type=int, default=0, help="сначала сохранить N страниц сайта в --pages")
+    parser.add_argument("--base-url", default=BASE_URL, help="сайт для --fetch")
+    parser.add_argument("--repeat", type=int, default=3, help="прогонов на extractor (берётся лучший)")
+    parser.add_argument("--extractor", action="append", choices=EXTRACTORS, help="что сравнивать (по умолчанию все)")
+    args = parser.parse_args()
+
+    if args.fetch:
+        print(f"Saved {fetch_fixtures(args.base_url, args.pages, args.fetch)} pages to {args.pages}", flush=True)
+    files = sorted(args.pages.glob("*.html")) if args.pages.exists() else []
+    if not files:
+        print(f"No .html fixtures in {args.pages}; run with --fetch N first", file=sys.stderr)
+        sys.exit(1)
+    pages = [
+        (BASE_URL + "/" + f.stem.replace("__", "/").removesuffix("index"), f.read_text(encoding="utf-8"))
+        for f in files
+    ]
+    size_mb = sum(len(html.encode("utf-8")) for _, html in pages) / 1e6
+    print(f"{len(pages)} pages, {size_mb:.1f} MB HTML\n", flush=True)
+    print(f"{'extractor':<12} {'sec':>7} {'pages/s':>9} {'speedup':>8}  same as html.parser", flush=True)
+
+    # html.parser — эталон вывода, его гоняем всегда
+    extractors = ["html.parser"] + [e for e in (args.extractor or EXTRACTORS) if e != "html.parser"]
+    baseline_sec, baseline = run(pages, "html.parser", args.repeat)
+    for extractor in extractors:
+        sec, results = (baseline_sec, baseline) if extractor == "html.parser" else run(pages, extractor, args.repeat)
+        differ = [f.name for f, got, want in zip(files, results, baseline) if got != want]
+        same = f"{len(pages) - len(differ)}/{len(pages)}"
+        if differ:
+            same += "  differ: " + ", ".join(differ[:5]) + (" …" if len(differ) > 5 else "")
+        print(
+            f"{extractor:<12} {sec:>7.2f} {len(pages) / max(sec, 1e-9):>9.1f} {baseline_sec / max(sec, 1e-9):>7.1f}x  {same}",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
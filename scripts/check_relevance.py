@@ -41,12 +41,13 @@ def run_search(
     limit_first: int = 20,
     limit_final: int = 5,
     alpha: float = 0.6,
+    collection_name: str = COLLECTION_NAME,
 ):
     """Поиск: эмбеддинг + Qdrant + ре-ранжирование по словам. Возвращает список hit с payload."""
     vectors = list(embedder.embed([query]))
     v = vectors[0].tolist() if hasattr(vectors[0], "tolist") else list(vectors[0])
     response = client.query_points(
-        collection_name=COLLECTION_NAME,
+        collection_name=collection_name,
         query=v,
         using=VECTOR_NAME,
         limit=limit_first,
@@ -74,12 +75,13 @@ def run_search_full(
     client,
     limit_first: int,
     alpha: float,
+    collection_name: str = COLLECTION_NAME,
 ):
     """Поиск с ре-ранжированием, возвращает полный список (топ limit_first) для анализа позиций."""
     vectors = list(embedder.embed([query]))
     v = vectors[0].tolist() if hasattr(vectors[0], "tolist") else list(vectors[0])
     response = client.query_points(
-        collection_name=COLLECTION_NAME,
+        collection_name=collection_name,
         query=v,
         using=VECTOR_NAME,
         limit=limit_first,
@@ -105,9 +107,10 @@ def find_expected_position(
     expected_contains: str,
     limit_first: int,
     alpha: float,
+    collection_name: str = COLLECTION_NAME,
 ) -> int | None:
     """Позиция (1-based) ожидаемого источника после ре-ранжирования, или None."""
-    ranked = run_search_full(query, embedder, client, limit_first, alpha)
+    ranked = run_search_full(query, embedder, client, limit_first, alpha, collection_name)
     for i, hit in enumerate(ranked, 1):
         payload = getattr(hit, "payload", None) or {}
         section = (payload.get("section") or "") + " " + (payload.get("source") or "")
@@ -116,6 +119,28 @@ def find_expected_position(
     return None
 
 
+def smoke_test(embedder, client, collection_name: str) -> tuple[int, int, list[str]]:
+    """
+    Прогон relevance_tests.json по указанной коллекции (проверка новой версии до переключения алиаса).
+    Возвращает (пройдено, всего, id проваленных тестов).
+    """
+    with open(TESTS_FILE, encoding="utf-8") as f:
+        data = json.load(f)
+    params = data.get("params", {})
+    limit_first = params.get("limit_first", 20)
+    limit_final = params.get("limit_final", 5)
+    alpha = params.get("rerank_alpha", 0.6)
+    tests = [tc for tc in data.get("tests", []) if tc.get("query") and tc.get("expected_section_contains")]
+    failed = []
+    for tc in tests:
+        pos = find_expected_position(
+            tc["query"], embedder, client, tc["expected_section_contains"], limit_first, alpha, collection_name
+        )
+        if pos is None or pos > tc.get("expected_in_top", limit_final):
+            failed.append(tc.get("id", "?"))
+    return len(tests) - len(failed), len(tests), failed
+
+
 def main() -> int:
     if not TESTS_FILE.exists():
         print(f"Файл тестов не найден: {TESTS_FILE}", file=sys.stderr)
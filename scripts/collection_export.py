@@ -0,0 +1,200 @@
+"""
+Компактный формат экспорта коллекции для переноса на сервер (export_qdrant_collection.py →
+restore_qdrant_collection.py). Каталог data/qdrant_papers_export/:
+
+  vectors.f32        — векторы float32 подряд, строка i — точка i (читается через memmap)
+  payloads.jsonl.gz  — {"id", "payload"} по строке на точку, в том же порядке
+  manifest.json      — модель, имя и размерность вектора, число точек, sha256 и размер файлов
+
+manifest.json пишется последним, а каталог собирается во временном и подменяется целиком:
+недописанный экспорт restore не примет. Прежний JSONL (data/qdrant_papers_export.jsonl,
+вектор — JSON-массив) по-прежнему читается iter_export_batches.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+import numpy as np
+
+FORMAT_VERSION = 1
+VECTORS_FILE = "vectors.f32"
+PAYLOADS_FILE = "payloads.jsonl.gz"
+MANIFEST_FILE = "manifest.json"
+_HASH_CHUNK = 1 << 20
+
+
+class _HashingWriter:
+    """Файл, который по ходу записи считает sha256 и размер."""
+
+    def __init__(self, path: Path) -> None:
+        self._f = open(path, "wb")
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def flush(self) -> None:
+        self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class ExportWriter:
+    """
+    Потоковая запись экспорта: add(id, vector, payload) по точке, finish(**поля манифеста) —
+    дописать манифест и подменить каталог. Память не зависит от размера коллекции.
+    """
+
+    def __init__(self, out_dir: str | Path, dim: int, gzip_level: int = 6) -> None:
+        self.out_dir = Path(out_dir)
+        self.dim = dim
+        self.count = 0
+        self._tmp = self.out_dir.with_name(self.out_dir.name + ".tmp")
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        self._tmp.mkdir(parents=True)
+        self._vectors = _HashingWriter(self._tmp / VECTORS_FILE)
+        self._payloads_raw = _HashingWriter(self._tmp / PAYLOADS_FILE)
+        self._payloads = gzip.GzipFile(fileobj=self._payloads_raw, mode="wb", compresslevel=gzip_level, mtime=0)
+
+    def add(self, point_id: Any, vector: Any, payload: dict[str, Any] | None) -> None:
+        arr = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if arr.shape[0] != self.dim:
+            raise ValueError(f"vector of size {arr.shape[0]} for point {point_id}, expected {self.dim}")
+        self._vectors.write(arr.tobytes())
+        line = json.dumps({"id": str(point_id), "payload": payload or {}}, ensure_ascii=False)
+        self._payloads.write(line.encode("utf-8") + b"\n")
+        self.count += 1
+
+    def finish(self, **manifest_fields: Any) -> dict[str, Any]:
+        self._payloads.close()
+        self._payloads_raw.close()
+        self._vectors.close()
+        manifest = {
+            "format": FORMAT_VERSION,
+            **manifest_fields,
+            "dim": self.dim,
+            "dtype": "float32",
+            "count": self.count,
+            "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "files": {
+                VECTORS_FILE: {"sha256": self._vectors.sha256.hexdigest(), "bytes": self._vectors.size},
+                PAYLOADS_FILE: {"sha256": self._payloads_raw.sha256.hexdigest(), "bytes": self._payloads_raw.size},
+            },
+        }
+        (self._tmp / MANIFEST_FILE).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+        self._tmp.rename(self.out_dir)
+        return manifest
+
+    def abort(self) -> None:
+        for f in (self._payloads, self._payloads_raw, self._vectors):
+            try:
+                f.close()
+            except Exception:  # noqa: BLE001 — уже в обработке ошибки
+                pass
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+def read_manifest(export_dir: str | Path) -> dict[str, Any]:
+    path = Path(export_dir) / MANIFEST_FILE
+    if not path.exists():
+        raise FileNotFoundError(f"{path} не найден: экспорт не завершён или это не каталог экспорта")
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"неизвестная версия формата экспорта: {manifest.get('format')!r}")
+    return manifest
+
+
+def verify_export(export_dir: str | Path, manifest: dict[str, Any]) -> list[str]:
+    """Сверить размеры и sha256 файлов с манифестом; возвращает список расхождений (пустой — всё цело)."""
+    export_dir = Path(export_dir)
+    problems: list[str] = []
+    expected_vectors = manifest["count"] * manifest["dim"] * 4
+    if manifest["files"][VECTORS_FILE]["bytes"] != expected_vectors:
+        problems.append(f"{VECTORS_FILE}: в манифесте {manifest['files'][VECTORS_FILE]['bytes']} байт, ожидалось {expected_vectors}")
+    for name, meta in manifest["files"].items():
+        path = export_dir / name
+        if not path.exists():
+            problems.append(f"{name}: файла нет")
+            continue
+        if path.stat().st_size != meta["bytes"]:
+            problems.append(f"{name}: {path.stat().st_size} байт вместо {meta['bytes']}")
+            continue
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_CHUNK), b""):
+                digest.update(block)
+        if digest.hexdigest() != meta["sha256"]:
+            problems.append(f"{name}: sha256 не совпадает")
+    return problems
+
+
+def _iter_binary(export_dir: Path, manifest: dict[str, Any], batch_size: int) -> Iterator[tuple[list, np.ndarray, list]]:
+    count, dim = manifest["count"], manifest["dim"]
+    if count == 0:
+        return
+    vectors = np.memmap(export_dir / VECTORS_FILE, dtype=np.float32, mode="r", shape=(count, dim))
+    ids: list[str] = []
+    payloads: list[dict[str, Any]] = []
+    row = 0
+    with gzip.open(export_dir / PAYLOADS_FILE, "rt", encoding="utf-8") as f:
+        for line in f:
+            obj = json.loads(line)
+            ids.append(obj["id"])
+            payloads.append(obj["payload"])
+            if len(ids) == batch_size:
+                yield ids, np.array(vectors[row : row + len(ids)]), payloads
+                row += len(ids)
+                ids, payloads = [], []
+    if ids:
+        yield ids, np.array(vectors[row : row + len(ids)]), payloads
+        row += len(ids)
+    if row != count:
+        raise ValueError(f"{PAYLOADS_FILE}: {row} строк, в манифесте {count}")
+
+
+def _iter_jsonl(path: Path, vector_name: str, batch_size: int) -> Iterator[tuple[list, np.ndarray, list]]:
+    ids: list[str] = []
+    vectors: list[Any] = []
+    payloads: list[dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            vec = obj["vector"]
+            if isinstance(vec, dict):
+                vec = vec[vector_name]
+            ids.append(obj["id"])
+            vectors.append(vec)
+            payloads.append(obj["payload"])
+            if len(ids) == batch_size:
+                yield ids, np.asarray(vectors, dtype=np.float32), payloads
+                ids, vectors, payloads = [], [], []
+    if ids:
+        yield ids, np.asarray(vectors, dtype=np.float32), payloads
+
+
+def iter_export_batches(
+    path: str | Path, batch_size: int, manifest: dict[str, Any] | None = None, vector_name: str = ""
+) -> Iterator[tuple[list, np.ndarray, list]]:
+    """
+    Батчи (ids, векторы [n, dim], payloads) из экспорта: каталога компактного формата (нужен manifest)
+    или прежнего .jsonl. В памяти одновременно только текущий батч.
+    """
+    path = Path(path)
+    if path.is_dir():
+        yield from _iter_binary(path, manifest or read_manifest(path), batch_size)
+    else:
+        yield from _iter_jsonl(path, vector_name, batch_size)
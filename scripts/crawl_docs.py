@@ -2,17 +2,46 @@
 """
 Краул базы знаний https://docs.kinescope.ru/ с сохранением в .md с иерархией.
 Сохраняет страницы в docs_crawl/<path>/index.md по URL.
+
+Асинхронный: общий пул соединений httpx (keep-alive), --concurrency воркеров берут URL из очереди
+(frontier), --rate — не больше N запросов в секунду на хост, повторы 429/5xx/сетевых ошибок
+с экспоненциальной задержкой и джиттером (учитывается Retry-After). Разбор HTML — в потоках,
+чтобы не блокировать загрузку остальных страниц. --base-url — краулить другой сайт (например, тестовый).
+
+Повторный краул условный (манифест crawl_manifest.py): If-None-Match / If-Modified-Since, страницы
+с lastmod в sitemap.xml не новее последней загрузки не запрашиваются вовсе, index.md перезаписывается
+только при смене хэша Markdown. Изменённые страницы — в docs_crawl/.changed_pages.json.
+--full — загрузить и перезаписать всё, --prune — удалить страницы, которых больше нет на сайте.
+
+Каждая страница записывается на диск сразу после конвертации, очередь обхода и обработанные URL
+периодически сохраняются в тот же SQLite; --resume продолжает прерванный краул, память не растёт
+с размером сайта (в ней только множество найденных URL).
+
+--extractor — разбор HTML: lxml (по умолчанию, если установлен; C-парсер, Markdown строится
+из уже разобранного дерева) или html.parser (чистый Python, main сериализуется и разбирается
+markdownify повторно). Сравнение скорости и вывода — scripts/bench_html_extract.py.
 """
 from __future__ import annotations
 
+import argparse
+import asyncio
+import hashlib
+import importlib.util
+import random
 import re
 import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from pathlib import Path
 from urllib.parse import urljoin, urlparse
+from xml.etree import ElementTree
 
-import requests
+import httpx
 from bs4 import BeautifulSoup
-from markdownify import markdownify as md
+from markdownify import MarkdownConverter, markdownify as md
+
+from crawl_manifest import MANIFEST_FILE, CrawlManifest, write_changes
 
 BASE_URL = "https://docs.kinescope.ru"
 OUTPUT_DIR = Path(__file__).resolve().parent.parent / "docs_crawl"
@@ -21,6 +50,19 @@ REQUEST_HEADERS = {
     "Accept": "text/html,application/xhtml+xml",
 }
 CHUNK_SIZE = 8192
+CONCURRENCY = 8
+RATE_PER_HOST = 10.0
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+REQUEST_TIMEOUT = 30.0
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Разбор HTML: lxml — C-парсер, без него — html.parser из стандартной библиотеки
+EXTRACTORS = ("lxml", "html.parser")
+DEFAULT_EXTRACTOR = "lxml" if importlib.util.find_spec("lxml") is not None else "html.parser"
+_MD_OPTIONS = {"heading_style": "ATX", "strip": ["a"]}
+_md_converter = MarkdownConverter(**_MD_OPTIONS)
+# Каждые N обработанных страниц очередь и обработанные URL сохраняются в манифест (для --resume)
+CHECKPOINT_EVERY = 50
 
 
 def normalize_path(url_path: str) -> str:
@@ -30,8 +72,8 @@ def normalize_path(url_path: str) -> str:
     return path.replace("//", "/")
 
 
-def get_links_from_page(soup: BeautifulSoup, base: str) -> set[str]:
-    """Собирает все внутренние ссылки на docs.kinescope.ru."""
+def get_links_from_page(soup: BeautifulSoup, base: str, root: str = BASE_URL) -> set[str]:
+    """Собирает все внутренние ссылки сайта root (по умолчанию docs.kinescope.ru)."""
     links: set[str] = set()
     for a in soup.find_all("a", href=True):
         href = a["href"].strip()
@@ -39,90 +81,449 @@ def get_links_from_page(soup: BeautifulSoup, base: str) -> set[str]:
             continue
         full = urljoin(base, href)
         parsed = urlparse(full)
-        if parsed.netloc != urlparse(BASE_URL).netloc:
+        if parsed.netloc != urlparse(root).netloc:
             continue
         path = parsed.path.rstrip("/") or "/"
         if path.startswith("/"):
-            links.add(BASE_URL + path)
+            links.add(root + path)
     return links
 
 
-def html_to_markdown(soup: BeautifulSoup) -> str:
-    """Конвертирует основной контент страницы в Markdown."""
+def main_content(soup: BeautifulSoup):
+    """Основной контент страницы без script/style/nav/header; None — нет даже body."""
     main = soup.find("main") or soup.find("article") or soup.find("div", class_=re.compile("content|main|md-content"))
     if main is None:
         main = soup.find("body")
     if main is None:
-        return ""
+        return None
     for tag in main.find_all(["script", "style", "nav", "header"]):
         tag.decompose()
-    return md(str(main), heading_style="ATX", strip=["a"])
+    return main
 
 
-def fetch_page(url: str) -> str | None:
-    """Загружает HTML страницы."""
-    try:
-        r = requests.get(url, headers=REQUEST_HEADERS, timeout=30)
-        r.raise_for_status()
-        return r.text
-    except requests.RequestException as e:
-        print(f"  skip {url}: {e}", file=sys.stderr)
+def html_to_markdown(soup: BeautifulSoup) -> str:
+    """Конвертирует основной контент страницы в Markdown (сериализация main и повторный разбор markdownify)."""
+    main = main_content(soup)
+    if main is None:
+        return ""
+    return md(str(main), **_MD_OPTIONS)
+
+
+def soup_to_markdown(soup: BeautifulSoup) -> str:
+    """То же, что html_to_markdown, но по уже разобранному дереву — без str(main) и второго разбора."""
+    main = main_content(soup)
+    if main is None:
+        return ""
+    # markdownify обрезает переводы строк по краям только у документа целиком, не у отдельного тега
+    return _md_converter.convert_soup(main).strip("\n")
+
+
+class HostRateLimiter:
+    """Не чаще rate запросов в секунду на хост: каждый запрос занимает следующий слот по времени."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next: dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, host: str) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None, backoff: float) -> float:
+    """Задержка перед повтором: Retry-After, иначе экспонента с полным джиттером."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), 60.0)
+    return random.uniform(0, backoff * (2 ** attempt))
+
+
+async def fetch_page(
+    client: httpx.AsyncClient,
+    url: str,
+    limiter: HostRateLimiter,
+    retries: int = MAX_RETRIES,
+    backoff: float = RETRY_BACKOFF,
+    headers: dict[str, str] | None = None,
+) -> httpx.Response | None:
+    """
+    Загружает страницу: ответ 200 или 304 (на условный запрос с headers). Повторяет 429/5xx
+    и сетевые ошибки; остальные ошибки и исчерпанные повторы — None.
+    """
+    host = urlparse(url).netloc
+    for attempt in range(retries + 1):
+        await limiter.wait(host)
+        response = None
+        try:
+            response = await client.get(url, headers=headers)
+            if response.status_code == 304:
+                return response
+            if response.status_code not in _RETRY_STATUSES:
+                response.raise_for_status()
+                return response
+            error = f"HTTP {response.status_code}"
+        except httpx.HTTPStatusError as e:
+            print(f"  skip {url}: {e.response.status_code}", file=sys.stderr)
+            return None
+        except httpx.TransportError as e:
+            error = repr(e)
+        if attempt < retries:
+            await asyncio.sleep(_retry_delay(attempt, response, backoff))
+    print(f"  skip {url}: {error} after {retries + 1} attempts", file=sys.stderr)
+    return None
+
+
+def parse_page(html: str, url: str, root: str, extractor: str = DEFAULT_EXTRACTOR) -> tuple[set[str], str]:
+    """
+    Ссылки и Markdown страницы за один разбор HTML (выполняется в потоке — разбор занимает CPU).
+    extractor: lxml — Markdown из того же дерева; html.parser — прежний путь через md(str(main)).
+    """
+    if extractor not in EXTRACTORS:
+        raise ValueError(f"unknown extractor {extractor!r}, expected one of {EXTRACTORS}")
+    soup = BeautifulSoup(html, extractor)
+    links = get_links_from_page(soup, url, root)  # до main_content: она удаляет nav и header
+    if extractor == "html.parser":
+        return links, html_to_markdown(soup)
+    return links, soup_to_markdown(soup)
+
+
+def content_hash(content_md: str) -> str:
+    return hashlib.sha256(content_md.encode("utf-8")).hexdigest()
+
+
+def _site_url(loc: str, root: str) -> str | None:
+    """URL из sitemap в том же виде, что и ссылки get_links_from_page; чужой хост — None."""
+    parsed = urlparse(loc.strip())
+    if parsed.netloc != urlparse(root).netloc:
         return None
+    return root + (parsed.path.rstrip("/") or "/")
 
 
-def crawl() -> list[tuple[str, str, str]]:
-    """Краулит сайт, возвращает список (url, path_key, markdown)."""
-    seen: set[str] = set()
-    to_visit = {BASE_URL + "/"}
-    results: list[tuple[str, str, str]] = []
+def _parse_lastmod(value: str | None) -> float | None:
+    """W3C datetime из sitemap (дата или дата со временем) → unix time; без зоны считаем UTC."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
 
-    while to_visit:
-        url = to_visit.pop()
-        if url in seen:
-            continue
-        seen.add(url)
-        parsed = urlparse(url)
-        path_key = parsed.path.rstrip("/") or "index"
 
-        html = fetch_page(url)
-        if not html:
+def parse_sitemap(xml_text: str) -> tuple[dict[str, float | None], list[str]]:
+    """({loc: lastmod} страниц, [loc вложенных sitemap]) — поддерживает и urlset, и sitemapindex."""
+    try:
+        tree = ElementTree.fromstring(xml_text)
+    except ElementTree.ParseError:
+        return {}, []
+    pages: dict[str, float | None] = {}
+    nested: list[str] = []
+    for el in tree:
+        tag = el.tag.rsplit("}", 1)[-1]
+        values = {child.tag.rsplit("}", 1)[-1]: (child.text or "").strip() for child in el}
+        if not values.get("loc"):
             continue
+        if tag == "url":
+            pages[values["loc"]] = _parse_lastmod(values.get("lastmod"))
+        elif tag == "sitemap":
+            nested.append(values["loc"])
+    return pages, nested
+
+
+async def fetch_sitemap(
+    client: httpx.AsyncClient, root: str, limiter: HostRateLimiter, retries: int, backoff: float
+) -> dict[str, float | None]:
+    """{url: lastmod} из root/sitemap.xml (с одним уровнем sitemapindex); нет sitemap — пустой словарь."""
+    response = await fetch_page(client, root + "/sitemap.xml", limiter, retries, backoff)
+    if response is None or response.status_code != 200:
+        return {}
+    pages, nested = parse_sitemap(response.text)
+    for loc in nested:
+        sub = await fetch_page(client, loc, limiter, retries, backoff)
+        if sub is not None and sub.status_code == 200:
+            pages.update(parse_sitemap(sub.text)[0])
+    lastmod: dict[str, float | None] = {}
+    for loc, ts in pages.items():
+        url = _site_url(loc, root)
+        if url is not None:
+            lastmod[url] = ts
+    return lastmod
+
+
+def md_path(path_key: str, output_dir: Path = OUTPUT_DIR) -> Path:
+    """Файл страницы: docs_crawl/<путь URL>/index.md (корень сайта — docs_crawl/index/index.md)."""
+    parts = path_key.strip("/").split("/") if path_key != "index" else ["index"]
+    safe_parts = [re.sub(r"[^\w\-.]", "_", p) for p in parts if p]
+    if not safe_parts or safe_parts == ["index"]:
+        return output_dir / "index" / "index.md"
+    return output_dir / Path(*safe_parts) / "index.md"
+
+
+@dataclass
+class CrawlResult:
+    """
+    changed — записанные за краул файлы (пути относительно output_dir); seen — все URL сайта,
+    найденные за краул. Markdown страниц в памяти не держится — пишется на диск сразу.
+    """
+
+    changed: list[str] = field(default_factory=list)
+    seen: set[str] = field(default_factory=set)
+    fetched: int = 0
+    not_modified: int = 0
+    skipped: int = 0
+    resumed: int = 0
 
-        soup = BeautifulSoup(html, "html.parser")
-        new_links = get_links_from_page(soup, url)
-        to_visit.update(new_links - seen)
 
-        content_md = html_to_markdown(soup)
-        if content_md.strip():
-            results.append((url, path_key, content_md))
-        print(f"  {path_key}", flush=True)
+def save_page(url: str, path_key: str, content_md: str, output_dir: Path = OUTPUT_DIR) -> str:
+    """Записывает страницу в docs_crawl с иерархией; возвращает путь файла относительно output_dir."""
+    md_file = md_path(path_key, output_dir)
+    md_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = md_file.with_suffix(".md.tmp")
+    tmp.write_text(f"# Source: {url}\n\n{content_md}", encoding="utf-8")
+    tmp.replace(md_file)  # целиком или никак — после падения не остаётся обрезанного index.md
+    return md_file.relative_to(output_dir).as_posix()
 
-    return results
 
+async def crawl_async(
+    root: str = BASE_URL,
+    *,
+    concurrency: int = CONCURRENCY,
+    rate: float = RATE_PER_HOST,
+    retries: int = MAX_RETRIES,
+    backoff: float = RETRY_BACKOFF,
+    manifest: CrawlManifest | None = None,
+    output_dir: Path = OUTPUT_DIR,
+    full: bool = False,
+    use_sitemap: bool = True,
+    resume: bool = False,
+    checkpoint_every: int = CHECKPOINT_EVERY,
+    extractor: str = DEFAULT_EXTRACTOR,
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> CrawlResult:
+    """
+    Краулит сайт root конкурентно, записывая каждую изменившуюся страницу сразу. С манифестом —
+    условно: неизменившиеся страницы не загружаются (lastmod из sitemap) или приходят ответом 304,
+    их ссылки берутся из манифеста; очередь и обработанные URL сохраняются каждые checkpoint_every
+    страниц, resume=True продолжает прерванный краул с последней контрольной точки.
+    """
+    root = root.rstrip("/")
+    result = CrawlResult()
+    seen = result.seen
+    frontier: asyncio.Queue[str] = asyncio.Queue()
+    limiter = HostRateLimiter(rate)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    # Изменения с последней контрольной точки: найденные URL и обработанные (url, записанный файл)
+    new_urls: list[str] = []
+    done_urls: list[tuple[str, str | None]] = []
 
-def save_md_with_hierarchy(results: list[tuple[str, str, str]]) -> None:
-    """Сохраняет результаты в docs_crawl с иерархией."""
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    for url, path_key, content_md in results:
-        parts = path_key.strip("/").split("/") if path_key != "index" else ["index"]
-        safe_parts = [re.sub(r"[^\w\-.]", "_", p) for p in parts if p]
-        if not safe_parts or safe_parts == ["index"]:
-            dir_path = OUTPUT_DIR / "index"
+    def enqueue(links) -> None:
+        for link in sorted(set(links) - seen):
+            seen.add(link)
+            new_urls.append(link)
+            frontier.put_nowait(link)
+
+    def checkpoint() -> None:
+        if manifest is None or not (new_urls or done_urls):
+            return
+        manifest.checkpoint(new_urls, done_urls)
+        new_urls.clear()
+        done_urls.clear()
+
+    if manifest is not None:
+        if resume:
+            pending, found, written = manifest.load_checkpoint()
+            if found:
+                seen.update(found)
+                result.changed.extend(written)
+                result.resumed = len(found) - len(pending)
+                for url in pending:
+                    frontier.put_nowait(url)
+                print(f"Resuming: {result.resumed} pages done, {len(pending)} queued", flush=True)
         else:
-            dir_path = OUTPUT_DIR / Path(*safe_parts)
-        dir_path.mkdir(parents=True, exist_ok=True)
-        md_file = dir_path / "index.md"
-        md_file.write_text(f"# Source: {url}\n\n{content_md}", encoding="utf-8")
-    print(f"Saved {len(results)} pages under {OUTPUT_DIR}", flush=True)
+            manifest.clear_checkpoint()
+
+    async with httpx.AsyncClient(
+        headers=REQUEST_HEADERS,
+        timeout=REQUEST_TIMEOUT,
+        limits=limits,
+        follow_redirects=True,
+        transport=transport,
+    ) as client:
+        lastmod = await fetch_sitemap(client, root, limiter, retries, backoff) if use_sitemap else {}
+        if lastmod:
+            print(f"Sitemap: {len(lastmod)} pages", flush=True)
+        enqueue([root + "/", *lastmod])
+
+        async def visit(url: str) -> str | None:
+            """Обрабатывает страницу; возвращает путь записанного файла или None."""
+            path_key = urlparse(url).path.rstrip("/") or "index"
+            entry = manifest.get(url) if manifest is not None and not full else None
+            if entry is not None and not md_path(entry["path_key"] or path_key, output_dir).exists():
+                entry = None  # файл удалён вручную — загрузить заново
+            if entry is not None:
+                modified = lastmod.get(url)
+                if modified is not None and entry["fetched_at"] and modified <= entry["fetched_at"]:
+                    result.skipped += 1
+                    enqueue(entry["links"])
+                    return None
+            headers: dict[str, str] = {}
+            if entry is not None and entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry is not None and entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+            response = await fetch_page(client, url, limiter, retries, backoff, headers or None)
+            if response is None:
+                if entry is not None:
+                    enqueue(entry["links"])  # временная ошибка: ссылки страницы не теряем
+                return None
+            if response.status_code == 304 and entry is not None:
+                result.not_modified += 1
+                manifest.update(url, fetched_at=time.time())
+                enqueue(entry["links"])
+                return None
+            result.fetched += 1
+            links, content_md = await asyncio.to_thread(parse_page, response.text, url, root, extractor)
+            enqueue(links)
+            if not content_md.strip():
+                return None
+            meta = {
+                "path_key": path_key,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_hash": content_hash(content_md),
+                "links": links,
+                "fetched_at": time.time(),
+            }
+            written = None
+            if entry is None or entry["content_hash"] != meta["content_hash"]:
+                written = save_page(url, path_key, content_md, output_dir)
+                print(f"  {path_key}", flush=True)
+            # Манифест — только после записи файла: иначе после падения остался бы устаревший index.md
+            # при «актуальном» ETag
+            if manifest is not None:
+                manifest.update(url, **meta)
+            return written
+
+        async def worker() -> None:
+            while True:
+                url = await frontier.get()
+                try:
+                    written = None
+                    try:
+                        written = await visit(url)
+                    except Exception as e:  # noqa: BLE001 — одна сломанная страница не останавливает краул
+                        print(f"  skip {url}: {e!r}", file=sys.stderr)
+                    # Прерванная (CancelledError) страница сюда не доходит и остаётся в очереди контрольной точки
+                    if written:
+                        result.changed.append(written)
+                    done_urls.append((url, written))
+                    if len(done_urls) >= checkpoint_every:
+                        checkpoint()
+                finally:
+                    frontier.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+        try:
+            await frontier.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            checkpoint()
+    if manifest is not None:
+        manifest.clear_checkpoint()  # краул завершён — следующий начнётся с начала
+    return result
+
+
+def crawl(**kwargs) -> CrawlResult:
+    """Краулит сайт (см. crawl_async)."""
+    return asyncio.run(crawl_async(**kwargs))
+
+
+def prune_removed(manifest: CrawlManifest, seen: set[str], output_dir: Path = OUTPUT_DIR) -> list[str]:
+    """Удалить файлы и записи манифеста страниц, которых больше нет на сайте; возвращает пути файлов."""
+    removed: list[str] = []
+    for url in sorted(manifest.urls() - seen):
+        entry = manifest.get(url)
+        md_file = md_path(entry["path_key"] or "index", output_dir)
+        if md_file.exists():
+            md_file.unlink()
+            removed.append(md_file.relative_to(output_dir).as_posix())
+        manifest.remove(url)
+    return removed
 
 
 def main() -> None:
-    print("Crawling", BASE_URL, "...", flush=True)
-    results = crawl()
-    if not results:
+    parser = argparse.ArgumentParser(description="Краул документации в docs_crawl/")
+    parser.add_argument("--base-url", default=BASE_URL, help="корень сайта")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="одновременных запросов")
+    parser.add_argument("--rate", type=float, default=RATE_PER_HOST, help="запросов в секунду на хост (0 — без ограничения)")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES, help="повторов при 429/5xx и сетевых ошибках")
+    parser.add_argument("--full", action="store_true", help="без условных запросов: загрузить и перезаписать все страницы")
+    parser.add_argument("--no-sitemap", action="store_true", help="не читать sitemap.xml")
+    parser.add_argument("--prune", action="store_true", help="удалить .md страниц, которые больше не найдены на сайте")
+    parser.add_argument("--resume", action="store_true", help="продолжить прерванный краул с контрольной точки")
+    parser.add_argument(
+        "--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="сохранять прогресс каждые N страниц"
+    )
+    parser.add_argument(
+        "--extractor", choices=EXTRACTORS, default=DEFAULT_EXTRACTOR, help="парсер HTML (lxml быстрее)"
+    )
+    args = parser.parse_args()
+
+    manifest = CrawlManifest(OUTPUT_DIR / MANIFEST_FILE)
+    print("Crawling", args.base_url, "...", flush=True)
+    t0 = time.perf_counter()
+    try:
+        result = crawl(
+            root=args.base_url,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            retries=args.retries,
+            manifest=manifest,
+            full=args.full,
+            use_sitemap=not args.no_sitemap,
+            resume=args.resume,
+            checkpoint_every=args.checkpoint_every,
+            extractor=args.extractor,
+        )
+    except KeyboardInterrupt:
+        manifest.close()
+        print("\nInterrupted; continue with --resume", file=sys.stderr)
+        sys.exit(130)
+    elapsed = time.perf_counter() - t0
+    print(
+        f"Crawled in {elapsed:.1f}s: {result.fetched} fetched, {result.not_modified} not modified (304), "
+        f"{result.skipped} skipped by sitemap lastmod, {result.resumed} done before resume, "
+        f"{len(result.changed)} written under {OUTPUT_DIR}",
+        flush=True,
+    )
+    if result.fetched + result.not_modified + result.skipped + result.resumed == 0:
         print("No pages found.", file=sys.stderr)
+        manifest.close()
         sys.exit(1)
-    save_md_with_hierarchy(results)
+
+    removed: list[str] = []
+    if args.prune:
+        removed = prune_removed(manifest, result.seen)
+        print(f"Pruned {len(removed)} removed pages", flush=True)
+    else:
+        gone = len(manifest.urls() - result.seen)
+        if gone:
+            print(f"{gone} pages from the manifest were not found (use --prune to delete them)", flush=True)
+    manifest.close()
+    path = write_changes(OUTPUT_DIR, result.changed, removed)
+    print(f"Changed pages list: {path}", flush=True)
 
 
 if __name__ == "__main__":
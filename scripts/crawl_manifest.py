@@ -0,0 +1,175 @@
+"""
+Манифест краула для условной перезагрузки docs.kinescope.ru: url → ETag, Last-Modified, sha256
+сконвертированного Markdown, исходящие ссылки и время последней загрузки. Лежит в SQLite внутри
+docs_crawl/ — удалили каталог, пропал и манифест, следующий краул будет полным.
+
+crawl_docs.py отправляет If-None-Match / If-Modified-Since, пропускает страницы, чей lastmod
+в sitemap.xml не новее последней загрузки, и перезаписывает index.md только при смене хэша.
+Изменённые страницы накапливаются в docs_crawl/.changed_pages.json (каждый краул дописывает свои),
+index_to_qdrant.py --changed-only по нему решает, нужна ли индексация, а после успешной индексации
+убирает из списка учтённые записи — изменения не теряются, если между краулами индексатор упал.
+
+Там же — контрольная точка незавершённого краула (таблица frontier: найденные URL, обработанные,
+записанные файлы); crawl_docs.py --resume продолжает с неё после падения.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Iterable
+
+MANIFEST_FILE = ".crawl_manifest.sqlite3"
+CHANGES_FILE = ".changed_pages.json"
+
+
+class CrawlManifest:
+    """Записи по url: get(url) → dict или None, update(url, **поля) — вставка или обновление."""
+
+    _FIELDS = ("path_key", "etag", "last_modified", "content_hash", "links", "fetched_at")
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, path_key TEXT, etag TEXT, last_modified TEXT, "
+            "content_hash TEXT, links TEXT, fetched_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, done INTEGER NOT NULL DEFAULT 0, written TEXT)"
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def urls(self) -> set[str]:
+        return {row[0] for row in self._conn.execute("SELECT url FROM pages")}
+
+    def get(self, url: str) -> dict[str, Any] | None:
+        row = self._conn.execute(
+            f"SELECT {', '.join(self._FIELDS)} FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(self._FIELDS, row))
+        entry["links"] = json.loads(entry["links"]) if entry["links"] else []
+        return entry
+
+    def update(self, url: str, **fields: Any) -> None:
+        unknown = set(fields) - set(self._FIELDS)
+        if unknown:
+            raise ValueError(f"unknown manifest fields: {sorted(unknown)}")
+        if "links" in fields:
+            fields["links"] = json.dumps(sorted(fields["links"]))
+        fields.setdefault("fetched_at", time.time())
+        names = list(fields)
+        self._conn.execute(
+            f"INSERT INTO pages (url, {', '.join(names)}) VALUES (?, {', '.join('?' for _ in names)}) "
+            f"ON CONFLICT(url) DO UPDATE SET {', '.join(f'{n} = excluded.{n}' for n in names)}",
+            (url, *fields.values()),
+        )
+        self._conn.commit()
+
+    def remove(self, url: str) -> None:
+        self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+        self._conn.commit()
+
+    def checkpoint(self, queued: Iterable[str], done: Iterable[tuple[str, str | None]]) -> None:
+        """
+        Сохранить прогресс краула одной транзакцией: новые URL очереди и обработанные URL
+        (с путём записанного файла или None). Ссылки страницы попадают в ту же транзакцию,
+        что и отметка о ней, — после падения не теряется ни одна ветка обхода.
+        """
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO frontier (url) VALUES (?)", ((u,) for u in queued))
+            self._conn.executemany(
+                "INSERT INTO frontier (url, done, written) VALUES (?, 1, ?) "
+                "ON CONFLICT(url) DO UPDATE SET done = 1, written = excluded.written",
+                done,
+            )
+
+    def load_checkpoint(self) -> tuple[list[str], set[str], list[str]]:
+        """(необработанные URL, все найденные URL, записанные файлы) незавершённого краула."""
+        pending: list[str] = []
+        seen: set[str] = set()
+        written: list[str] = []
+        for url, done, path in self._conn.execute("SELECT url, done, written FROM frontier ORDER BY url"):
+            seen.add(url)
+            if not done:
+                pending.append(url)
+            elif path:
+                written.append(path)
+        return pending, seen, written
+
+    def clear_checkpoint(self) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM frontier")
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _load_changes(path: Path) -> dict[str, Any]:
+    if not path.exists():
+        return {"crawled_at": None, "changed": {}, "removed": {}}
+    data = json.loads(path.read_text(encoding="utf-8"))
+    for key in ("changed", "removed"):
+        if isinstance(data.get(key), list):  # файл прежнего формата — списки без времени
+            data[key] = {p: data.get("crawled_at") or 0.0 for p in data[key]}
+        data.setdefault(key, {})
+    return data
+
+
+def _save_changes(path: Path, data: dict[str, Any]) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def write_changes(docs_dir: Path, changed: list[str], removed: list[str]) -> Path:
+    """
+    Добавить изменённые и удалённые .md (пути относительно docs_dir) к ещё не проиндексированным:
+    {"changed": {путь: время краула}, "removed": {...}}. Страница, изменённая после удаления
+    (и наоборот), остаётся только в последнем списке.
+    """
+    path = docs_dir / CHANGES_FILE
+    data = _load_changes(path)
+    now = time.time()
+    for p in changed:
+        data["removed"].pop(p, None)
+        data["changed"][p] = now
+    for p in removed:
+        data["changed"].pop(p, None)
+        data["removed"][p] = now
+    data["crawled_at"] = now
+    _save_changes(path, data)
+    return path
+
+
+def read_changes(docs_dir: Path) -> dict[str, Any] | None:
+    """Накопленные с последней успешной индексации изменения или None, если краул их не оставлял."""
+    path = docs_dir / CHANGES_FILE
+    if not path.exists():
+        return None
+    return _load_changes(path)
+
+
+def acknowledge_changes(docs_dir: Path, indexed: dict[str, Any]) -> None:
+    """
+    Убрать из списка записи, учтённые индексацией (снимок read_changes до её начала). Записи,
+    добавленные краулом во время индексации (время новее снимка), остаются до следующего запуска.
+    """
+    path = docs_dir / CHANGES_FILE
+    if not path.exists():
+        return
+    data = _load_changes(path)
+    for key in ("changed", "removed"):
+        for p, ts in indexed[key].items():
+            if p in data[key] and data[key][p] <= ts:
+                del data[key][p]
+    _save_changes(path, data)
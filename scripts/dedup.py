@@ -0,0 +1,116 @@
+"""
+Поиск почти одинаковых чанков (MinHash + LSH) для index_to_qdrant.py: одни и те же блоки
+(остатки навигации, повторяющиеся примечания) встречаются на многих страницах, а перекрывающийся
+чанкинг их ещё и размножает. Дубли вытесняют полезные фрагменты из LIMIT_FIRST кандидатов.
+
+Сигнатура — 128 минимумов хэшей по шинглам из 3 слов; LSH — 16 полос по 8 строк (кандидаты
+с похожестью от ~0.7), кандидат считается дублем, если оценка Жаккара по сигнатурам ≥ threshold.
+ChunkDeduplicator поверх индекса помнит страницу каждого канонического чанка: источники дублей
+с других страниц собираются в alt_sources, дубли внутри одной страницы только считаются.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+
+import numpy as np
+
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_WORDS = 3
+THRESHOLD = 0.85
+
+_rng = np.random.default_rng(20240601)
+# Нечётные множители: (a * x + b) mod 2^64, старшие 32 бита — семейство хэшей multiply-shift
+_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set[str]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def signature(text: str) -> np.ndarray:
+    """MinHash-сигнатура текста: NUM_PERM значений uint32."""
+    items = shingles(text)
+    if not items:
+        return np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    hv = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in items),
+        dtype=np.uint64,
+        count=len(items),
+    )
+    with np.errstate(over="ignore"):
+        hashed = (hv[:, None] * _A[None, :] + _B[None, :]) >> np.uint64(32)
+    return hashed.min(axis=0).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Оценка коэффициента Жаккара по двум сигнатурам."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class NearDuplicateIndex:
+    """
+    Потоковая дедупликация: add(key, text) возвращает ключ ранее добавленного почти такого же текста
+    или None (текст новый и сам становится каноническим). Хранит сигнатуры только канонических текстов.
+    """
+
+    def __init__(self, threshold: float = THRESHOLD, bands: int = BANDS) -> None:
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self._buckets: list[dict[bytes, list[str]]] = [{} for _ in range(bands)]
+        self._signatures: dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def add(self, key: str, text: str) -> str | None:
+        sig = signature(text)
+        bands = [sig[i * self.rows : (i + 1) * self.rows].tobytes() for i in range(self.bands)]
+        checked: set[str] = set()
+        for band, bucket in zip(bands, self._buckets):
+            for other in bucket.get(band, ()):
+                if other in checked:
+                    continue
+                checked.add(other)
+                if similarity(sig, self._signatures[other]) >= self.threshold:
+                    return other
+        self._signatures[key] = sig
+        for band, bucket in zip(bands, self._buckets):
+            bucket.setdefault(band, []).append(key)
+        return None
+
+
+class ChunkDeduplicator:
+    """
+    Дедупликация чанков страниц: add(key, source, text) → True, если чанк новый и идёт в индекс.
+    Для дубля с другой страницы её source добавляется в alt_sources[канонический ключ]
+    (cross_page), дубль внутри той же страницы отбрасывается и учитывается в same_page.
+    """
+
+    def __init__(self, threshold: float = THRESHOLD, bands: int = BANDS) -> None:
+        self._index = NearDuplicateIndex(threshold, bands)
+        self._source_of: dict[str, str] = {}  # строка source одна на страницу, память почти не растёт
+        self.alt_sources: dict[str, set[str]] = {}
+        self.cross_page = 0
+        self.same_page = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def add(self, key: str, source: str, text: str) -> bool:
+        canonical = self._index.add(key, text)
+        if canonical is None:
+            self._source_of[key] = source
+            return True
+        if source == self._source_of[canonical]:
+            self.same_page += 1
+        else:
+            self.cross_page += 1
+            self.alt_sources.setdefault(canonical, set()).add(source)
+        return False
@@ -0,0 +1,109 @@
+"""
+Кэш эмбеддингов по содержимому: ключ — (модель, sha256 текста чанка), значение — вектор float32.
+Векторы дописываются в один файл vectors.f32 и читаются через memmap, индекс hash → номер строки — в SQLite.
+Один каталог на модель: data/embedding_cache/<модель>/. Используется index_to_qdrant.py
+(перед вызовом fastembed) и restore_qdrant_collection.py (заполняет кэш векторами из экспорта).
+
+Запись — сначала вектор в файл (по смещению строки _rows), потом строка индекса. При открытии файл
+обрезается до целого числа векторов (обрывок вектора после падения посреди записи), а строки индекса
+за концом файла отбрасываются — номера строк всегда совпадают со смещениями векторов в файле.
+"""
+from __future__ import annotations
+
+import re
+import sqlite3
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "embedding_cache"
+
+
+def _model_slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "__", model_name)
+
+
+class EmbeddingCache:
+    """get_many(hashes) → {hash: вектор}; put_many(hashes, vectors) добавляет отсутствующие."""
+
+    def __init__(self, model_name: str, dim: int, root: str | Path = CACHE_DIR) -> None:
+        self.model_name = model_name
+        self.dim = dim
+        self.dir = Path(root) / _model_slug(model_name)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.dir / "vectors.f32"
+        self._vectors_path.touch(exist_ok=True)
+        self._conn = sqlite3.connect(str(self.dir / "index.sqlite3"))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vectors (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._row_bytes = 4 * dim
+        self._rows = self._vectors_path.stat().st_size // self._row_bytes
+        with open(self._vectors_path, "r+b") as f:
+            f.truncate(self._rows * self._row_bytes)
+        self._conn.execute("DELETE FROM vectors WHERE row >= ?", (self._rows,))
+        self._conn.commit()
+        self._index: dict[str, int] = dict(self._conn.execute("SELECT hash, row FROM vectors"))
+        self._mmap: np.memmap | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, content_hash: str) -> bool:
+        return content_hash in self._index
+
+    def _view(self) -> Any:
+        if self._rows == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        if self._mmap is None or self._mmap.shape[0] != self._rows:
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._mmap
+
+    def get_many(self, hashes: Iterable[str]) -> dict[str, np.ndarray]:
+        found: dict[str, np.ndarray] = {}
+        view = None
+        for h in hashes:
+            row = self._index.get(h)
+            if row is None:
+                self.misses += 1
+                continue
+            if view is None:
+                view = self._view()
+            found[h] = np.array(view[row])
+            self.hits += 1
+        return found
+
+    def put_many(self, hashes: list[str], vectors: Iterable[Any], replace: bool = False) -> int:
+        """
+        Добавить векторы для ещё не закэшированных хэшей; возвращает число записанных.
+        replace=True — перезаписать и уже закэшированные (новая строка, старая больше не адресуется).
+        """
+        new_hashes: list[str] = []
+        new_vectors: list[np.ndarray] = []
+        pending: set[str] = set()
+        for h, v in zip(hashes, vectors):
+            if h in pending or (h in self._index and not replace):
+                continue
+            arr = np.asarray(v, dtype=np.float32).reshape(-1)
+            if arr.shape[0] != self.dim:
+                raise ValueError(f"vector of size {arr.shape[0]}, cache dim is {self.dim}")
+            pending.add(h)
+            new_hashes.append(h)
+            new_vectors.append(arr)
+        if not new_hashes:
+            return 0
+        with open(self._vectors_path, "r+b") as f:
+            f.seek(self._rows * self._row_bytes)
+            f.write(np.stack(new_vectors).tobytes())
+        rows = range(self._rows, self._rows + len(new_hashes))
+        self._conn.executemany("INSERT OR REPLACE INTO vectors (hash, row) VALUES (?, ?)", zip(new_hashes, rows))
+        self._conn.commit()
+        self._index.update(zip(new_hashes, rows))
+        self._rows += len(new_hashes)
+        return len(new_hashes)
+
+    def close(self) -> None:
+        self._mmap = None
+        self._conn.close()
@@ -1,64 +1,109 @@
 #!/usr/bin/env python3
 """
-Экспорт коллекции papers из Qdrant в файл data/qdrant_papers_export.jsonl.
-Нужен для переноса базы на удалённый сервер: запустить локально, скопировать data/ на сервер, там выполнить restore_qdrant_collection.py.
+Экспорт коллекции papers из Qdrant в каталог data/qdrant_papers_export/ (компактный формат
+collection_export.py: векторы float32 одним блоком, payload в gzip JSONL, манифест с sha256).
+Нужен для переноса базы на удалённый сервер: запустить локально, скопировать data/qdrant_papers_export/
+на сервер, там выполнить restore_qdrant_collection.py.
+--format jsonl — прежний файл data/qdrant_papers_export.jsonl (вектор — JSON-массив, в несколько раз больше).
 """
 from __future__ import annotations
 
+import argparse
 import json
 import os
 import sys
 from pathlib import Path
 
+import qdrant_versions
+from check_relevance import EMBEDDING_MODEL
+from collection_export import ExportWriter
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 REPO_ROOT = SCRIPT_DIR.parent
 DATA_DIR = REPO_ROOT / "data"
+EXPORT_DIR = DATA_DIR / "qdrant_papers_export"
 EXPORT_FILE = DATA_DIR / "qdrant_papers_export.jsonl"
 
 QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
 COLLECTION_NAME = os.environ.get("COLLECTION_NAME", "papers")
-VECTOR_NAME = "fast-all-minilm-l6-v2"
+VECTOR_NAME = qdrant_versions.VECTOR_NAME
+SCROLL_LIMIT = 256
+
+
+def iter_points(client, collection: str):
+    """(id, вектор, payload) всех точек коллекции постранично."""
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection,
+            limit=SCROLL_LIMIT,
+            offset=offset,
+            with_vectors=True,
+            with_payload=True,
+        )
+        for rec in records:
+            vec = rec.vector
+            if isinstance(vec, dict):
+                vec = vec.get(VECTOR_NAME, vec)
+            if hasattr(vec, "tolist"):
+                vec = vec.tolist()
+            yield rec.id, vec, rec.payload or {}
+        if not records or offset is None:
+            break
+
+
+def export_binary(client, collection: str, out_dir: Path) -> int:
+    writer = ExportWriter(out_dir, qdrant_versions.VECTOR_SIZE)
+    try:
+        for point_id, vec, payload in iter_points(client, collection):
+            writer.add(point_id, vec, payload)
+    except BaseException:
+        writer.abort()
+        raise
+    manifest = writer.finish(
+        model=EMBEDDING_MODEL,
+        vector_name=VECTOR_NAME,
+        distance="Cosine",
+        source_collection=collection,
+    )
+    size_mb = sum(f["bytes"] for f in manifest["files"].values()) / 1e6
+    print(f"Экспортировано {manifest['count']} точек в {out_dir} ({size_mb:.1f} МБ)")
+    return manifest["count"]
+
+
+def export_jsonl(client, collection: str, out_file: Path) -> int:
+    count = 0
+    with open(out_file, "w", encoding="utf-8") as f:
+        for point_id, vec, payload in iter_points(client, collection):
+            f.write(json.dumps({"id": str(point_id), "vector": vec, "payload": payload}, ensure_ascii=False) + "\n")
+            count += 1
+    print(f"Экспортировано {count} точек в {out_file} ({out_file.stat().st_size / 1e6:.1f} МБ)")
+    return count
 
 
 def main() -> None:
     from qdrant_client import QdrantClient
 
+    parser = argparse.ArgumentParser(description="Экспорт коллекции для переноса на сервер")
+    parser.add_argument("--format", choices=("binary", "jsonl"), default="binary", help="формат экспорта")
+    parser.add_argument("--output", type=Path, default=None, help="каталог (binary) или файл (jsonl)")
+    args = parser.parse_args()
+
     client = QdrantClient(url=QDRANT_URL)
-    if not client.collection_exists(COLLECTION_NAME):
+    # papers — алиас на текущую версию (или коллекция, созданная до перехода на версии)
+    collection = qdrant_versions.live_collection(client, COLLECTION_NAME)
+    if collection is None:
         print(f"Коллекция {COLLECTION_NAME!r} не найдена.", file=sys.stderr)
         sys.exit(1)
 
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    count = 0
-    offset = None
-    with open(EXPORT_FILE, "w", encoding="utf-8") as f:
-        while True:
-            records, offset = client.scroll(
-                collection_name=COLLECTION_NAME,
-                limit=100,
-                offset=offset,
-                with_vectors=True,
-                with_payload=True,
-            )
-            if not records:
-                break
-            for rec in records:
-                vec = rec.vector
-                if isinstance(vec, dict):
-                    vec = vec.get(VECTOR_NAME, vec)
-                if hasattr(vec, "tolist"):
-                    vec = vec.tolist()
-                point = {
-                    "id": str(rec.id),
-                    "vector": vec,
-                    "payload": rec.payload or {},
-                }
-                f.write(json.dumps(point, ensure_ascii=False) + "\n")
-                count += 1
-            if offset is None:
-                break
-    print(f"Экспортировано {count} точек в {EXPORT_FILE}")
-    print("Скопируйте папку data/ на сервер и выполните: python scripts/restore_qdrant_collection.py")
+    if args.format == "binary":
+        out = args.output or EXPORT_DIR
+        export_binary(client, collection, out)
+    else:
+        out = args.output or EXPORT_FILE
+        export_jsonl(client, collection, out)
+    print(f"Скопируйте {out} на сервер и выполните: python scripts/restore_qdrant_collection.py")
 
 
 if __name__ == "__main__":
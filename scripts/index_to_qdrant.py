@@ -2,31 +2,104 @@
 """
 Читает .md из docs_crawl, разбивает на чанки, эмбеддит (fastembed, 384 dim)
 и загружает в Qdrant коллекцию papers с именованным вектором fast-all-minilm-l6-v2.
-Payload: section, source, content, heading. Чанкинг по заголовкам Markdown (##, ###), длинные блоки — по размеру с перекрытием.
+Payload: section, sections (все префиксы пути раздела — для фильтра по разделу), source, content, heading.
+На section, sections и source создаются keyword-индексы — поиск с фильтром выполняется внутри HNSW Qdrant.
+
+Blue/green (по умолчанию): индекс собирается в новой версии papers_v{N}, рабочая коллекция не меняется.
+Новая версия проверяется (число точек, smoke-тест relevance_tests.json), затем алиас papers атомарно
+переключается на неё, старые версии удаляются (--keep последних остаются для отката). Неизменённые чанки
+не эмбеддятся заново — их векторы копируются из рабочей версии. --in-place — обновить рабочую
+коллекцию на месте (быстрее для мелких правок, но поиск видит промежуточное состояние).
+Чанкинг по заголовкам Markdown (##, ###), длинные блоки — по размеру с перекрытием.
+
+Индексация инкрементальная: id точки — uuid5(source + heading + sha256 чанка), хэш хранится в payload
+(content_hash). Эмбеддятся только новые/изменённые чанки; точки удалённых и изменённых фрагментов
+в новую версию не попадают (в режиме --in-place удаляются).
+--full — заново эмбеддить и перезаписать все чанки (например, после смены модели): ни рабочая версия,
+ни кэш эмбеддингов не читаются, а свежие векторы заменяют записи кэша (так чинится испорченный кэш).
+
+Тексты чанков в памяти не накапливаются: файлы читаются потоково, чанки эмбеддятся батчами, готовые
+батчи через ограниченную очередь уходят в несколько потоков upsert (wait=False), так что эмбеддинг
+следующего батча идёт одновременно с загрузкой предыдущих. Первый проход считает id (без текстов) —
+для числа чанков к эмбеддингу, ETA и списка устаревших точек. Растут с корпусом только структуры
+первого прохода: множества id (новые, из рабочей версии, из кэша), при дедупликации — MinHash-сигнатура
+(128 × uint32) и записи в 16 LSH-корзинах на каждый уникальный чанк и alt_sources, в режиме --in-place —
+страница каждой уже загруженной точки, с --token-report — длины чанков.
+
+Эмбеддинг на нескольких ядрах: --parallel N (0 — все ядра) запускает N процессов fastembed,
+каждый на одном потоке onnxruntime; --threads — потоки onnxruntime в однопроцессном режиме;
+--embed-batch-size — размер батча модели. Порядок векторов совпадает с порядком чанков.
+Сравнить конфигурации: scripts/bench_embedding.py.
+
+--chunking tokens — размер чанка меряется токенизатором модели (предел --max-tokens, 256 у MiniLM):
+текст за пределом модель отбрасывает, а кириллица даёт много токенов на символ. Разбиение по заголовкам
+сохраняется. --token-report (в режиме tokens — всегда) печатает распределение длины чанков в токенах.
+Токенизатор читается из локальной копии модели fastembed; если её нет и скачать нельзя (офлайн),
+индексация идёт с --chunking chars, о чём пишется предупреждение.
+
+Перед fastembed проверяется кэш эмбеддингов data/embedding_cache (ключ — модель + sha256 чанка, см.
+embedding_cache.py): новые векторы и векторы, скопированные из рабочей версии, в него дописываются,
+так что пересборка с другими параметрами или в новую коллекцию не эмбеддит уже виденный текст.
+--no-cache — не использовать кэш.
+
+Почти одинаковые чанки разных страниц (общие блоки, повторяющиеся примечания) схлопываются: MinHash/LSH
+(dedup.py, порог --dedup-threshold), в индекс попадает первый, источники остальных — в его payload
+alt_sources; дубли внутри одной страницы просто отбрасываются. В логе — насколько сократился индекс
+и сколько дублей пришло с других страниц и с той же. --no-dedup — без дедупликации.
+
+--changed-only — для ночного обновления: если краулы (crawl_docs.py) с последней успешной индексации
+не нашли изменённых или удалённых страниц (docs_crawl/.changed_pages.json), индексация не запускается.
+Успешная индексация (любая, не только --changed-only) убирает учтённые записи из этого списка.
 """
 from __future__ import annotations
 
+import argparse
+import functools
+import hashlib
+import queue
 import re
 import sys
+import threading
+import time
 import uuid
+from collections import deque
 from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
 
 from fastembed import TextEmbedding
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, PointStruct, VectorParams
+from qdrant_client.models import PointIdsList, PointStruct
+
+import qdrant_versions
+from crawl_manifest import CHANGES_FILE, acknowledge_changes, read_changes
+from dedup import THRESHOLD as DEDUP_THRESHOLD, ChunkDeduplicator
+from embedding_cache import EmbeddingCache
 
 DOCS_DIR = Path(__file__).resolve().parent.parent / "docs_crawl"
 QDRANT_URL = "http://localhost:6333"
+# Алиас, через который ищут rag.search и MCP; данные — в версиях papers_v{N}
 COLLECTION_NAME = "papers"
 VECTOR_NAME = "fast-all-minilm-l6-v2"
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+VECTOR_SIZE = 384
 CHUNK_SIZE = 600
 CHUNK_OVERLAP = 100
+# Режим --chunking tokens: предел модели (all-MiniLM-L6-v2 — 256 word-piece вместе с [CLS]/[SEP]) и перекрытие
+CHUNK_MAX_TOKENS = 256
+CHUNK_OVERLAP_TOKENS = 40
+# Пространство имён uuid5 для id точек: одинаковый чанк → одинаковый id при любом запуске
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://docs.kinescope.ru/#papers")
+BATCH_SIZE = 64
+# Потоков upsert и сколько готовых батчей может ждать загрузки (ограничивает память)
+UPSERT_WORKERS = 4
+UPSERT_QUEUE_SIZE = 8
+# Батч модели fastembed (по умолчанию как в fastembed)
+EMBED_BATCH_SIZE = 256
 
 
 def iter_md_files(root: Path):
-    """Рекурсивно обходит все .md файлы."""
-    for f in root.rglob("*.md"):
+    """Рекурсивно обходит все .md файлы (в стабильном порядке — от него зависит, какой из дублей останется)."""
+    for f in sorted(root.rglob("*.md")):
         yield f
 
 
@@ -38,6 +111,39 @@ def extract_section_and_source(file_path: Path, root: Path) -> tuple[str, str]:
     return section, source
 
 
+def section_prefixes(section: str) -> list[str]:
+    """Все префиксы пути раздела: "player/api/events" → ["player", "player/api", "player/api/events"]."""
+    parts = [p for p in section.split("/") if p]
+    return ["/".join(parts[: i + 1]) for i in range(len(parts))]
+
+
+def content_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def point_id(source: str, heading: str, chunk_hash: str) -> str:
+    """Детерминированный id точки: один и тот же чанк страницы всегда попадает в ту же точку."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\n{heading}\n{chunk_hash}"))
+
+
+def existing_point_ids(client: QdrantClient, collection_name: str) -> set[str]:
+    """id всех точек коллекции (без векторов и payload)."""
+    ids: set[str] = set()
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection_name,
+            limit=1000,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False,
+        )
+        ids.update(str(r.id) for r in records)
+        if offset is None:
+            break
+    return ids
+
+
 def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
     """Разбивает текст на чанки по размеру с перекрытием (по границам строк)."""
     text = re.sub(r"\n{3,}", "\n\n", text.strip())
@@ -52,7 +158,8 @@ def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP)
             if next_break > start:
                 end = next_break + 1
         chunks.append(text[start:end].strip())
-        start = end - overlap
+        # перекрытие не должно отбрасывать назад за начало чанка (короткая первая строка) — иначе цикл не продвигается
+        start = end - overlap if end - overlap > start else end
         if start >= len(text):
             break
     return [c for c in chunks if c]
@@ -95,63 +202,552 @@ def chunk_by_headers(
     return result
 
 
+def load_token_counter(model_name: str = EMBEDDING_MODEL) -> Callable[[str], int] | None:
+    """
+    Число word-piece токенов текста (без [CLS]/[SEP]) по токенизатору модели, без усечения.
+    tokenizer.json берётся из каталога модели fastembed: сначала из локального кэша, если модели там нет —
+    fastembed скачивает её, как для эмбеддинга (HF_HUB_OFFLINE=1 — только кэш). None — токенизатор недоступен.
+    """
+    try:
+        from tokenizers import Tokenizer
+
+        try:
+            model = TextEmbedding(model_name=model_name, lazy_load=True, local_files_only=True)
+        except ValueError:
+            model = TextEmbedding(model_name=model_name, lazy_load=True)
+        tokenizer = Tokenizer.from_file(str(Path(model.model._model_dir) / "tokenizer.json"))
+    except Exception as e:  # noqa: BLE001 — офлайн без кэша модели, нет tokenizers и т. п.
+        print(f"Warning: tokenizer of {model_name} is unavailable: {e!r}", file=sys.stderr, flush=True)
+        return None
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def _token_units(block: str, count_tokens: Callable[[str], int], limit: int) -> list[tuple[str, int]]:
+    """Строки блока с числом токенов; строка длиннее limit дробится по предложениям, затем по словам."""
+    units: list[tuple[str, int]] = []
+    for line in block.split("\n"):
+        if not line.strip():
+            continue
+        n = count_tokens(line)
+        if n <= limit:
+            units.append((line, n))
+            continue
+        for sentence in re.split(r"(?<=[.!?…])\s+", line):
+            n = count_tokens(sentence)
+            if n <= limit:
+                units.append((sentence, n))
+                continue
+            words: list[str] = []
+            for word in sentence.split():
+                if words and count_tokens(" ".join(words + [word])) > limit:
+                    units.append((" ".join(words), count_tokens(" ".join(words))))
+                    words = []
+                words.append(word)
+            if words:
+                units.append((" ".join(words), count_tokens(" ".join(words))))
+    return units
+
+
+def chunk_by_tokens(
+    text: str,
+    count_tokens: Callable[[str], int],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> list[tuple[str, str]]:
+    """
+    Как chunk_by_headers, но размер меряется токенизатором модели: каждый чанк вместе с [CLS]/[SEP]
+    укладывается в max_tokens (у MiniLM всё, что дальше 256 токенов, не попадает в эмбеддинг).
+    Длинные блоки собираются из целых строк (при необходимости — предложений и слов), следующий чанк
+    начинается с последних строк предыдущего на ~overlap_tokens. Возвращает (heading, chunk).
+    """
+    budget = max_tokens - 2
+    result: list[tuple[str, str]] = []
+    for heading, block in split_by_headers(text):
+        if count_tokens(block) <= budget:
+            if len(block) >= 50:
+                result.append((heading, block))
+            continue
+        current: list[tuple[str, int]] = []
+        size = 0
+        for unit, n in _token_units(block, count_tokens, budget):
+            if current and size + n > budget:
+                chunk = "\n".join(u for u, _ in current).strip()
+                if len(chunk) >= 50:
+                    result.append((heading, chunk))
+                # перекрытие: хвостовые строки предыдущего чанка, если они оставляют место для новой
+                tail: list[tuple[str, int]] = []
+                tail_size = 0
+                for u, un in reversed(current):
+                    if tail_size + un > overlap_tokens or tail_size + un + n > budget:
+                        break
+                    tail.insert(0, (u, un))
+                    tail_size += un
+                current, size = tail, tail_size
+            current.append((unit, n))
+            size += n
+        chunk = "\n".join(u for u, _ in current).strip()
+        if len(chunk) >= 50:
+            result.append((heading, chunk))
+    return result
+
+
+def token_length_report(lengths: list[int], max_tokens: int = CHUNK_MAX_TOKENS) -> str:
+    """Распределение длины чанков в токенах (с [CLS]/[SEP]): перцентили, гистограмма, сколько усечётся моделью."""
+    if not lengths:
+        return "Token lengths: no chunks"
+    ordered = sorted(lengths)
+
+    def pct(q: float) -> int:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    over = sum(1 for n in ordered if n > max_tokens)
+    lines = [
+        f"Token lengths ({len(ordered)} chunks): min {ordered[0]}, p50 {pct(0.5)}, p90 {pct(0.9)}, "
+        f"p99 {pct(0.99)}, max {ordered[-1]}; over {max_tokens} (truncated by the model): {over} ({over / len(ordered):.1%})"
+    ]
+    step = max(1, max_tokens // 8)
+    buckets = [(lo + 1, min(lo + step, max_tokens)) for lo in range(0, max_tokens, step)]
+    for lo, hi in buckets:
+        n = sum(1 for x in ordered if lo <= x <= hi)
+        lines.append(f"  {lo:>5}-{hi:<5} {n:>6} {'#' * round(40 * n / len(ordered))}")
+    lines.append(f"  {'>' + str(max_tokens):<11} {over:>6} {'#' * round(40 * over / len(ordered))}")
+    return "\n".join(lines)
+
+
+Chunker = Callable[[str], list[tuple[str, str]]]
+
+
+def iter_chunks(root: Path, chunker: Chunker = chunk_by_headers) -> Iterator[tuple[str, str, str, str, str, str]]:
+    """Потоково: (id, section, source, chunk, heading, content_hash) по всем .md."""
+    for md_file in iter_md_files(root):
+        raw = md_file.read_text(encoding="utf-8")
+        title_match = re.match(r"^#\s+Source:\s*\S+\s*\n\n", raw)
+        body = raw[title_match.end() :] if title_match else raw
+        section, source = extract_section_and_source(md_file, root)
+        for heading, chunk in chunker(body):
+            h = content_hash(chunk)
+            yield point_id(source, heading, h), section, source, chunk, heading, h
+
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    batch: list[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_embedder(threads: int | None = None, parallel: int | None = None) -> TextEmbedding:
+    """
+    Модель эмбеддингов. В режиме parallel модель загружается в процессах-воркерах fastembed,
+    главному процессу она не нужна (lazy_load).
+    """
+    return TextEmbedding(model_name=EMBEDDING_MODEL, threads=threads, lazy_load=bool(parallel is not None and parallel != 1))
+
+
+def embed_stream(
+    embedder: TextEmbedding,
+    items: Iterable[Any],
+    text: Callable[[Any], str],
+    *,
+    batch_size: int = EMBED_BATCH_SIZE,
+    parallel: int | None = None,
+) -> Iterator[tuple[Any, Any]]:
+    """
+    (item, vector) в порядке items. Один вызов embed() на весь поток: пул процессов fastembed (parallel)
+    создаётся один раз, а не на каждый батч; ordered_map сохраняет порядок, так что вектор сопоставляется
+    с элементом через очередь ещё не обработанных элементов.
+    """
+    pending: deque[Any] = deque()
+
+    def texts() -> Iterator[str]:
+        for item in items:
+            pending.append(item)
+            yield text(item)
+
+    for vector in embedder.embed(texts(), batch_size=batch_size, parallel=None if parallel == 1 else parallel):
+        yield pending.popleft(), vector
+
+
+class Upserter:
+    """
+    Пул потоков upsert с ограниченной очередью: put() блокируется, пока в очереди upsert_queue батчей,
+    так что эмбеддинг не убегает вперёд загрузки. Ошибка любого потока пробрасывается из put()/close().
+    """
+
+    def __init__(self, client: QdrantClient, collection_name: str, workers: int, queue_size: int) -> None:
+        self.client = client
+        self.collection_name = collection_name
+        self.upserted = 0
+        self._queue: queue.Queue[list[PointStruct] | None] = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self._error: BaseException | None = None
+        self._stopped = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"upsert-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _worker(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            try:
+                if self._error is None:
+                    self.client.upsert(collection_name=self.collection_name, points=batch, wait=False)
+                    with self._lock:
+                        self.upserted += len(batch)
+            except BaseException as e:  # noqa: BLE001 — отдаём в главный поток
+                self._error = e
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"upsert failed: {self._error!r}") from self._error
+
+    def put(self, batch: list[PointStruct]) -> None:
+        self._raise_if_failed()
+        self._queue.put(batch)
+
+    def _stop(self) -> None:
+        if self._stopped:
+            return
+        self._stopped = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+
+    def close(self) -> None:
+        self._stop()
+        self._raise_if_failed()
+
+    def abort(self) -> None:
+        """Остановить потоки, отбросив ещё не загруженные батчи (сборка прервана)."""
+        self._error = self._error or RuntimeError("aborted")
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._stop()  # после close() — уже остановлены
+
+
+def make_point(
+    pid: str, section: str, source: str, chunk: str, heading: str, h: str, vector: Any, alt_sources: Iterable[str] = ()
+) -> PointStruct:
+    return PointStruct(
+        id=pid,
+        vector={VECTOR_NAME: vector},
+        payload={
+            "section": section,
+            "sections": section_prefixes(section),
+            "source": source,
+            "content": chunk,
+            "heading": heading,
+            "content_hash": h,
+            "alt_sources": sorted(set(alt_sources) - {source}),
+        },
+    )
+
+
+def copy_points(
+    client: QdrantClient,
+    from_collection: str,
+    items: Iterable[tuple[str, str, str, str, str, str]],
+    batch_size: int,
+    alt_sources: dict[str, set[str]],
+) -> Iterator[list[PointStruct]]:
+    """Батчи точек для неизменённых чанков: векторы берутся из рабочей версии, payload строится заново."""
+    for batch in iter_batches(items, batch_size):
+        records = client.retrieve(
+            collection_name=from_collection,
+            ids=[item[0] for item in batch],
+            with_vectors=[VECTOR_NAME],
+            with_payload=False,
+        )
+        vectors = {str(r.id): (r.vector or {}).get(VECTOR_NAME) for r in records}
+        yield [
+            make_point(*item, vectors[item[0]], alt_sources.get(item[0], ()))
+            for item in batch
+            if vectors.get(item[0]) is not None
+        ]
+
+
+def _format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 60}m{seconds % 60:02d}s" if seconds >= 60 else f"{seconds}s"
+
+
+def validate_version(client: QdrantClient, collection_name: str, expected: int, skip_smoke: bool, min_pass: float) -> bool:
+    """Число точек совпадает с числом чанков и smoke-тест релевантности проходит не хуже min_pass."""
+    count = qdrant_versions.wait_for_count(client, collection_name, expected)
+    if count != expected:
+        print(f"Validation failed: {collection_name} has {count} points, expected {expected}", file=sys.stderr)
+        return False
+    print(f"Validated point count: {count}", flush=True)
+    if skip_smoke:
+        return True
+    from check_relevance import smoke_test
+
+    embedder = load_embedder()
+    passed, total, failed = smoke_test(embedder, client, collection_name)
+    shown = ", ".join(failed[:10]) + (", …" if len(failed) > 10 else "")
+    print(f"Relevance smoke test: {passed}/{total} passed" + (f", failed: {shown}" if failed else ""), flush=True)
+    if total and passed / total < min_pass:
+        print(f"Validation failed: smoke test below {min_pass:.0%}", file=sys.stderr)
+        return False
+    return True
+
+
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Инкрементальная индексация docs_crawl в Qdrant")
+    parser.add_argument("--full", action="store_true", help="заново эмбеддить все чанки (без кэша, записи кэша заменяются)")
+    parser.add_argument("--in-place", action="store_true", help="обновить рабочую коллекцию на месте, без новой версии")
+    parser.add_argument("--keep", type=int, default=qdrant_versions.KEEP_VERSIONS, help="сколько старых версий оставить")
+    parser.add_argument("--skip-smoke", action="store_true", help="не запускать smoke-тест релевантности")
+    parser.add_argument("--min-pass", type=float, default=0.8, help="доля пройденных smoke-тестов для переключения")
+    parser.add_argument(
+        "--chunking", choices=("chars", "tokens"), default="chars",
+        help="размер чанка в символах (CHUNK_SIZE) или в токенах модели (--max-tokens)",
+    )
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_MAX_TOKENS, help="предел чанка в токенах (с [CLS]/[SEP])")
+    parser.add_argument("--overlap-tokens", type=int, default=CHUNK_OVERLAP_TOKENS, help="перекрытие чанков в токенах")
+    parser.add_argument("--token-report", action="store_true", help="распределение длины чанков в токенах")
+    parser.add_argument("--no-cache", action="store_true", help="не использовать кэш эмбеддингов")
+    parser.add_argument("--no-dedup", action="store_true", help="не схлопывать почти одинаковые чанки")
+    parser.add_argument(
+        "--dedup-threshold", type=float, default=DEDUP_THRESHOLD, help="похожесть (Жаккар по шинглам), с которой чанк — дубль"
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="точек в батче upsert")
+    parser.add_argument("--upsert-workers", type=int, default=UPSERT_WORKERS, help="параллельных потоков upsert")
+    parser.add_argument("--queue-size", type=int, default=UPSERT_QUEUE_SIZE, help="батчей в очереди на upsert")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE, help="размер батча модели")
+    parser.add_argument(
+        "--parallel", type=int, default=None, help="процессов эмбеддинга (0 — все ядра; по умолчанию один процесс)"
+    )
+    parser.add_argument("--threads", type=int, default=None, help="потоков onnxruntime в однопроцессном режиме")
+    parser.add_argument(
+        "--changed-only", action="store_true", help=f"ничего не делать, если в {CHANGES_FILE} нет изменений"
+    )
+    args = parser.parse_args()
+
     if not DOCS_DIR.exists():
         print(f"Run crawl first: python scripts/crawl_docs.py\nDocs dir missing: {DOCS_DIR}", file=sys.stderr)
         sys.exit(1)
+    # Снимок до чтения docs_crawl: после успеха учтённые изменения убираются из списка
+    changes = read_changes(DOCS_DIR)
+    if args.changed_only:
+        if changes is not None and not changes["changed"] and not changes["removed"]:
+            print("No pages changed since the last crawl, nothing to index", flush=True)
+            return
+        if changes is not None:
+            print(f"Crawl changes: {len(changes['changed'])} changed, {len(changes['removed'])} removed pages", flush=True)
+
+    count_tokens = load_token_counter() if args.chunking == "tokens" or args.token_report else None
+    if count_tokens is None and args.chunking == "tokens":
+        print("Warning: falling back to --chunking chars", file=sys.stderr, flush=True)
+        args.chunking = "chars"
+    chunker: Chunker = chunk_by_headers
+    if args.chunking == "tokens":
+        chunker = functools.partial(
+            chunk_by_tokens, count_tokens=count_tokens, max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens
+        )
 
-    print("Loading embedding model", EMBEDDING_MODEL, "...", flush=True)
-    embedder = TextEmbedding(model_name=EMBEDDING_MODEL)
     print("Connecting to Qdrant", QDRANT_URL, "...", flush=True)
     client = QdrantClient(url=QDRANT_URL)
 
-    collections = client.get_collections().collections
-    if not any(c.name == COLLECTION_NAME for c in collections):
-        client.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config={
-                VECTOR_NAME: VectorParams(size=384, distance=Distance.COSINE),
-            },
-        )
-        print("Created collection", COLLECTION_NAME, flush=True)
+    live = qdrant_versions.live_collection(client, COLLECTION_NAME)
+    if args.in_place and live is not None:
+        target = live
+        qdrant_versions.ensure_payload_indexes(client, target)
+    else:
+        target = qdrant_versions.create_next_version(client, COLLECTION_NAME)
+        print("Created collection", target, flush=True)
+    print(f"Live collection: {live or '-'}, writing into: {target}", flush=True)
 
-    items: list[tuple[str, str, str, str]] = []
-    for md_file in iter_md_files(DOCS_DIR):
-        raw = md_file.read_text(encoding="utf-8")
-        title_match = re.match(r"^#\s+Source:\s*\S+\s*\n\n", raw)
-        body = raw[title_match.end() :] if title_match else raw
-        section, source = extract_section_and_source(md_file, DOCS_DIR)
-        for heading, chunk in chunk_by_headers(body):
-            items.append((section, source, chunk, heading))
+    cache = None if args.no_cache else EmbeddingCache(EMBEDDING_MODEL, VECTOR_SIZE)
+    existing = existing_point_ids(client, live) if live is not None else set()
 
-    if not items:
+    # Проход 1: только id — сколько эмбеддить и что удалить (тексты в памяти не держим)
+    wanted: set[str] = set()
+    cached: set[str] = set()
+    token_lengths: list[int] = []
+    dedup = None if args.no_dedup else ChunkDeduplicator(args.dedup_threshold)
+    # На месте: страница уже загруженных точек — их alt_sources переписываются без перезаписи точки
+    existing_source: dict[str, str] = {}
+    all_chunks = 0
+    for item in iter_chunks(DOCS_DIR, chunker):
+        pid, _, source, chunk, _, h = item
+        if pid in wanted:
+            continue
+        all_chunks += 1
+        if dedup is not None and not dedup.add(pid, source, chunk):
+            continue
+        wanted.add(pid)
+        if target == live and pid in existing:
+            existing_source[pid] = source
+        if cache is not None and not args.full and h in cache:
+            cached.add(pid)
+        if count_tokens is not None:
+            token_lengths.append(count_tokens(item[3]) + 2)
+    alt_sources: dict[str, set[str]] = {}
+    if dedup is not None:
+        dropped = all_chunks - len(wanted)
+        alt_sources = dedup.alt_sources
+        print(
+            f"Dedup: {all_chunks} -> {len(wanted)} chunks (-{dropped}, {dropped / max(all_chunks, 1):.1%}: "
+            f"{dedup.cross_page} from other pages, {dedup.same_page} within the same page), "
+            f"{len(alt_sources)} chunks with alternate sources",
+            flush=True,
+        )
+    del dedup
+    if count_tokens is not None:
+        print(f"Chunking: {args.chunking}", flush=True)
+        print(token_length_report(token_lengths, args.max_tokens), flush=True)
+    del token_lengths
+    if not wanted:
         print("No chunks to index.", file=sys.stderr)
+        if target != live:
+            qdrant_versions.drop_version(client, target)
         sys.exit(1)
+    reuse = set() if args.full else wanted & existing
+    cached -= reuse
+    stale = sorted(existing - wanted) if target == live else []
+    total = len(wanted) - len(reuse) - len(cached)
+    print(
+        f"Chunks: {len(wanted)}, in live collection: {len(existing)}, to embed: {total}, "
+        f"from cache: {len(cached)}, to copy: {len(reuse) if target != live else 0}, to delete: {len(stale)}",
+        flush=True,
+    )
+    expected = len(wanted)
 
-    texts = [item[2] for item in items]
-    print("Embedding", len(texts), "chunks ...", flush=True)
-    vectors = list(embedder.embed(texts))
-    points = [
-        PointStruct(
-            id=str(uuid.uuid4()),
-            vector={VECTOR_NAME: vectors[i]},
-            payload={
-                "section": section,
-                "source": source,
-                "content": chunk,
-                "heading": heading,
-            },
-        )
-        for i, (section, source, chunk, heading) in enumerate(items)
-    ]
+    upserter = Upserter(client, target, args.upsert_workers, args.queue_size)
+    embedded = 0
+    try:
+        # Проход 2a (новая версия): неизменённые чанки — копия векторов из рабочей версии
+        if target != live and reuse:
+            copied_ids: set[str] = set()
+
+            def to_copy() -> Iterator[tuple[str, str, str, str, str, str]]:
+                for item in iter_chunks(DOCS_DIR, chunker):
+                    if item[0] in reuse and item[0] not in copied_ids:
+                        copied_ids.add(item[0])
+                        yield item
+
+            for batch in copy_points(client, live, to_copy(), max(1, args.batch_size), alt_sources):
+                upserter.put(batch)
+                if cache is not None:
+                    cache.put_many([pt.payload["content_hash"] for pt in batch], [pt.vector[VECTOR_NAME] for pt in batch])
+            print(f"Copied {len(copied_ids)} unchanged chunks from {live}", flush=True)
+
+        # Проход 2b: чанки, векторы которых уже есть в кэше эмбеддингов
+        if cached:
+            from_cache: set[str] = set()
+
+            def to_load() -> Iterator[tuple[str, str, str, str, str, str]]:
+                for item in iter_chunks(DOCS_DIR, chunker):
+                    if item[0] in cached and item[0] not in from_cache:
+                        from_cache.add(item[0])
+                        yield item
+
+            for batch in iter_batches(to_load(), max(1, args.batch_size)):
+                vectors = cache.get_many(item[5] for item in batch)
+                upserter.put([make_point(*item, vectors[item[5]].tolist(), alt_sources.get(item[0], ())) for item in batch])
+            print(f"Loaded {len(from_cache)} chunks from the embedding cache", flush=True)
 
-    batch_size = 64
-    for j in range(0, len(points), batch_size):
-        batch = points[j : j + batch_size]
-        client.upsert(collection_name=COLLECTION_NAME, points=batch)
-        print(f"  upserted {j + len(batch)} / {len(points)}", flush=True)
+        # Проход 2c: файлы → чанки → батчи эмбеддинга → очередь → параллельный upsert
+        if total:
+            print("Loading embedding model", EMBEDDING_MODEL, "...", flush=True)
+            embedder = load_embedder(args.threads, args.parallel)
+            seen: set[str] = set()
 
-    print("Indexed", len(points), "points into", COLLECTION_NAME, flush=True)
+            def todo() -> Iterator[tuple[str, str, str, str, str, str]]:
+                # дубли чанка на одной странице дают один id — эмбеддим один раз
+                for item in iter_chunks(DOCS_DIR, chunker):
+                    pid = item[0]
+                    if pid in seen or pid in reuse or pid in cached or pid not in wanted:
+                        continue
+                    seen.add(pid)
+                    yield item
+
+            t0 = time.perf_counter()
+            vectors = embed_stream(
+                embedder, todo(), lambda item: item[3], batch_size=args.embed_batch_size, parallel=args.parallel
+            )
+            for batch in iter_batches(vectors, max(1, args.batch_size)):
+                upserter.put([make_point(*item, vector, alt_sources.get(item[0], ())) for item, vector in batch])
+                if cache is not None:
+                    cache.put_many([item[5] for item, _ in batch], [vector for _, vector in batch], replace=args.full)
+                embedded += len(batch)
+                elapsed = time.perf_counter() - t0
+                rate = embedded / elapsed if elapsed > 0 else 0.0
+                eta = _format_eta((total - embedded) / rate) if rate else "?"
+                print(
+                    f"  embedded {embedded} / {total}, upserted {upserter.upserted}, "
+                    f"{rate:.1f} chunks/s, ETA {eta}",
+                    flush=True,
+                )
+            elapsed = time.perf_counter() - t0
+            print(
+                f"Embedded {embedded} chunks in {elapsed:.1f}s ({embedded / max(elapsed, 1e-9):.1f} chunks/s)",
+                flush=True,
+            )
+        # Внутри try: close() пробрасывает ошибку фонового upsert — и тогда недособранная версия удаляется
+        upserter.close()
+    except BaseException:
+        if target != live:
+            upserter.abort()
+            qdrant_versions.drop_version(client, target)
+        raise
+    finally:
+        if cache is not None:
+            cache.close()
+
+    if target == live:
+        # На месте: удаляем после загрузки новых, чтобы поиск не оставался без изменённых страниц
+        for j in range(0, len(stale), 1000):
+            client.delete(collection_name=target, points_selector=PointIdsList(points=stale[j : j + 1000]))
+        if stale:
+            print("Deleted", len(stale), "stale points", flush=True)
+        # Неизменённые точки не перезаписывались — alt_sources пишем заново всем, в том числе пустой
+        # список точкам, у которых дубли пропали (или --no-dedup); точки с одинаковым списком — одним запросом
+        by_alt: dict[tuple[str, ...], list[str]] = {}
+        for pid in reuse:
+            alts = tuple(sorted(alt_sources.get(pid, set()) - {existing_source[pid]}))
+            by_alt.setdefault(alts, []).append(pid)
+        for alts, pids in by_alt.items():
+            for j in range(0, len(pids), 1000):
+                client.set_payload(collection_name=target, payload={"alt_sources": list(alts)}, points=pids[j : j + 1000])
+        print(
+            f"Updated {target} in place: {embedded} embedded, {len(cached)} from cache, {len(stale)} deleted", flush=True
+        )
+        if changes is not None:
+            acknowledge_changes(DOCS_DIR, changes)
+        return
+
+    if not validate_version(client, target, expected, args.skip_smoke, args.min_pass):
+        qdrant_versions.drop_version(client, target)
+        print(f"Dropped {target}; {COLLECTION_NAME} still points to {live or '-'}", file=sys.stderr)
+        sys.exit(1)
+    previous = qdrant_versions.switch_alias(client, COLLECTION_NAME, target)
+    print(f"Alias {COLLECTION_NAME}: {previous or live or '-'} -> {target}", flush=True)
+    removed = qdrant_versions.gc_versions(client, COLLECTION_NAME, keep=args.keep)
+    if removed:
+        print("Removed old versions:", ", ".join(removed), flush=True)
+    print(
+        f"Indexed {expected} chunks into {target}: {embedded} embedded, {len(cached)} from cache, "
+        f"{expected - embedded - len(cached)} copied",
+        flush=True,
+    )
+    if changes is not None:
+        acknowledge_changes(DOCS_DIR, changes)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+"""
+Версии коллекции для blue/green-переиндексации: данные лежат в papers_v1, papers_v2, …,
+поиск (rag.search, MCP, бэкенд) обращается к алиасу papers. Новая версия собирается рядом с рабочей,
+проверяется и подключается одной атомарной операцией над алиасами; старые версии удаляются.
+Используется index_to_qdrant.py и restore_qdrant_collection.py.
+"""
+from __future__ import annotations
+
+import re
+import time
+from typing import Any
+
+VECTOR_NAME = "fast-all-minilm-l6-v2"
+VECTOR_SIZE = 384
+# Поля payload с keyword-индексом (фильтры rag.search: section → sections, source)
+KEYWORD_INDEX_FIELDS = ("section", "sections", "source")
+# Сколько предыдущих версий оставлять для отката
+KEEP_VERSIONS = 1
+
+
+def version_name(alias: str, version: int) -> str:
+    return f"{alias}_v{version}"
+
+
+def _versions(client: Any, alias: str) -> list[tuple[int, str]]:
+    """(номер, имя) всех версий алиаса, по возрастанию."""
+    pattern = re.compile(rf"^{re.escape(alias)}_v(\d+)$")
+    found = []
+    for c in client.get_collections().collections:
+        m = pattern.match(c.name)
+        if m:
+            found.append((int(m.group(1)), c.name))
+    return sorted(found)
+
+
+def resolve_alias(client: Any, alias: str) -> str | None:
+    """Коллекция, на которую указывает алиас; None — алиаса нет."""
+    for a in client.get_aliases().aliases:
+        if a.alias_name == alias:
+            return a.collection_name
+    return None
+
+
+def is_legacy_collection(client: Any, alias: str) -> bool:
+    """Под именем алиаса лежит обычная коллекция (индексация до перехода на версии)."""
+    return any(c.name == alias for c in client.get_collections().collections)
+
+
+def live_collection(client: Any, alias: str) -> str | None:
+    """Коллекция, которую сейчас видит поиск: цель алиаса, старая коллекция с тем же именем или None."""
+    target = resolve_alias(client, alias)
+    if target is not None:
+        return target
+    return alias if is_legacy_collection(client, alias) else None
+
+
+def ensure_payload_indexes(client: Any, collection_name: str) -> None:
+    """Keyword-индексы для фильтрованного поиска; уже существующие пропускаются."""
+    from qdrant_client.models import PayloadSchemaType
+
+    info = client.get_collection(collection_name)
+    existing = set((getattr(info, "payload_schema", None) or {}).keys())
+    for field in KEYWORD_INDEX_FIELDS:
+        if field in existing:
+            continue
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field,
+            field_schema=PayloadSchemaType.KEYWORD,
+        )
+
+
+def create_collection(client: Any, collection_name: str) -> None:
+    from qdrant_client.models import Distance, VectorParams
+
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={VECTOR_NAME: VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE)},
+    )
+    ensure_payload_indexes(client, collection_name)
+
+
+def create_next_version(client: Any, alias: str) -> str:
+    """Создать пустую коллекцию следующей версии (с индексами payload) и вернуть её имя."""
+    versions = _versions(client, alias)
+    name = version_name(alias, versions[-1][0] + 1 if versions else 1)
+    create_collection(client, name)
+    return name
+
+
+def wait_for_count(client: Any, collection_name: str, expected: int, timeout: float = 120.0) -> int:
+    """
+    Дождаться, пока в коллекции окажется expected точек (upsert с wait=False применяются асинхронно).
+    Возвращает итоговое число точек — вызывающий сравнивает его с expected.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        count = client.count(collection_name=collection_name, exact=True).count
+        if count == expected or time.monotonic() >= deadline:
+            return count
+        time.sleep(0.5)
+
+
+def switch_alias(client: Any, alias: str, collection_name: str) -> str | None:
+    """
+    Переключить алиас на collection_name одной операцией (поиск видит либо старую, либо новую версию).
+    Если под именем алиаса лежит старая коллекция, она удаляется непосредственно перед созданием алиаса —
+    одноразовая миграция с коротким окном без данных. Возвращает предыдущую цель алиаса.
+    """
+    from qdrant_client.models import CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+
+    previous = resolve_alias(client, alias)
+    operations: list[Any] = []
+    if previous is not None:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    elif is_legacy_collection(client, alias):
+        client.delete_collection(alias)
+    operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection_name, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    return previous
+
+
+def gc_versions(client: Any, alias: str, keep: int = KEEP_VERSIONS) -> list[str]:
+    """Удалить версии старше текущей, кроме keep последних (для отката). Возвращает удалённые имена."""
+    current = resolve_alias(client, alias)
+    versions = _versions(client, alias)
+    current_num = next((n for n, name in versions if name == current), None)
+    if current_num is None:
+        return []
+    older = [name for n, name in versions if n < current_num]
+    removed = older[: max(0, len(older) - max(0, keep))]
+    for name in removed:
+        client.delete_collection(name)
+    return removed
+
+
+def drop_version(client: Any, collection_name: str) -> None:
+    """Удалить несостоявшуюся версию (не прошла проверку); коллекцию, на которую указывает алиас, не трогает."""
+    if any(a.collection_name == collection_name for a in client.get_aliases().aliases):
+        raise ValueError(f"{collection_name} is live (aliased), refusing to drop it")
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
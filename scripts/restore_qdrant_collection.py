@@ -1,68 +1,161 @@
 #!/usr/bin/env python3
 """
-Восстановление коллекции papers в Qdrant из файла data/qdrant_papers_export.jsonl.
+Восстановление коллекции papers в Qdrant из экспорта export_qdrant_collection.py: каталога
+data/qdrant_papers_export/ (компактный формат, файлы сверяются с sha256 из манифеста) или прежнего
+файла data/qdrant_papers_export.jsonl. Экспорт читается потоково батчами, upsert идёт в --workers
+потоков с ограниченным числом батчей в полёте — память не зависит от размера коллекции.
 Запускать на сервере после docker compose up (Qdrant уже работает). Укажите QDRANT_URL (например http://localhost:6333).
+Точки загружаются в новую версию papers_v{N}; после проверки числа точек (и smoke-теста с --smoke)
+алиас papers переключается на неё, старые версии удаляются. Поиск не видит пустой или частичной коллекции.
+Векторы из экспорта заодно заносятся в кэш эмбеддингов (data/embedding_cache), чтобы последующая
+индексация на этом сервере не эмбеддила уже известные чанки заново (--no-cache — не заносить).
 """
 from __future__ import annotations
 
-import json
+import argparse
+import hashlib
 import os
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import qdrant_versions
+from check_relevance import EMBEDDING_MODEL
+from collection_export import MANIFEST_FILE, iter_export_batches, read_manifest, verify_export
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 REPO_ROOT = SCRIPT_DIR.parent
+EXPORT_DIR = REPO_ROOT / "data" / "qdrant_papers_export"
 EXPORT_FILE = REPO_ROOT / "data" / "qdrant_papers_export.jsonl"
 
 QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
 COLLECTION_NAME = os.environ.get("COLLECTION_NAME", "papers")
-VECTOR_NAME = "fast-all-minilm-l6-v2"
-VECTOR_SIZE = 384
+VECTOR_NAME = qdrant_versions.VECTOR_NAME
+BATCH_SIZE = 256
+UPSERT_WORKERS = 4
+
+
+def check_manifest(manifest: dict) -> list[str]:
+    """Совместим ли экспорт с коллекцией и моделью поиска; возвращает список несовпадений."""
+    problems = []
+    if manifest.get("dim") != qdrant_versions.VECTOR_SIZE:
+        problems.append(f"размерность {manifest.get('dim')} вместо {qdrant_versions.VECTOR_SIZE}")
+    if manifest.get("model") != EMBEDDING_MODEL:
+        problems.append(f"модель {manifest.get('model')!r} вместо {EMBEDDING_MODEL!r}")
+    if manifest.get("vector_name") != VECTOR_NAME:
+        problems.append(f"вектор {manifest.get('vector_name')!r} вместо {VECTOR_NAME!r}")
+    return problems
+
+
+def seed_cache(cache, vectors, payloads) -> int:
+    """Занести векторы батча в кэш эмбеддингов (ключ — content_hash или sha256 content)."""
+    hashes, rows = [], []
+    for i, payload in enumerate(payloads):
+        content = (payload or {}).get("content")
+        if not content:
+            continue
+        hashes.append(payload.get("content_hash") or hashlib.sha256(content.encode("utf-8")).hexdigest())
+        rows.append(vectors[i])
+    return cache.put_many(hashes, rows)
 
 
 def main() -> None:
     from qdrant_client import QdrantClient
-    from qdrant_client.models import Distance, PointStruct, VectorParams
+    from qdrant_client.models import PointStruct
+
+    parser = argparse.ArgumentParser(description="Восстановление коллекции из экспорта в новую версию")
+    parser.add_argument("--smoke", action="store_true", help="smoke-тест релевантности перед переключением (нужен fastembed)")
+    parser.add_argument("--min-pass", type=float, default=0.8, help="доля пройденных smoke-тестов для переключения")
+    parser.add_argument("--no-cache", action="store_true", help="не заносить векторы в кэш эмбеддингов")
+    parser.add_argument("--keep", type=int, default=qdrant_versions.KEEP_VERSIONS, help="сколько старых версий оставить")
+    parser.add_argument("--input", type=Path, default=None, help="каталог экспорта или .jsonl (по умолчанию data/)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="точек в батче upsert")
+    parser.add_argument("--workers", type=int, default=UPSERT_WORKERS, help="параллельных потоков upsert")
+    parser.add_argument("--no-verify", action="store_true", help="не сверять sha256 файлов с манифестом")
+    args = parser.parse_args()
 
-    if not EXPORT_FILE.exists():
-        print(f"Файл не найден: {EXPORT_FILE}", file=sys.stderr)
+    source = args.input or (EXPORT_DIR if (EXPORT_DIR / MANIFEST_FILE).exists() else EXPORT_FILE)
+    if not source.exists():
+        print(f"Экспорт не найден: {source}", file=sys.stderr)
         print("Сначала выполните export_qdrant_collection.py на машине с заполненной коллекцией.", file=sys.stderr)
         sys.exit(1)
+    manifest = None
+    if source.is_dir():
+        manifest = read_manifest(source)
+        problems = check_manifest(manifest)
+        if not args.no_verify:
+            problems += verify_export(source, manifest)
+        if problems:
+            print(f"Экспорт {source} не подходит: " + "; ".join(problems), file=sys.stderr)
+            sys.exit(1)
+        print(f"Экспорт {source}: {manifest['count']} точек, модель {manifest['model']}, от {manifest['exported_at']}")
 
     client = QdrantClient(url=QDRANT_URL)
-    if client.collection_exists(COLLECTION_NAME):
-        client.delete_collection(COLLECTION_NAME)
-    client.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config={
-            VECTOR_NAME: VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
-        },
-    )
-
-    points = []
-    with open(EXPORT_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            obj = json.loads(line)
-            points.append(
-                PointStruct(
-                    id=obj["id"],
-                    vector={VECTOR_NAME: obj["vector"]},
-                    payload=obj["payload"],
-                )
-            )
-
-    if not points:
-        print("В файле нет точек.", file=sys.stderr)
+    live = qdrant_versions.live_collection(client, COLLECTION_NAME)
+    target = qdrant_versions.create_next_version(client, COLLECTION_NAME)
+    print(f"Рабочая коллекция: {live or '-'}, загрузка в {target}")
+
+    cache = None
+    if not args.no_cache:
+        from embedding_cache import EmbeddingCache
+
+        cache = EmbeddingCache(EMBEDDING_MODEL, qdrant_versions.VECTOR_SIZE)
+    total = 0
+    added = 0
+    in_flight: deque = deque()
+    max_in_flight = max(1, args.workers) * 2
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            for ids, vectors, payloads in iter_export_batches(source, args.batch_size, manifest, VECTOR_NAME):
+                if cache is not None:
+                    added += seed_cache(cache, vectors, payloads)
+                points = [
+                    PointStruct(id=pid, vector={VECTOR_NAME: vec.tolist()}, payload=payload)
+                    for pid, vec, payload in zip(ids, vectors, payloads)
+                ]
+                # Не больше max_in_flight батчей в очереди — чтение экспорта ждёт загрузку
+                while len(in_flight) >= max_in_flight:
+                    in_flight.popleft().result()
+                in_flight.append(pool.submit(client.upsert, collection_name=target, points=points))
+                total += len(points)
+            while in_flight:
+                in_flight.popleft().result()
+    except BaseException:
+        qdrant_versions.drop_version(client, target)
+        raise
+    finally:
+        if cache is not None:
+            cache.close()
+    if cache is not None:
+        print(f"В кэш эмбеддингов добавлено {added} векторов.")
+
+    if not total:
+        print("В экспорте нет точек.", file=sys.stderr)
+        qdrant_versions.drop_version(client, target)
         sys.exit(1)
 
-    batch_size = 100
-    for i in range(0, len(points), batch_size):
-        batch = points[i : i + batch_size]
-        client.upsert(collection_name=COLLECTION_NAME, points=batch)
-    print(f"Восстановлено {len(points)} точек в коллекции {COLLECTION_NAME!r}.")
+    count = qdrant_versions.wait_for_count(client, target, total)
+    if count != total:
+        qdrant_versions.drop_version(client, target)
+        print(f"В {target} {count} точек вместо {total}; алиас не переключён.", file=sys.stderr)
+        sys.exit(1)
+    if args.smoke:
+        from check_relevance import smoke_test
+        from fastembed import TextEmbedding
+
+        passed, n_checks, failed = smoke_test(TextEmbedding(model_name=EMBEDDING_MODEL), client, target)
+        print(f"Smoke-тест: {passed}/{n_checks}" + (f", не прошли: {', '.join(failed)}" if failed else ""))
+        if n_checks and passed / n_checks < args.min_pass:
+            qdrant_versions.drop_version(client, target)
+            print(f"Smoke-тест ниже {args.min_pass:.0%}; алиас не переключён.", file=sys.stderr)
+            sys.exit(1)
+
+    qdrant_versions.switch_alias(client, COLLECTION_NAME, target)
+    removed = qdrant_versions.gc_versions(client, COLLECTION_NAME, keep=args.keep)
+    print(f"Восстановлено {total} точек в {target}; алиас {COLLECTION_NAME!r} → {target}.")
+    if removed:
+        print(f"Удалены старые версии: {', '.join(removed)}")
 
 
 if __name__ == "__main__":